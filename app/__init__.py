@@ -132,6 +132,14 @@ def register_blueprints(app):
     from app.routes.settings import bp as settings_bp
     app.register_blueprint(settings_bp)
 
+    # Live event stream
+    from app.routes.events import bp as events_bp
+    app.register_blueprint(events_bp)
+
+    # Provider webhooks
+    from app.routes.webhooks import bp as webhooks_bp
+    app.register_blueprint(webhooks_bp)
+
 def configure_logging(app):
     """Configure application logging."""
     if not app.debug and not app.testing:
@@ -5,9 +5,21 @@ from app import db
 # Import models here so they are registered with SQLAlchemy
 from app.models.user import User
 from app.models.contact import Contact
-from app.models.message import Message
+from app.models.message import Message, MessageEvent
 from app.models.api_credential import ApiCredential
 
 # Import WhatsApp models
 from app.models.whatsapp_session import WhatsAppSession, WhatsAppDevice
-from app.models.message_queue import MessageTemplate, MessageQueue, MessageStatus
\ No newline at end of file
+from app.models.message_queue import MessageTemplate, MessageQueue, MessageStatus
+
+# Import campaign models
+from app.models.campaign import Campaign, CampaignRecipient
+
+# Import bulk job models
+from app.models.bulk_job import BulkJobResult
+
+# Import idempotency models
+from app.models.idempotency_key import IdempotencyKey
+
+# Import suppression models
+from app.models.suppression import SuppressedRecipient
@@ -0,0 +1,86 @@
+"""Model for per-recipient outcomes of bulk send jobs."""
+
+from datetime import datetime
+from app import db
+
+class BulkJobResult(db.Model):
+    """Model for storing the outcome of each recipient of a bulk job.
+
+    Bulk tasks only return counters; the per-recipient detail lives here and
+    is read page by page on demand.
+    """
+
+    __tablename__ = 'bulk_job_results'
+
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.String(64), nullable=False)  # Celery task ID of the bulk job
+    recipient = db.Column(db.String(64), nullable=True)
+    status = db.Column(db.String(32), nullable=False)
+    message_id = db.Column(db.Integer, nullable=True)  # Local message ID, if one was stored
+    external_id = db.Column(db.String(64), nullable=True)  # ID from external service
+    error_message = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # Details are paged per job in ID order
+    __table_args__ = (
+        db.Index('ix_bulk_job_results_job_id_id', 'job_id', 'id'),
+    )
+
+    def __repr__(self):
+        return f'<BulkJobResult {self.job_id}:{self.recipient}:{self.status}>'
+
+    def to_dict(self):
+        """Convert result to dictionary for API responses."""
+        return {
+            'id': self.id,
+            'recipient': self.recipient,
+            'status': self.status,
+            'message_id': self.message_id,
+            'external_id': self.external_id,
+            'error': self.error_message,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+    @classmethod
+    def record(cls, job_id, details):
+        """Store the outcomes of a batch of recipients in one bulk insert.
+
+        Args:
+            job_id: The bulk job ID
+            details: List of dictionaries with recipient, status, message_id,
+                external_id and error keys
+        """
+        if not details:
+            return
+
+        now = datetime.utcnow()
+        db.session.bulk_insert_mappings(cls, [{
+            'job_id': job_id,
+            'recipient': detail.get('recipient'),
+            'status': detail.get('status') or 'unknown',
+            'message_id': detail.get('message_id'),
+            'external_id': detail.get('external_id'),
+            'error_message': detail.get('error'),
+            'created_at': now
+        } for detail in details])
+        db.session.commit()
+
+    @classmethod
+    def get_page(cls, job_id, after_id=0, limit=100, status=None):
+        """Get a page of outcomes for a job using keyset pagination.
+
+        Args:
+            job_id: The bulk job ID
+            after_id: Return results with an ID greater than this value
+            limit: Maximum number of results to return
+            status: Optional status to filter by
+
+        Returns:
+            List of BulkJobResult instances
+        """
+        query = cls.query.filter(cls.job_id == job_id, cls.id > after_id)
+
+        if status:
+            query = query.filter(cls.status == status)
+
+        return query.order_by(cls.id).limit(limit).all()
@@ -0,0 +1,185 @@
+"""Models for bulk messaging campaigns."""
+
+from datetime import datetime
+from sqlalchemy import literal, func
+from app import db
+from app.models.contact import Contact
+from app.models.suppression import SuppressedRecipient, suppression_key_sql
+
+class Campaign(db.Model):
+    """Model for storing bulk messaging campaigns."""
+
+    __tablename__ = 'campaigns'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(128), nullable=False)
+    platform = db.Column(db.String(20), nullable=False, default='whatsapp')
+    message = db.Column(db.Text, nullable=True)
+    media_url = db.Column(db.String(512), nullable=True)
+    # Rendered per recipient from the contact's fields instead of ``message``
+    template_id = db.Column(db.Integer, db.ForeignKey('message_templates.id'), nullable=True)
+    status = db.Column(db.String(32), default='draft', index=True)  # draft, running, pausing, paused, completed, cancelled
+    total_recipients = db.Column(db.Integer, default=0)
+    task_id = db.Column(db.String(64), nullable=True)  # Celery task currently sending the campaign
+    created_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    completed_at = db.Column(db.DateTime, nullable=True)
+
+    # Relationship with recipients
+    recipients = db.relationship('CampaignRecipient', back_populates='campaign',
+                                 cascade='all, delete-orphan', lazy='dynamic')
+
+    def __repr__(self):
+        return f'<Campaign {self.id}:{self.name}:{self.status}>'
+
+    def to_dict(self):
+        """Convert campaign to dictionary for API responses."""
+        return {
+            'id': self.id,
+            'name': self.name,
+            'platform': self.platform,
+            'message': self.message,
+            'media_url': self.media_url,
+            'template_id': self.template_id,
+            'status': self.status,
+            'total_recipients': self.total_recipients,
+            'task_id': self.task_id,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None,
+            'recipient_stats': self.get_recipient_stats()
+        }
+
+    def materialize_recipients(self, groups=None, contact_ids=None):
+        """Copy matching contacts into the campaign's recipient table.
+
+        The copy is a single INSERT ... SELECT executed by the database, so no
+        contact rows are loaded into Python regardless of the list size.
+        Contacts sharing a phone number are copied once, and suppressed
+        numbers are left out.
+
+        Args:
+            groups: Optional list of contact group names to include
+            contact_ids: Optional list of contact IDs to include
+
+        Returns:
+            Number of recipients in the campaign
+        """
+        phone_key = suppression_key_sql(Contact.phone)
+
+        select = db.select(
+            literal(self.id),
+            func.min(Contact.id),
+            func.min(Contact.phone),
+            literal('pending'),
+            literal(datetime.utcnow())
+        ).where(
+            ~db.exists().where(SuppressedRecipient.recipient == phone_key)
+        ).group_by(phone_key)
+
+        conditions = []
+        if groups:
+            conditions.append(Contact.group.in_(groups))
+        if contact_ids:
+            conditions.append(Contact.id.in_(contact_ids))
+        if conditions:
+            select = select.where(db.or_(*conditions))
+
+        db.session.execute(
+            CampaignRecipient.__table__.insert().from_select(
+                ['campaign_id', 'contact_id', 'recipient', 'status', 'created_at'],
+                select
+            )
+        )
+
+        self.total_recipients = self.recipients.count()
+        db.session.commit()
+
+        return self.total_recipients
+
+    def get_recipient_stats(self):
+        """Get recipient counts grouped by status.
+
+        Returns:
+            Dictionary mapping status to number of recipients
+        """
+        rows = db.session.query(
+            CampaignRecipient.status, func.count(CampaignRecipient.id)
+        ).filter_by(campaign_id=self.id).group_by(CampaignRecipient.status).all()
+
+        return {status: count for status, count in rows}
+
+
+class CampaignRecipient(db.Model):
+    """Model for storing the materialized recipient list of a campaign."""
+
+    __tablename__ = 'campaign_recipients'
+
+    id = db.Column(db.Integer, primary_key=True)
+    campaign_id = db.Column(db.Integer, db.ForeignKey('campaigns.id'), nullable=False)
+    contact_id = db.Column(db.Integer, db.ForeignKey('contacts.id'), nullable=True)
+    recipient = db.Column(db.String(64), nullable=False)  # Phone number or chat ID
+    status = db.Column(db.String(32), default='pending')  # pending, sent, failed, suppressed, delivered, read
+    external_id = db.Column(db.String(64), nullable=True, index=True)  # ID from external service
+    error_message = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+
+    # Workers page through a campaign by status and id range
+    __table_args__ = (
+        db.Index('ix_campaign_recipients_campaign_status_id', 'campaign_id', 'status', 'id'),
+    )
+
+    # Relationship with campaign
+    campaign = db.relationship('Campaign', back_populates='recipients')
+
+    def __repr__(self):
+        return f'<CampaignRecipient {self.campaign_id}:{self.recipient}:{self.status}>'
+
+    def to_dict(self):
+        """Convert recipient to dictionary for API responses."""
+        return {
+            'id': self.id,
+            'campaign_id': self.campaign_id,
+            'contact_id': self.contact_id,
+            'recipient': self.recipient,
+            'status': self.status,
+            'external_id': self.external_id,
+            'error_message': self.error_message,
+            'sent_at': self.sent_at.isoformat() if self.sent_at else None
+        }
+
+    @classmethod
+    def get_pending_id_range(cls, campaign_id):
+        """Get the lowest and highest ID of the pending recipients of a campaign.
+
+        Args:
+            campaign_id: The campaign ID
+
+        Returns:
+            Tuple of (min_id, max_id), both None if nothing is pending
+        """
+        return db.session.query(
+            func.min(cls.id), func.max(cls.id)
+        ).filter_by(campaign_id=campaign_id, status='pending').one()
+
+    @classmethod
+    def get_pending_page(cls, campaign_id, start_id, end_id):
+        """Get the pending recipients of a campaign within an ID range.
+
+        Args:
+            campaign_id: The campaign ID
+            start_id: First recipient ID of the page (inclusive)
+            end_id: Last recipient ID of the page (inclusive)
+
+        Returns:
+            List of CampaignRecipient instances
+        """
+        return cls.query.filter(
+            cls.campaign_id == campaign_id,
+            cls.status == 'pending',
+            cls.id.between(start_id, end_id)
+        ).order_by(cls.id).all()
@@ -0,0 +1,50 @@
+"""Model for stored responses of idempotent API requests."""
+
+from datetime import datetime
+from app import db
+
+class IdempotencyKey(db.Model):
+    """Model for storing the response to a request made with an Idempotency-Key header.
+
+    A client that repeats a request with the same key gets the stored
+    response instead of the request being carried out again.
+    """
+
+    __tablename__ = 'idempotency_keys'
+
+    id = db.Column(db.Integer, primary_key=True)
+    scope = db.Column(db.String(128), nullable=False)  # Endpoint and user the key belongs to
+    key = db.Column(db.String(128), nullable=False)
+    request_hash = db.Column(db.String(64), nullable=False)  # SHA-256 of the request body
+    status = db.Column(db.String(32), nullable=False, default='processing')  # processing, completed
+    response_code = db.Column(db.Integer, nullable=True)
+    response_body = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    # While processing, another request may take the key over after this time
+    locked_until = db.Column(db.DateTime, nullable=True)
+
+    # A key can be used once per scope; the unique index is what makes
+    # concurrent duplicates lose the race
+    __table_args__ = (
+        db.UniqueConstraint('scope', 'key', name='uq_idempotency_keys_scope_key'),
+    )
+
+    @classmethod
+    def delete_expired(cls, now=None):
+        """Delete keys past their expiry time.
+
+        Args:
+            now: Current time (defaults to utcnow)
+
+        Returns:
+            Number of keys deleted
+        """
+        deleted = cls.query.filter(cls.expires_at <= (now or datetime.utcnow())).delete(
+            synchronize_session=False
+        )
+        db.session.commit()
+        return deleted
+
+    def __repr__(self):
+        return f'<IdempotencyKey {self.scope}:{self.key}:{self.status}>'
@@ -4,7 +4,12 @@ from datetime import datetime
 from app import db
 
 class Message(db.Model):
-    """Message model for storing message history."""
+    """Message model for storing message history.
+    
+    This is the ledger of every message sent, whatever path sent it: direct
+    sends, bulk jobs, campaigns and the WhatsApp queue. Each send writes one
+    row; later status changes update the row and append a ``MessageEvent``.
+    """
     
     __tablename__ = 'messages'
     
@@ -13,10 +18,100 @@ class Message(db.Model):
     recipient = db.Column(db.String(64), nullable=False, index=True)
     message_text = db.Column(db.Text, nullable=False)
     media_url = db.Column(db.String(255))
-    status = db.Column(db.String(20), default='pending')
-    external_id = db.Column(db.String(64))  # ID from external service
+    status = db.Column(db.String(20), default='pending')  # pending, queued, sent, failed, delivered, read
+    external_id = db.Column(db.String(64), index=True)  # ID from external service
+    error_message = db.Column(db.Text, nullable=True)
+    session_id = db.Column(db.String(64), nullable=True)  # WhatsApp session that sent the message
+    campaign_id = db.Column(db.Integer, db.ForeignKey('campaigns.id'), nullable=True)
+    job_id = db.Column(db.String(64), nullable=True, index=True)  # Bulk job or campaign task ID
+    queue_id = db.Column(db.Integer, db.ForeignKey('message_queue.id'), nullable=True, index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     sent_at = db.Column(db.DateTime)
     
+    # Dashboards count messages by status over a time range
+    __table_args__ = (
+        db.Index('ix_messages_status_created_at', 'status', 'created_at'),
+    )
+    
     def __repr__(self):
-        return f'<Message {self.id}: {self.platform} to {self.recipient}'
\ No newline at end of file
+        return f'<Message {self.id}: {self.platform} to {self.recipient}'
+    
+    def to_dict(self):
+        """Convert message to dictionary for API responses."""
+        return {
+            'id': self.id,
+            'platform': self.platform,
+            'recipient': self.recipient,
+            'message': self.message_text,
+            'media_url': self.media_url,
+            'status': self.status,
+            'external_id': self.external_id,
+            'error': self.error_message,
+            'session_id': self.session_id,
+            'campaign_id': self.campaign_id,
+            'job_id': self.job_id,
+            'queue_id': self.queue_id,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+            'sent_at': self.sent_at.isoformat() if self.sent_at else None
+        }
+    
+    @classmethod
+    def from_result(cls, platform, recipient, message_text, media_url, result, **links):
+        """Build the ledger row for a send result.
+        
+        Args:
+            platform: The messaging platform
+            recipient: The recipient the message was sent to
+            message_text: The message text
+            media_url: The media URL, if any
+            result: The result returned by the sending service
+            **links: Optional session_id, campaign_id, job_id and queue_id
+        
+        Returns:
+            Unsaved Message instance
+        """
+        status = result.get('status') or 'unknown'
+        if status == 'success':
+            status = 'sent'
+        
+        now = datetime.utcnow()
+        return cls(
+            platform=platform,
+            recipient=recipient,
+            message_text=message_text or '',
+            media_url=media_url,
+            status=status,
+            external_id=result.get('message_sid') or result.get('message_id'),
+            error_message=result.get('error'),
+            sent_at=now if status in ('queued', 'sent') else None,
+            created_at=now,
+            updated_at=now,
+            **links
+        )
+
+
+class MessageEvent(db.Model):
+    """Status change of a message after it was sent, such as a delivery receipt."""
+    
+    __tablename__ = 'message_events'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    message_id = db.Column(db.Integer, db.ForeignKey('messages.id'), nullable=False, index=True)
+    status = db.Column(db.String(20), nullable=False)
+    error_message = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<MessageEvent {self.message_id}:{self.status}>'
+    
+    def to_dict(self):
+        """Convert event to dictionary for API responses."""
+        return {
+            'id': self.id,
+            'message_id': self.message_id,
+            'status': self.status,
+            'error': self.error_message,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
@@ -1,7 +1,11 @@
 """Models for message queue and templates."""
 
-from datetime import datetime
+from datetime import datetime, timedelta
 from app import db
+from app.services.retry_policy import retry_delay
+
+# Number of flows counted per query
+FLOW_QUERY_SIZE = 100
 
 class MessageTemplate(db.Model):
     """Model for storing message templates."""
@@ -39,6 +43,8 @@ class MessageQueue(db.Model):
     
     id = db.Column(db.Integer, primary_key=True)
     session_id = db.Column(db.Integer, db.ForeignKey('whatsapp_sessions.id'), nullable=False)
+    owner_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)  # User who queued the message
+    campaign_id = db.Column(db.Integer, db.ForeignKey('campaigns.id'), nullable=True)  # None for single sends
     recipient = db.Column(db.String(32), nullable=False)  # Phone number
     message = db.Column(db.Text, nullable=True)
     media_url = db.Column(db.String(512), nullable=True)
@@ -47,12 +53,23 @@ class MessageQueue(db.Model):
     retry_count = db.Column(db.Integer, default=0)
     max_retries = db.Column(db.Integer, default=3)
     scheduled_at = db.Column(db.DateTime, nullable=True)  # For scheduled messages
+    next_attempt_at = db.Column(db.DateTime, nullable=True)  # Earliest time of the next retry
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationship with session
     session = db.relationship('WhatsAppSession', back_populates='message_queue')
     
+    # Pending messages are polled by status and retry time; the scheduler
+    # reads upcoming messages by status and scheduled time; the fair queue
+    # reads each owner's and campaign's messages in order
+    __table_args__ = (
+        db.Index('ix_message_queue_status_next_attempt_at', 'status', 'next_attempt_at'),
+        db.Index('ix_message_queue_status_scheduled_at', 'status', 'scheduled_at', 'id'),
+        db.Index('ix_message_queue_flow', 'session_id', 'status', 'priority', 'owner_id',
+                 'campaign_id', 'created_at'),
+    )
+    
     # Relationship with message status
     status_updates = db.relationship('MessageStatus', back_populates='message', cascade='all, delete-orphan')
     
@@ -64,6 +81,8 @@ class MessageQueue(db.Model):
         return {
             'id': self.id,
             'session_id': self.session_id,
+            'owner_id': self.owner_id,
+            'campaign_id': self.campaign_id,
             'recipient': self.recipient,
             'message': self.message,
             'media_url': self.media_url,
@@ -72,10 +91,33 @@ class MessageQueue(db.Model):
             'retry_count': self.retry_count,
             'max_retries': self.max_retries,
             'scheduled_at': self.scheduled_at.isoformat() if self.scheduled_at else None,
+            'next_attempt_at': self.next_attempt_at.isoformat() if self.next_attempt_at else None,
             'created_at': self.created_at.isoformat(),
             'updated_at': self.updated_at.isoformat()
         }
     
+    def schedule_retry(self, result=None):
+        """Record a failed attempt and schedule the next one.
+        
+        The failure is classified (transient, rate limit or permanent) and the
+        matching retry policy decides the delay. The message goes back to
+        pending with ``next_attempt_at`` set, or is marked failed when the
+        error is permanent or its retries are used up.
+        
+        Args:
+            result: The failed send result or an error message
+        """
+        self.retry_count = (self.retry_count or 0) + 1
+        
+        delay = retry_delay(result, self.retry_count, self.max_retries)
+        
+        if delay is None:
+            self.status = 'failed'
+            self.next_attempt_at = None
+        else:
+            self.status = 'pending'
+            self.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+    
     @classmethod
     def get_pending_messages(cls, session_id=None, limit=50):
         """Get pending messages for processing.
@@ -98,21 +140,259 @@ class MessageQueue(db.Model):
             (cls.scheduled_at.is_(None)) | (cls.scheduled_at <= now)
         )
         
+        # Skip messages whose retry is not due yet
+        query = query.filter(
+            (cls.next_attempt_at.is_(None)) | (cls.next_attempt_at <= now)
+        )
+        
         # Order by priority (highest first) and then by creation date (oldest first)
         query = query.order_by(cls.priority.desc(), cls.created_at.asc())
         
         return query.limit(limit).all()
+    
+    @classmethod
+    def _due(cls, session_id):
+        """Query pending messages of a session that are due now."""
+        now = datetime.utcnow()
+        return cls.query.filter(
+            cls.session_id == session_id,
+            cls.status == 'pending',
+            (cls.next_attempt_at.is_(None)) | (cls.next_attempt_at <= now),
+            (cls.scheduled_at.is_(None)) | (cls.scheduled_at <= now)
+        )
+    
+    @classmethod
+    def _flow_filter(cls, priority, owner_id, campaign_id):
+        """Filter messages of one priority, owner and campaign."""
+        return (
+            cls.priority.is_(None) if priority is None else cls.priority == priority,
+            cls.owner_id.is_(None) if owner_id is None else cls.owner_id == owner_id,
+            cls.campaign_id.is_(None) if campaign_id is None else cls.campaign_id == campaign_id
+        )
+    
+    @classmethod
+    def count_due(cls, session_id, cap):
+        """Count the pending messages of a session that are due now, up to a cap.
+        
+        Reads at most ``cap`` rows, however long the queue is.
+        
+        Args:
+            session_id: The session ID
+            cap: Maximum count returned
+            
+        Returns:
+            Number of due messages, at most ``cap``
+        """
+        due = cls._due(session_id).with_entities(cls.id).limit(cap).subquery()
+        return db.session.query(db.func.count()).select_from(due).scalar()
+    
+    @classmethod
+    def get_flows(cls, session_id):
+        """Get every priority, owner and campaign with pending messages.
+        
+        Args:
+            session_id: The session ID
+            
+        Returns:
+            List of (priority, owner_id, campaign_id) tuples
+        """
+        return db.session.query(cls.priority, cls.owner_id, cls.campaign_id).filter(
+            cls.session_id == session_id,
+            cls.status == 'pending'
+        ).distinct().all()
+    
+    @classmethod
+    def count_due_flows(cls, session_id, flows, cap):
+        """Count the due messages of each priority, owner and campaign, up to a cap.
+        
+        Every count reads at most ``cap`` rows from the flow index, and the
+        counts are fetched together in one query per ``FLOW_QUERY_SIZE`` flows.
+        
+        Args:
+            session_id: The session ID
+            flows: List of (priority, owner_id, campaign_id) tuples
+            cap: Maximum count returned per flow
+            
+        Returns:
+            List of counts in the order of ``flows``
+        """
+        counts = []
+        for start in range(0, len(flows), FLOW_QUERY_SIZE):
+            columns = [
+                db.select(db.func.count()).select_from(
+                    cls._due(session_id).filter(*cls._flow_filter(*flow))
+                    .with_entities(cls.id).limit(cap).subquery()
+                ).scalar_subquery()
+                for flow in flows[start:start + FLOW_QUERY_SIZE]
+            ]
+            counts.extend(db.session.query(*columns).one())
+        return counts
+    
+    @classmethod
+    def get_unfinished_flows(cls, session_id, flows):
+        """Check which flows still have messages waiting or being sent.
+        
+        Args:
+            session_id: The session ID
+            flows: List of (priority, owner_id, campaign_id) tuples
+            
+        Returns:
+            List of the flows with pending or processing messages
+        """
+        unfinished = []
+        for start in range(0, len(flows), FLOW_QUERY_SIZE):
+            chunk = flows[start:start + FLOW_QUERY_SIZE]
+            columns = [
+                cls.query.filter(
+                    cls.session_id == session_id,
+                    cls.status.in_(('pending', 'processing')),
+                    *cls._flow_filter(*flow)
+                ).exists()
+                for flow in chunk
+            ]
+            found = db.session.query(*columns).one()
+            unfinished.extend(flow for flow, exists in zip(chunk, found) if exists)
+        return unfinished
+    
+    @classmethod
+    def get_flow_messages(cls, session_id, priority, owner_id, campaign_id, limit):
+        """Get the oldest due messages of one priority, owner and campaign.
+        
+        Args:
+            session_id: The session ID
+            priority: Message priority
+            owner_id: The owner's user ID (None for messages without an owner)
+            campaign_id: The campaign ID (None for single sends)
+            limit: Maximum number of messages to return
+            
+        Returns:
+            List of MessageQueue instances, oldest first
+        """
+        return cls._due(session_id).filter(
+            *cls._flow_filter(priority, owner_id, campaign_id)
+        ).order_by(cls.created_at.asc(), cls.id.asc()).limit(limit).all()
+    
+    @classmethod
+    def claim(cls, queue_id):
+        """Atomically move a pending message to processing.
+        
+        The conditional update succeeds for exactly one caller, so a message
+        picked up by several workers is only sent once.
+        
+        Args:
+            queue_id: The queue item ID
+            
+        Returns:
+            True if this caller claimed the message
+        """
+        claimed = cls.query.filter_by(id=queue_id, status='pending').update(
+            {'status': 'processing', 'updated_at': datetime.utcnow()},
+            synchronize_session=False
+        )
+        db.session.commit()
+        return claimed == 1
+    
+    @classmethod
+    def release_stale_claims(cls, older_than):
+        """Return messages left in processing by a worker that died.
+        
+        A message claimed before ``older_than`` and never finished counts as a
+        failed attempt: it goes back to pending, due now, or is marked failed
+        when its retries are used up, so a message that keeps killing its
+        worker is not picked up forever.
+        
+        Args:
+            older_than: Messages claimed before this time are released
+            
+        Returns:
+            Dictionary with the number of messages released and failed
+        """
+        now = datetime.utcnow()
+        stale = cls.query.filter(cls.status == 'processing', cls.updated_at < older_than)
+        
+        failed = stale.filter(cls.retry_count + 1 >= cls.max_retries).update(
+            {'status': 'failed', 'retry_count': cls.retry_count + 1,
+             'next_attempt_at': None, 'updated_at': now},
+            synchronize_session=False
+        )
+        released = stale.update(
+            {'status': 'pending', 'retry_count': cls.retry_count + 1,
+             'next_attempt_at': now, 'updated_at': now},
+            synchronize_session=False
+        )
+        db.session.commit()
+        return {'released': released, 'failed': failed}
+    
+    @classmethod
+    def get_scheduled_window(cls, until, after=None, after_id=None, limit=1000):
+        """Get pending scheduled messages in a time window, in scheduled order.
+        
+        Reads only the window from the (status, scheduled_at, id) index and
+        returns (id, scheduled_at) pairs. Pass the last row returned as
+        ``after`` and ``after_id`` to continue a window larger than ``limit``.
+        
+        Args:
+            until: Latest scheduled time to include
+            after: Only include messages scheduled after this time
+            after_id: Also include messages scheduled exactly at ``after``
+                with a higher ID
+            limit: Maximum number of rows to return
+            
+        Returns:
+            List of (id, scheduled_at) tuples
+        """
+        query = db.session.query(cls.id, cls.scheduled_at).filter(
+            cls.status == 'pending',
+            cls.scheduled_at <= until
+        )
+        
+        if after is None:
+            query = query.filter(cls.scheduled_at.isnot(None))
+        elif after_id is None:
+            query = query.filter(cls.scheduled_at > after)
+        else:
+            query = query.filter(
+                (cls.scheduled_at > after) | ((cls.scheduled_at == after) & (cls.id > after_id))
+            )
+        
+        return query.order_by(cls.scheduled_at, cls.id).limit(limit).all()
+    
+    @classmethod
+    def get_new_scheduled(cls, after_id, until, limit=1000):
+        """Get scheduled messages added since the last check.
+        
+        Catches messages queued with a time that falls inside a window the
+        scheduler has already read. Uses the primary key range only.
+        
+        Args:
+            after_id: Only include messages with a higher ID
+            until: Latest scheduled time to include
+            limit: Maximum number of rows to return
+            
+        Returns:
+            List of (id, scheduled_at) tuples in ID order
+        """
+        return db.session.query(cls.id, cls.scheduled_at).filter(
+            cls.id > after_id,
+            cls.status == 'pending',
+            cls.scheduled_at.isnot(None),
+            cls.scheduled_at <= until
+        ).order_by(cls.id).limit(limit).all()
 
 
 class MessageStatus(db.Model):
-    """Model for storing message status updates."""
+    """Model for storing message status updates.
+    
+    Status updates of queued messages sent before the message ledger; new
+    sends are recorded as ``Message`` rows with ``MessageEvent`` updates.
+    """
     
     __tablename__ = 'message_status'
     
     id = db.Column(db.Integer, primary_key=True)
     message_id = db.Column(db.Integer, db.ForeignKey('message_queue.id'), nullable=False)
     status = db.Column(db.String(32), nullable=False)  # pending, sent, delivered, read, failed
-    external_id = db.Column(db.String(64), nullable=True)  # ID from WhatsApp
+    external_id = db.Column(db.String(64), nullable=True, index=True)  # ID from WhatsApp
     error_message = db.Column(db.Text, nullable=True)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     
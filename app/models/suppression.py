@@ -0,0 +1,134 @@
+"""Model for recipients that must not be messaged."""
+
+import re
+from datetime import datetime
+from sqlalchemy import func
+from app import db
+
+# Characters people put in phone numbers that do not change the number
+_FORMATTING = re.compile(r'[\s+\-().]')
+_WHATSAPP_SUFFIX = re.compile(r'@(c|s)\.(us|whatsapp\.net)$')
+
+
+def suppression_key(recipient):
+    """Normalize a recipient so that differently formatted numbers match.
+
+    Args:
+        recipient: Phone number or chat ID
+
+    Returns:
+        The recipient without formatting characters or WhatsApp chat suffix
+    """
+    return _FORMATTING.sub('', _WHATSAPP_SUFFIX.sub('', str(recipient or '').strip().lower()))
+
+
+def suppression_key_sql(column):
+    """Build the SQL expression matching ``suppression_key`` for a phone column.
+
+    Only the formatting characters are stripped, which covers how contacts
+    are stored; senders also check the in-memory snapshot before sending.
+
+    Args:
+        column: Column or expression holding phone numbers
+
+    Returns:
+        SQL expression with the normalized recipient
+    """
+    expression = func.lower(func.trim(column))
+    for character in ' +-().':
+        expression = func.replace(expression, character, '')
+    return expression
+
+
+class SuppressedRecipient(db.Model):
+    """Model for storing opted-out and blocked recipients.
+
+    Recipients are stored normalized with ``suppression_key``; the unique
+    index keeps one row per recipient.
+    """
+
+    __tablename__ = 'suppressed_recipients'
+
+    id = db.Column(db.Integer, primary_key=True)
+    recipient = db.Column(db.String(64), nullable=False, unique=True)
+    reason = db.Column(db.String(32), nullable=False, default='opt_out')  # opt_out, bounced, complaint, manual
+    source = db.Column(db.String(64), nullable=True)  # Where the suppression came from, e.g. api, import, webhook
+    created_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<SuppressedRecipient {self.recipient}:{self.reason}>'
+
+    def to_dict(self):
+        """Convert suppression to dictionary for API responses."""
+        return {
+            'id': self.id,
+            'recipient': self.recipient,
+            'reason': self.reason,
+            'source': self.source,
+            'created_by': self.created_by,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+    @classmethod
+    def add(cls, recipients, reason='opt_out', source=None, created_by=None):
+        """Suppress recipients, skipping those already suppressed.
+
+        Args:
+            recipients: Phone numbers or chat IDs
+            reason: Why the recipients are suppressed
+            source: Where the suppression came from
+            created_by: ID of the user adding the suppression
+
+        Returns:
+            Number of recipients newly suppressed
+        """
+        keys = {suppression_key(recipient) for recipient in recipients}
+        keys.discard('')
+        if not keys:
+            return 0
+
+        existing = set()
+        key_list = list(keys)
+        for start in range(0, len(key_list), 500):
+            existing.update(row[0] for row in db.session.query(cls.recipient).filter(
+                cls.recipient.in_(key_list[start:start + 500])))
+
+        now = datetime.utcnow()
+        db.session.bulk_insert_mappings(cls, [{
+            'recipient': key,
+            'reason': reason,
+            'source': source,
+            'created_by': created_by,
+            'created_at': now
+        } for key in keys - existing])
+        db.session.commit()
+
+        return len(keys - existing)
+
+    @classmethod
+    def remove(cls, recipient):
+        """Lift the suppression of a recipient.
+
+        Args:
+            recipient: Phone number or chat ID
+
+        Returns:
+            True if the recipient was suppressed
+        """
+        removed = cls.query.filter_by(recipient=suppression_key(recipient)).delete()
+        db.session.commit()
+        return bool(removed)
+
+    @classmethod
+    def get_page(cls, after_id=0, limit=100):
+        """Get a page of suppressions using keyset pagination.
+
+        Args:
+            after_id: Return suppressions with an ID greater than this value
+            limit: Maximum number of suppressions to return
+
+        Returns:
+            List of SuppressedRecipient instances
+        """
+        return cls.query.filter(cls.id > after_id).order_by(cls.id).limit(limit).all()
@@ -18,6 +18,7 @@ class WhatsAppSession(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     is_active = db.Column(db.Boolean, default=True)
+    rate_per_minute = db.Column(db.Integer, nullable=True)  # Queue send budget, uses config default if not set
     
     # Relationship with devices
     devices = db.relationship('WhatsAppDevice', back_populates='session', cascade='all, delete-orphan')
@@ -39,6 +40,7 @@ class WhatsAppSession(db.Model):
             'created_at': self.created_at.isoformat(),
             'updated_at': self.updated_at.isoformat(),
             'is_active': self.is_active,
+            'rate_per_minute': self.rate_per_minute,
             'has_qr': bool(self.qr_code)
         }
     
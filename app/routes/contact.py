@@ -6,7 +6,9 @@ import xml.etree.ElementTree as ET
 from flask import Blueprint, request, jsonify, render_template, current_app, session, redirect, url_for
 from flask_login import login_required, current_user
 from app.models.contact import Contact
+from app.models.suppression import SuppressedRecipient
 from app.models.user import User
+from app.services.suppression import invalidate_suppression_snapshots
 from app import db
 
 bp = Blueprint('contact', __name__)
@@ -467,4 +469,77 @@ def api_delete_group():
         
     except Exception as e:
         current_app.logger.error(f"Error deleting group: {str(e)}")
-        return jsonify({'success': False, 'error': str(e)}), 500
\ No newline at end of file
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@bp.route('/api/suppressions', methods=['GET'])
+@login_required
+def api_list_suppressions():
+    """API endpoint to list suppressed recipients.
+    
+    Query parameters:
+        after_id: Return suppressions with an ID greater than this value
+        limit: Maximum number of suppressions to return (max 1000)
+    """
+    try:
+        after_id = request.args.get('after_id', 0, type=int)
+        limit = min(request.args.get('limit', 100, type=int), 1000)
+        
+        rows = SuppressedRecipient.get_page(after_id=after_id, limit=limit)
+        
+        return jsonify({
+            'success': True,
+            'suppressions': [row.to_dict() for row in rows],
+            'next_after_id': rows[-1].id if len(rows) == limit else None
+        })
+        
+    except Exception as e:
+        current_app.logger.error(f"Error listing suppressions: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@bp.route('/api/suppressions', methods=['POST'])
+@login_required
+def api_add_suppressions():
+    """API endpoint to suppress recipients.
+    
+    Expects ``recipients`` (a list of phone numbers or chat IDs) and an
+    optional ``reason``. Suppressed recipients are dropped from bulk jobs
+    and campaigns.
+    """
+    try:
+        data = request.get_json() or {}
+        recipients = data.get('recipients')
+        
+        if not recipients or not isinstance(recipients, list):
+            return jsonify({'success': False, 'error': 'A list of recipients is required'}), 400
+        
+        added = SuppressedRecipient.add(
+            recipients,
+            reason=data.get('reason') or 'manual',
+            source=data.get('source') or 'api',
+            created_by=current_user.id
+        )
+        
+        return jsonify({'success': True, 'added': added})
+        
+    except Exception as e:
+        current_app.logger.error(f"Error adding suppressions: {str(e)}")
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@bp.route('/api/suppressions/<path:recipient>', methods=['DELETE'])
+@login_required
+def api_remove_suppression(recipient):
+    """API endpoint to lift the suppression of a recipient."""
+    try:
+        if not SuppressedRecipient.remove(recipient):
+            return jsonify({'success': False, 'error': 'Recipient is not suppressed'}), 404
+        
+        # Workers reload their copy of the list on their next refresh
+        invalidate_suppression_snapshots()
+        
+        return jsonify({'success': True})
+        
+    except Exception as e:
+        current_app.logger.error(f"Error removing suppression: {str(e)}")
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
@@ -0,0 +1,63 @@
+"""Server-Sent Events routes for live dashboard updates."""
+
+from flask import Blueprint, Response, request, stream_with_context
+from flask_login import login_required
+
+from app.services.events import (
+    SESSIONS_CHANNEL, DELIVERIES_CHANNEL, job_channel, stream_events, format_sse
+)
+from app.services.job_progress import JobProgress
+
+# Create blueprint
+bp = Blueprint('events', __name__, url_prefix='/events')
+
+@bp.route('/stream', methods=['GET'])
+@login_required
+def stream():
+    """Stream job progress, session status and delivery events.
+
+    Query parameters:
+        job: Bulk job ID to follow (may be repeated)
+        sessions: Set to 1 to receive session status changes
+        deliveries: Set to 1 to receive message delivery updates
+
+    Without any parameters the stream carries session and delivery events.
+    Each open stream holds one long-lived request, so the app should be served
+    by a threaded or async worker class.
+
+    Returns:
+        text/event-stream response
+    """
+    job_ids = request.args.getlist('job')
+    want_sessions = request.args.get('sessions') == '1'
+    want_deliveries = request.args.get('deliveries') == '1'
+
+    if not job_ids and not want_sessions and not want_deliveries:
+        want_sessions = want_deliveries = True
+
+    channels = [job_channel(job_id) for job_id in job_ids]
+    if want_sessions:
+        channels.append(SESSIONS_CHANNEL)
+    if want_deliveries:
+        channels.append(DELIVERIES_CHANNEL)
+
+    # Send the current progress first so clients don't wait for the next flush
+    initial = []
+    for job_id in job_ids:
+        progress = JobProgress(job_id).snapshot()
+        if progress:
+            initial.append(format_sse('progress', dict(progress, job_id=job_id)))
+
+    def generate():
+        for message in initial:
+            yield message
+        yield from stream_events(channels)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
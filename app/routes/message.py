@@ -1,11 +1,21 @@
 """Message routes for handling message sending operations."""
 import os
 import json  # Add this import
+import uuid
+from datetime import datetime
 from flask import Blueprint, request, jsonify, current_app, session, redirect, url_for, render_template, flash
 from flask_login import login_required, current_user  # Add this import
 from app.services.message_service import MessageService, WhatsAppService  # Added WhatsAppService import
+from app.services.job_progress import JobProgress
+from app.services.template_engine import get_template_engine, contact_variables
 from app.utils.validators import validate_message_request
+from app.utils.bulk_validator import validate_bulk_messages
+from app.utils.idempotency import idempotent
 from app.models.message import Message
+from app.models.campaign import Campaign
+from app.models.message_queue import MessageTemplate
+from app.models.contact import Contact
+from app.models.bulk_job import BulkJobResult
 from app.models.user import User
 from app.models.api_credential import ApiCredential  # Add this import
 from app import db
@@ -13,6 +23,7 @@ from app import db
 bp = Blueprint('message', __name__)
 
 @bp.route('/send', methods=['POST'])
+@idempotent
 def send_message():
     """Send a message to a single recipient.
     
@@ -39,12 +50,12 @@ def send_message():
         )
         
         # Save to database
-        message = Message(
-            platform=platform,
-            recipient=data['recipient'],
-            message_text=data['message'],
-            media_url=data.get('media_url'),
-            status=result['status']
+        message = Message.from_result(
+            platform,
+            data['recipient'],
+            data['message'],
+            data.get('media_url'),
+            result
         )
         db.session.add(message)
         db.session.commit()
@@ -64,6 +75,7 @@ def send_message():
         }), 500
 
 @bp.route('/bulk/send', methods=['POST'])
+@idempotent
 def send_bulk_messages():
     """Send messages to multiple recipients asynchronously.
     
@@ -81,18 +93,31 @@ def send_bulk_messages():
             }), 400
             
         platform = data.get('platform', 'whatsapp').lower()
+        messages = data['messages']
+        invalid_messages = []
+        
+        if platform == 'whatsapp':
+            # Check and format each distinct number once before queuing
+            validation = validate_bulk_messages(messages)
+            messages = validation['valid']
+            invalid_messages = validation['invalid']
+        else:
+            # Only the bulk validator may mark rows as validated
+            messages = [{key: value for key, value in msg.items() if key != 'validated'}
+                        if isinstance(msg, dict) else msg for msg in messages]
         
         # Queue bulk messages for async processing
         from app.tasks.message_tasks import send_bulk_messages_task
         task = send_bulk_messages_task.delay(
             platform=platform,
-            messages=data['messages']
+            messages=messages
         )
         
         return jsonify({
             'success': True,
             'task_id': task.id,
-            'message': f'Bulk send operation queued with {len(data["messages"])} messages'
+            'message': f'Bulk send operation queued with {len(messages)} messages',
+            'invalid_messages': invalid_messages
         })
         
     except Exception as e:
@@ -122,8 +147,16 @@ def get_bulk_status(task_id):
             'status': task.status,
         }
         
+        # Live counters are available while the job is still running
+        progress = JobProgress(task_id).snapshot()
+        if progress:
+            response['progress'] = progress
+        
         if task.status == 'SUCCESS':
+            # Only counters are stored in the result backend; per-recipient
+            # outcomes are served by the details endpoint
             response['result'] = task.result
+            response['details_url'] = url_for('message.get_bulk_details', task_id=task_id)
         
         return jsonify(response)
         
@@ -135,6 +168,232 @@ def get_bulk_status(task_id):
             'details': str(e)
         }), 500
 
+@bp.route('/bulk/status/<task_id>/details', methods=['GET'])
+def get_bulk_details(task_id):
+    """Get a page of per-recipient outcomes of a bulk message operation.
+    
+    Query parameters:
+        after_id: Return outcomes after this ID (from ``next_after_id``)
+        limit: Maximum number of outcomes to return (max 1000)
+        status: Optional status to filter by
+    
+    Args:
+        task_id: The ID of the bulk operation task
+        
+    Returns:
+        JSON response with a page of outcomes
+    """
+    try:
+        after_id = request.args.get('after_id', 0, type=int)
+        limit = min(request.args.get('limit', 100, type=int), 1000)
+        status = request.args.get('status')
+        
+        rows = BulkJobResult.get_page(task_id, after_id=after_id, limit=limit, status=status)
+        
+        return jsonify({
+            'task_id': task_id,
+            'details': [row.to_dict() for row in rows],
+            'next_after_id': rows[-1].id if len(rows) == limit else None
+        })
+        
+    except Exception as e:
+        current_app.logger.error(f"Error getting bulk details: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': 'Failed to get bulk details',
+            'details': str(e)
+        }), 500
+
+
+@bp.route('/campaigns', methods=['POST'])
+@login_required
+@idempotent
+def create_campaign():
+    """Create a campaign and materialize its recipient list.
+    
+    Recipients are selected with ``groups`` and/or ``contact_ids``, or with
+    ``all_contacts`` set to true. Pass ``template_id`` instead of ``message``
+    to personalize the text for each contact. Pass ``start`` to queue it
+    immediately.
+    
+    Returns:
+        JSON response with the created campaign
+    """
+    try:
+        data = request.get_json() or {}
+        
+        groups = data.get('groups') or []
+        contact_ids = data.get('contact_ids') or []
+        
+        if not data.get('name'):
+            return jsonify({'success': False, 'error': 'Campaign name is required'}), 400
+        
+        template_id = data.get('template_id')
+        if template_id and not MessageTemplate.query.get(template_id):
+            return jsonify({'success': False, 'error': 'Template not found'}), 404
+        
+        if not data.get('message') and not data.get('media_url') and not template_id:
+            return jsonify({'success': False, 'error': 'Message, template or media URL is required'}), 400
+        
+        if not groups and not contact_ids and not data.get('all_contacts'):
+            return jsonify({
+                'success': False,
+                'error': 'Select recipients with groups, contact_ids or all_contacts'
+            }), 400
+        
+        campaign = Campaign(
+            name=data['name'],
+            platform=data.get('platform', 'whatsapp').lower(),
+            message=data.get('message'),
+            media_url=data.get('media_url'),
+            template_id=template_id,
+            status='draft',
+            created_by=current_user.id
+        )
+        db.session.add(campaign)
+        db.session.commit()
+        
+        campaign.materialize_recipients(groups=groups, contact_ids=contact_ids)
+        
+        if data.get('start'):
+            _queue_campaign(campaign)
+        
+        return jsonify({'success': True, 'campaign': campaign.to_dict()}), 201
+        
+    except Exception as e:
+        current_app.logger.error(f"Error creating campaign: {str(e)}")
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'error': 'Failed to create campaign',
+            'details': str(e)
+        }), 500
+
+@bp.route('/campaigns/<int:campaign_id>', methods=['GET'])
+@login_required
+def get_campaign(campaign_id):
+    """Get a campaign with its recipient statistics.
+    
+    Args:
+        campaign_id: The ID of the campaign
+        
+    Returns:
+        JSON response with campaign data
+    """
+    campaign = Campaign.query.get(campaign_id)
+    if not campaign:
+        return jsonify({'success': False, 'error': 'Campaign not found'}), 404
+    
+    return jsonify({'success': True, 'campaign': campaign.to_dict()})
+
+@bp.route('/campaigns/<int:campaign_id>/start', methods=['POST'])
+@bp.route('/campaigns/<int:campaign_id>/resume', methods=['POST'])
+@login_required
+def start_campaign(campaign_id):
+    """Start a draft campaign or resume a paused one.
+    
+    Args:
+        campaign_id: The ID of the campaign
+        
+    Returns:
+        JSON response with campaign data
+    """
+    campaign = Campaign.query.get(campaign_id)
+    if not campaign:
+        return jsonify({'success': False, 'error': 'Campaign not found'}), 404
+    
+    if campaign.status not in ['draft', 'paused']:
+        return jsonify({
+            'success': False,
+            'error': f'Campaign cannot be started while {campaign.status}'
+        }), 400
+    
+    try:
+        if not _queue_campaign(campaign):
+            return jsonify({
+                'success': False,
+                'error': f'Campaign cannot be started while {campaign.status}'
+            }), 409
+        return jsonify({'success': True, 'campaign': campaign.to_dict()})
+    except Exception as e:
+        current_app.logger.error(f"Error starting campaign: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': 'Failed to start campaign',
+            'details': str(e)
+        }), 500
+
+@bp.route('/campaigns/<int:campaign_id>/pause', methods=['POST'])
+@login_required
+def pause_campaign(campaign_id):
+    """Pause a running campaign after the page currently being sent.
+    
+    The campaign is marked ``pausing``; its task marks it ``paused`` when it
+    stops, and only then can the campaign be resumed, so a resumed campaign
+    never has two tasks sending the same page.
+    
+    Args:
+        campaign_id: The ID of the campaign
+        
+    Returns:
+        JSON response with campaign data
+    """
+    campaign = Campaign.query.get(campaign_id)
+    if not campaign:
+        return jsonify({'success': False, 'error': 'Campaign not found'}), 404
+    
+    # Conditional so a pause cannot overwrite a concurrent completion
+    paused = Campaign.query.filter_by(id=campaign_id, status='running').update(
+        {Campaign.status: 'pausing'}, synchronize_session=False
+    )
+    db.session.commit()
+    db.session.refresh(campaign)
+    
+    if not paused:
+        return jsonify({'success': False, 'error': 'Campaign is not running'}), 400
+    
+    return jsonify({'success': True, 'campaign': campaign.to_dict()})
+
+def _queue_campaign(campaign):
+    """Claim a draft or paused campaign and queue its send task.
+    
+    The claim is a conditional update that also stores the ID of the new
+    task, so of two concurrent start requests only one queues a task, and
+    a task whose ID is no longer the campaign's stops before its next page.
+    
+    Args:
+        campaign: The Campaign instance to queue
+        
+    Returns:
+        True if the campaign was claimed and its task queued
+    """
+    from app.tasks.message_tasks import send_campaign_task
+    
+    task_id = str(uuid.uuid4())
+    claimed = Campaign.query.filter(
+        Campaign.id == campaign.id,
+        Campaign.status.in_(['draft', 'paused'])
+    ).update({
+        Campaign.status: 'running',
+        Campaign.task_id: task_id,
+        Campaign.started_at: db.func.coalesce(Campaign.started_at, datetime.utcnow())
+    }, synchronize_session=False)
+    db.session.commit()
+    
+    if claimed:
+        try:
+            send_campaign_task.apply_async(args=(campaign.id,), task_id=task_id)
+        except Exception:
+            # Leave the campaign resumable if the task could not be queued
+            Campaign.query.filter_by(id=campaign.id, task_id=task_id, status='running').update(
+                {Campaign.status: 'paused'}, synchronize_session=False
+            )
+            db.session.commit()
+            raise
+    
+    db.session.refresh(campaign)
+    return bool(claimed)
+
 
 @bp.route('/connect-messaging', methods=['GET', 'POST'])
 def connect_messaging():
@@ -629,10 +888,15 @@ def templates_get():
     if 'user_id' not in session or session.get('authenticated') is not True:
         return jsonify({'success': False, 'error': 'Unauthorized'}), 401
     
-    # This is a placeholder - you'll need to implement template retrieval logic
-    template = {'id': request.args.get('id'), 'name': 'Sample Template', 'content': 'Sample content'}
+    template = MessageTemplate.query.get(request.args.get('id', type=int) or 0)
+    if not template:
+        return jsonify({'success': False, 'error': 'Template not found'}), 404
+    
+    template_data = template.to_dict()
+    template_data['variables'] = sorted(get_template_engine().get(template.id).variables) \
+        if template.is_active else []
     
-    return jsonify({'success': True, 'template': template})
+    return jsonify({'success': True, 'template': template_data})
 
 
 @bp.route('/templates/get_contact_data', methods=['GET'])
@@ -640,31 +904,87 @@ def templates_get_contact_data():
     """Get contact data for template preview.
     
     Returns:
-        JSON response with contact data
+        JSON response with the contact and the template variables it provides
     """
     if 'user_id' not in session or session.get('authenticated') is not True:
         return jsonify({'success': False, 'error': 'Unauthorized'}), 401
     
-    # This is a placeholder - you'll need to implement contact data retrieval logic
-    contact = {'id': request.args.get('contact_id'), 'name': 'Sample Contact', 'phone': '+1234567890'}
+    contact = Contact.query.get(request.args.get('contact_id', type=int) or 0)
+    if not contact:
+        return jsonify({'success': False, 'error': 'Contact not found'}), 404
     
-    return jsonify({'success': True, 'contact': contact})
+    return jsonify({
+        'success': True,
+        'contact': contact.to_dict(),
+        'variables': contact_variables(contact)
+    })
 
 
 @bp.route('/templates/preview', methods=['GET'])
 def templates_preview():
     """Preview a template with contact data.
     
+    Query parameters:
+        template_id: ID of a stored template
+        content: Template text to preview instead of a stored template
+        contact_id: Contact to render for
+        group: Render for the first contacts of this group instead
+        limit: Number of group contacts to render (max ``TEMPLATE_PREVIEW_MAX``)
+    
     Returns:
-        JSON response with preview data
+        JSON response with the rendered preview, or a list of previews for a group
     """
     if 'user_id' not in session or session.get('authenticated') is not True:
         return jsonify({'success': False, 'error': 'Unauthorized'}), 401
     
-    # This is a placeholder - you'll need to implement template preview logic
-    preview = {'content': 'Sample preview content'}
-    
-    return jsonify({'success': True, 'preview': preview})
+    try:
+        engine = get_template_engine()
+        
+        template_id = request.args.get('template_id', type=int)
+        if template_id:
+            template = engine.get(template_id)
+            if not template:
+                return jsonify({'success': False, 'error': 'Template not found'}), 404
+        elif request.args.get('content'):
+            template = engine.compile(request.args['content'], request.args.get('media_url'))
+        else:
+            return jsonify({'success': False, 'error': 'Template ID or content is required'}), 400
+        
+        group = request.args.get('group')
+        if group:
+            max_preview = current_app.config.get('TEMPLATE_PREVIEW_MAX', 50)
+            limit = max(1, min(request.args.get('limit', 10, type=int), max_preview))
+            
+            contacts = Contact.query.filter_by(group=group).order_by(Contact.id).limit(limit).all()
+            
+            return jsonify({
+                'success': True,
+                'group': group,
+                'previews': engine.preview(template, contacts)
+            })
+        
+        contact_id = request.args.get('contact_id', type=int)
+        if contact_id:
+            contact = Contact.query.get(contact_id)
+            if not contact:
+                return jsonify({'success': False, 'error': 'Contact not found'}), 404
+            preview = engine.preview(template, [contact])[0]
+        else:
+            preview = {
+                'content': template.render({}),
+                'media_url': template.media_url,
+                'missing': template.missing({})
+            }
+        
+        return jsonify({'success': True, 'preview': preview})
+        
+    except Exception as e:
+        current_app.logger.error(f"Error previewing template: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': 'Failed to preview template',
+            'details': str(e)
+        }), 500
 
 
 @bp.route('/templates/media/<int:id>', methods=['GET'])
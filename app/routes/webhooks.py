@@ -0,0 +1,56 @@
+"""Webhook routes for provider notifications."""
+
+import hmac
+from flask import Blueprint, request, jsonify, current_app
+
+from app.services.receipts import ReceiptStream, parse_green_api_notification
+
+# Create blueprint
+bp = Blueprint('webhooks', __name__, url_prefix='/webhooks')
+
+def _token_valid(expected):
+    """Check the token a provider sends with its notifications."""
+    if not expected:
+        return True
+
+    auth_header = request.headers.get('Authorization', '')
+    supplied = auth_header[7:] if auth_header.startswith('Bearer ') else request.args.get('token', '')
+    return hmac.compare_digest(supplied.encode(), expected.encode())
+
+@bp.route('/green-api', methods=['POST'])
+def green_api():
+    """Receive Green API notifications.
+
+    Message status notifications are checked and appended to the receipt
+    stream; a background consumer applies them to the database in batches,
+    so the request returns without touching the database. Other
+    notification types are acknowledged and ignored. Set
+    ``GREEN_API_WEBHOOK_TOKEN`` to the instance's webhook token to reject
+    notifications without it.
+
+    Returns:
+        JSON response
+    """
+    if not _token_valid(current_app.config.get('GREEN_API_WEBHOOK_TOKEN')):
+        return jsonify({'success': False, 'error': 'Invalid webhook token'}), 401
+
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return jsonify({'success': False, 'error': 'JSON body is required'}), 400
+
+    try:
+        receipt = parse_green_api_notification(payload)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    if receipt is None:
+        return jsonify({'success': True, 'ignored': True})
+
+    try:
+        ReceiptStream().add(receipt)
+    except Exception as e:
+        # Green API redelivers notifications that are not accepted
+        current_app.logger.error(f"Error queuing webhook receipt: {str(e)}")
+        return jsonify({'success': False, 'error': 'Receipt queue unavailable'}), 503
+
+    return jsonify({'success': True})
@@ -3,13 +3,17 @@
 import logging
 from typing import Dict, Any, List, Optional
 from flask import Blueprint, request, jsonify
+from flask_login import current_user
 
 from app import db
 from app.models.whatsapp_session import WhatsAppSession
-from app.models.message_queue import MessageQueue, MessageStatus
+from app.models.message import Message, MessageEvent
+from app.models.message_queue import MessageQueue
 from app.services.whatsapp.auth import WhatsAppAuth
 from app.services.whatsapp.message import WhatsAppMessageService
-from app.utils.validators import validate_message_request_new
+from app.services.job_progress import JobProgress
+from app.utils.bulk_validator import validate_bulk_messages
+from app.utils.idempotency import idempotent
 
 logger = logging.getLogger(__name__)
 
@@ -170,6 +174,7 @@ def delete_session(session_id):
 
 # Messaging routes
 @whatsapp_bp.route('/send', methods=['POST'])
+@idempotent
 def send_message():
     """Send a WhatsApp message."""
     try:
@@ -201,6 +206,7 @@ def send_message():
 
 
 @whatsapp_bp.route('/queue', methods=['POST'])
+@idempotent
 def queue_message():
     """Queue a WhatsApp message."""
     try:
@@ -218,7 +224,9 @@ def queue_message():
             message=data.get('message'),
             media_url=data.get('media_url'),
             priority=data.get('priority', 0),
-            scheduled_at=data.get('scheduled_at')
+            scheduled_at=data.get('scheduled_at'),
+            owner_id=current_user.id if current_user.is_authenticated else None,
+            campaign_id=data.get('campaign_id')
         )
         
         if result.get('status') == 'success':
@@ -234,6 +242,7 @@ def queue_message():
 
 
 @whatsapp_bp.route('/bulk', methods=['POST'])
+@idempotent
 def send_bulk_messages():
     """Send bulk WhatsApp messages."""
     try:
@@ -250,25 +259,10 @@ def send_bulk_messages():
                 'error': 'No messages provided'
             }), 400
         
-        # Validate messages
-        valid_messages = []
-        invalid_messages = []
-        
-        for msg in messages:
-            validation = validate_message_request_new({
-                '_use_new_format': True,
-                'recipient': msg.get('recipient'),
-                'message': msg.get('message'),
-                'media_url': msg.get('media_url')
-            })
-            
-            if validation.get('status') == 'success':
-                valid_messages.append(msg)
-            else:
-                invalid_messages.append({
-                    'message': msg,
-                    'error': validation.get('error')
-                })
+        # Validate messages; each distinct recipient is checked once
+        validation = validate_bulk_messages(messages)
+        valid_messages = validation['valid']
+        invalid_messages = validation['invalid']
         
         if not valid_messages:
             return jsonify({
@@ -293,6 +287,7 @@ def send_bulk_messages():
             'task_id': task.id,
             'valid_count': len(valid_messages),
             'invalid_count': len(invalid_messages),
+            'duplicate_count': len(validation['duplicates']),
             'invalid_messages': invalid_messages
         }), 200
     except Exception as e:
@@ -303,6 +298,34 @@ def send_bulk_messages():
         }), 500
 
 
+@whatsapp_bp.route('/bulk/<task_id>', methods=['GET'])
+def get_bulk_status(task_id):
+    """Get the status and live progress of a WhatsApp bulk send task."""
+    try:
+        task = send_bulk_messages_task.AsyncResult(task_id)
+        
+        response = {
+            'status': 'success',
+            'task_id': task_id,
+            'task_status': task.status
+        }
+        
+        progress = JobProgress(task_id).snapshot()
+        if progress:
+            response['progress'] = progress
+        
+        if task.status == 'SUCCESS':
+            response['result'] = task.result
+        
+        return jsonify(response), 200
+    except Exception as e:
+        logger.error(f"Error getting bulk status: {str(e)}")
+        return jsonify({
+            'status': 'failed',
+            'error': str(e)
+        }), 500
+
+
 @whatsapp_bp.route('/messages/<message_id>/status', methods=['GET'])
 def get_message_status(message_id):
     """Get status of a WhatsApp message."""
@@ -315,8 +338,9 @@ def get_message_status(message_id):
                 'error': f"Message with ID '{message_id}' not found"
             }), 404
         
-        # Get latest status
-        status = MessageStatus.query.filter_by(message_id=message_id).order_by(MessageStatus.created_at.desc()).first()
+        # Get the latest send attempt from the message ledger
+        status = Message.query.filter_by(queue_id=message.id).order_by(Message.id.desc()).first()
+        events = MessageEvent.query.filter_by(message_id=status.id).order_by(MessageEvent.id).all() if status else []
         
         return jsonify({
             'status': 'success',
@@ -332,7 +356,8 @@ def get_message_status(message_id):
                     'status': status.status,
                     'external_id': status.external_id,
                     'error_message': status.error_message,
-                    'created_at': status.created_at.isoformat() if status.created_at else None
+                    'created_at': status.created_at.isoformat() if status.created_at else None,
+                    'events': [event.to_dict() for event in events]
                 } if status else None
             }
         }), 200
@@ -349,6 +374,7 @@ def get_message_status(message_id):
 
 # Bulk messaging route
 @whatsapp_bp.route('/send-bulk', methods=['POST'])
+@idempotent
 def send_bulk_messages_async():  # Renamed from send_bulk_messages to send_bulk_messages_async
     """Send bulk messages asynchronously."""
     try:
@@ -365,13 +391,25 @@ def send_bulk_messages_async():  # Renamed from send_bulk_messages to send_bulk_
         # Get session ID
         session_id = data.get('session_id')
         
+        # Validate messages; each distinct recipient is checked once
+        validation = validate_bulk_messages(data['messages'])
+        if not validation['valid']:
+            return jsonify({
+                'status': 'failed',
+                'error': 'No valid messages provided',
+                'invalid_messages': validation['invalid']
+            }), 400
+        
         # Queue the task
-        task = send_bulk_messages_task.delay(session_id, data['messages'])
+        task = send_bulk_messages_task.delay(session_id, validation['valid'])
         
         return jsonify({
             'status': 'success',
             'task_id': task.id,
-            'message': f"Queued {len(data['messages'])} messages for sending"
+            'message': f"Queued {len(validation['valid'])} messages for sending",
+            'invalid_count': len(validation['invalid']),
+            'duplicate_count': len(validation['duplicates']),
+            'invalid_messages': validation['invalid']
         }), 202
         
     except Exception as e:
@@ -0,0 +1,223 @@
+"""Archival of old message history to compressed files."""
+
+import os
+import json
+import gzip
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Tuple
+
+from app import db
+from app.models.message import Message, MessageEvent
+from app.models.message_queue import MessageQueue, MessageStatus
+from app.utils.settings import get_setting
+
+logger = logging.getLogger(__name__)
+
+# Queue items in these states will not be sent again
+FINISHED_QUEUE_STATUSES = ('sent', 'failed', 'delivered', 'read')
+ARCHIVE_FORMATS = ('jsonl', 'parquet')
+
+
+def _month(row: Dict[str, Any]) -> str:
+    created = row.get('created_at') or row.get('timestamp')
+    return created.strftime('%Y-%m') if isinstance(created, datetime) else 'undated'
+
+
+def _json_default(value: Any) -> str:
+    return value.isoformat() if isinstance(value, datetime) else str(value)
+
+
+class ArchiveWriter:
+    """Writes archived rows to one set of files per table and month.
+
+    JSONL archives are gzip files that later batches append to, so each
+    month of a table ends up in a single file that ``zcat`` or
+    ``gzip.open`` reads back. Parquet files cannot be appended to, so
+    every batch writes its own file.
+    """
+
+    def __init__(self, directory: str = None, file_format: str = None):
+        """Initialize the writer.
+
+        Args:
+            directory: Directory the archives are written to
+            file_format: ``jsonl`` or ``parquet``
+
+        Raises:
+            ValueError: If the format is not supported
+            ImportError: If Parquet is requested and pyarrow is not installed
+        """
+        self.directory = directory or get_setting('ARCHIVE_DIR', os.path.join(os.getcwd(), 'app_data', 'archive'))
+        self.file_format = (file_format or get_setting('ARCHIVE_FORMAT', 'jsonl')).lower()
+        if self.file_format not in ARCHIVE_FORMATS:
+            raise ValueError(f"Unsupported archive format: {self.file_format}")
+
+        if self.file_format == 'parquet':
+            try:
+                import pyarrow
+                import pyarrow.parquet
+                self.pyarrow = pyarrow
+            except ImportError:
+                logger.error("pyarrow package not installed")
+                raise
+
+        self.run_id = datetime.utcnow().strftime('%Y%m%dT%H%M%S')
+        self.batches = 0
+
+    def write(self, table: str, rows: List[Dict[str, Any]]) -> List[str]:
+        """Write rows of a table to the archive.
+
+        Args:
+            table: Name of the table the rows come from
+            rows: Rows as dictionaries of column values
+
+        Returns:
+            List of the files written to
+        """
+        if not rows:
+            return []
+
+        by_month = {}
+        for row in rows:
+            by_month.setdefault(_month(row), []).append(row)
+
+        table_dir = os.path.join(self.directory, table)
+        os.makedirs(table_dir, exist_ok=True)
+        self.batches += 1
+
+        paths = []
+        for month, month_rows in sorted(by_month.items()):
+            if self.file_format == 'parquet':
+                path = os.path.join(table_dir, f"{table}-{month}-{self.run_id}-{self.batches:05d}.parquet")
+                self.pyarrow.parquet.write_table(self.pyarrow.Table.from_pylist(month_rows), path)
+            else:
+                path = os.path.join(table_dir, f"{table}-{month}.jsonl.gz")
+                with gzip.open(path, 'at', encoding='utf-8') as archive:
+                    for row in month_rows:
+                        archive.write(json.dumps(row, default=_json_default) + '\n')
+            paths.append(path)
+        return paths
+
+
+class MessageArchiver:
+    """Moves message history past its retention period to archive files.
+
+    Old rows are read, written to the archive and deleted in batches of
+    ``ARCHIVE_BATCH_SIZE``, one transaction per batch, so the hot tables
+    and their indexes only hold recent history. Rows are deleted only
+    after their batch was written; a run that is interrupted leaves at
+    most one batch in both the archive and the database.
+
+    Ledger messages are archived with their events, and finished queue
+    items with their legacy status records. Queue items that a message
+    still in the ledger refers to are kept until that message is archived.
+    """
+
+    def __init__(self, writer: ArchiveWriter = None, batch_size: int = None):
+        """Initialize the archiver.
+
+        Args:
+            writer: Optional ArchiveWriter (defaults to the configured archive)
+            batch_size: Number of parent rows archived per transaction
+        """
+        self.writer = writer or ArchiveWriter()
+        self.batch_size = batch_size or get_setting('ARCHIVE_BATCH_SIZE', 1000)
+
+    def _rows(self, model, column, ids: List[int]) -> List[Dict[str, Any]]:
+        result = db.session.execute(model.__table__.select().where(column.in_(ids)).order_by(model.id))
+        return [dict(row._mapping) for row in result]
+
+    def _archive(self, model, criteria: list, children: List[Tuple[Any, Any]], dry_run: bool) -> Dict[str, int]:
+        """Archive the rows of a table matching criteria, children first."""
+        counts = {model.__tablename__: 0}
+        counts.update({child.__tablename__: 0 for child, _ in children})
+
+        if dry_run:
+            counts[model.__tablename__] = model.query.filter(*criteria).count()
+            return counts
+
+        while True:
+            ids = [row.id for row in db.session.query(model.id).filter(*criteria)
+                   .order_by(model.id).limit(self.batch_size)]
+            if not ids:
+                return counts
+
+            try:
+                for child, foreign_key in children:
+                    rows = self._rows(child, foreign_key, ids)
+                    self.writer.write(child.__tablename__, rows)
+                    counts[child.__tablename__] += len(rows)
+                self.writer.write(model.__tablename__, self._rows(model, model.id, ids))
+
+                for child, foreign_key in children:
+                    child.query.filter(foreign_key.in_(ids)).delete(synchronize_session=False)
+                model.query.filter(model.id.in_(ids)).delete(synchronize_session=False)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+
+            counts[model.__tablename__] += len(ids)
+            logger.info(f"Archived {counts[model.__tablename__]} {model.__tablename__} rows so far")
+
+    def archive_messages(self, older_than: datetime, dry_run: bool = False) -> Dict[str, int]:
+        """Archive ledger messages created before a cutoff, with their events.
+
+        Args:
+            older_than: Messages created before this time are archived
+            dry_run: Only count the messages that would be archived
+
+        Returns:
+            Dictionary with the number of rows archived per table
+        """
+        return self._archive(
+            Message,
+            [Message.created_at < older_than],
+            [(MessageEvent, MessageEvent.message_id)],
+            dry_run
+        )
+
+    def archive_queue(self, older_than: datetime, dry_run: bool = False) -> Dict[str, int]:
+        """Archive finished queue items created before a cutoff, with their status records.
+
+        Args:
+            older_than: Queue items created before this time are archived
+            dry_run: Only count the queue items that would be archived
+
+        Returns:
+            Dictionary with the number of rows archived per table
+        """
+        referenced = db.session.query(Message.id).filter(Message.queue_id == MessageQueue.id).exists()
+        return self._archive(
+            MessageQueue,
+            [
+                MessageQueue.created_at < older_than,
+                MessageQueue.status.in_(FINISHED_QUEUE_STATUSES),
+                ~referenced
+            ],
+            [(MessageStatus, MessageStatus.message_id)],
+            dry_run
+        )
+
+    def run(self, message_days: int = None, queue_days: int = None, dry_run: bool = False) -> Dict[str, int]:
+        """Apply the retention policy to the message history.
+
+        Messages are archived before queue items so that the queue items
+        they refer to can follow in the same run.
+
+        Args:
+            message_days: Days ledger messages are kept (defaults to ``MESSAGE_RETENTION_DAYS``)
+            queue_days: Days finished queue items are kept (defaults to ``QUEUE_RETENTION_DAYS``)
+            dry_run: Only count the rows that would be archived
+
+        Returns:
+            Dictionary with the number of rows archived per table
+        """
+        message_days = message_days or get_setting('MESSAGE_RETENTION_DAYS', 90)
+        queue_days = queue_days or get_setting('QUEUE_RETENTION_DAYS', 30)
+        now = datetime.utcnow()
+
+        counts = self.archive_messages(now - timedelta(days=message_days), dry_run=dry_run)
+        counts.update(self.archive_queue(now - timedelta(days=queue_days), dry_run=dry_run))
+        return counts
@@ -0,0 +1,64 @@
+"""Resume points for long-running bulk send tasks."""
+
+import json
+import logging
+from typing import Dict, Any, Optional
+
+from app.utils.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'blastify:checkpoint'
+KEY_TTL = 7 * 24 * 60 * 60
+
+
+class TaskCheckpoint:
+    """Offset and counters of a task's completed work stored in Redis.
+
+    A task saves a checkpoint every few sends after its results up to that
+    point are stored. Celery keeps the task ID when a task is retried or
+    redelivered after a worker is lost, so the next run loads the checkpoint
+    and continues from the saved offset instead of the first message.
+    """
+
+    def __init__(self, task_id: str, redis_client=None):
+        """Initialize the checkpoint for a task.
+
+        Args:
+            task_id: The Celery task ID
+            redis_client: Optional Redis client (defaults to the shared client)
+        """
+        self.key = f"{KEY_PREFIX}:{task_id}"
+        self.redis = redis_client or get_redis()
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        """Get the saved checkpoint.
+
+        Returns:
+            Dictionary with ``offset`` and ``results``, or None if there is none
+        """
+        try:
+            raw = self.redis.get(self.key)
+        except Exception as e:
+            logger.warning(f"Could not read checkpoint {self.key}: {str(e)}")
+            return None
+        return json.loads(raw) if raw else None
+
+    def save(self, offset: int, results: Dict[str, Any]) -> None:
+        """Save the position up to which work is complete.
+
+        Args:
+            offset: Index of the first message not yet completed
+            results: The task's counters up to ``offset``
+        """
+        try:
+            self.redis.set(self.key, json.dumps({'offset': offset, 'results': results}), ex=KEY_TTL)
+        except Exception as e:
+            logger.warning(f"Could not save checkpoint {self.key}: {str(e)}")
+
+    def clear(self) -> None:
+        """Remove the checkpoint once the task's message list is finished or replaced."""
+        try:
+            self.redis.delete(self.key)
+        except Exception as e:
+            logger.warning(f"Could not clear checkpoint {self.key}: {str(e)}")
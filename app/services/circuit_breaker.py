@@ -0,0 +1,232 @@
+"""Circuit breakers for provider accounts."""
+
+import time
+import logging
+import threading
+from collections import deque
+from typing import Dict, Any, Optional
+
+from app.utils.settings import get_setting
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+class CircuitBreaker:
+    """Track the health of one provider account and stop calls while it is failing.
+
+    Outcomes are kept over a sliding time window. The circuit opens when the
+    window holds at least ``min_calls`` calls and either the error rate or the
+    share of slow calls crosses its threshold. While open, calls are refused
+    until the open period ends; then a few probe calls are let through
+    (half-open). A successful probe closes the circuit and a failed one opens
+    it again for twice as long, up to ``max_open_seconds``.
+
+    A caller that was let through but did not make the call, or got an answer
+    that says nothing about the account's health (such as a rate limit),
+    hands the call back with ``release``. A probe whose outcome is never
+    reported is given up after ``probe_timeout`` seconds, so one lost probe
+    cannot keep the circuit half-open for good.
+    """
+
+    def __init__(self, name: str, window_seconds: float = 60, min_calls: int = 10,
+                 error_rate: float = 0.5, slow_call_seconds: float = 10,
+                 slow_call_rate: float = 0.8, open_seconds: float = 30,
+                 max_open_seconds: float = 600, half_open_calls: int = 1,
+                 probe_timeout: float = 60):
+        """Initialize the breaker.
+
+        Args:
+            name: Name of the account the breaker protects
+            window_seconds: Length of the sliding window of outcomes
+            min_calls: Minimum calls in the window before the circuit can open
+            error_rate: Share of failed calls that opens the circuit
+            slow_call_seconds: Latency above which a call counts as slow
+            slow_call_rate: Share of slow calls that opens the circuit
+            open_seconds: Initial time the circuit stays open
+            max_open_seconds: Maximum time the circuit stays open
+            half_open_calls: Number of probe calls allowed while half-open
+            probe_timeout: Seconds after which an unreported probe is given up
+        """
+        self.name = name
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        self.half_open_calls = half_open_calls
+        self.probe_timeout = probe_timeout
+
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.current_open_seconds = open_seconds
+        self.probes = 0
+        self.probe_started = 0.0
+        self.calls = deque()  # (timestamp, failed, slow)
+        self.lock = threading.Lock()
+
+    def _prune(self, now: float) -> None:
+        while self.calls and self.calls[0][0] < now - self.window_seconds:
+            self.calls.popleft()
+
+    def _open(self, now: float) -> None:
+        self.state = OPEN
+        self.opened_at = now
+        self.probes = 0
+        self.calls.clear()
+        logger.warning(f"Circuit opened for {self.name} for {self.current_open_seconds:.0f}s")
+
+    def allow_request(self) -> bool:
+        """Check whether a call may be made now.
+
+        A caller that is allowed through must report the outcome with
+        ``record``, or hand the call back with ``release``.
+
+        Returns:
+            True if the call may proceed
+        """
+        now = time.monotonic()
+        with self.lock:
+            if self.state == OPEN:
+                if now - self.opened_at < self.current_open_seconds:
+                    return False
+                self.state = HALF_OPEN
+                self.probes = 0
+                logger.info(f"Circuit half-open for {self.name}, probing")
+
+            if self.state == HALF_OPEN:
+                if self.probes >= self.half_open_calls:
+                    if now - self.probe_started < self.probe_timeout:
+                        return False
+                    logger.warning(f"Probe of {self.name} never reported, probing again")
+                    self.probes = 0
+                self.probes += 1
+                self.probe_started = now
+
+            return True
+
+    def release(self) -> None:
+        """Hand back a call allowed by ``allow_request`` without an outcome.
+
+        Use it when the call was not made, or when its result says nothing
+        about the account, so a half-open probe can be taken by the next call.
+        """
+        with self.lock:
+            if self.state == HALF_OPEN and self.probes > 0:
+                self.probes -= 1
+
+    def record(self, success: bool, latency: float = 0.0) -> None:
+        """Record the outcome of a call.
+
+        Args:
+            success: Whether the call succeeded
+            latency: Duration of the call in seconds
+        """
+        now = time.monotonic()
+        slow = latency >= self.slow_call_seconds
+
+        with self.lock:
+            if self.state == HALF_OPEN:
+                if success and not slow:
+                    self.state = CLOSED
+                    self.current_open_seconds = self.open_seconds
+                    self.calls.clear()
+                    logger.info(f"Circuit closed for {self.name}")
+                else:
+                    self.current_open_seconds = min(self.current_open_seconds * 2, self.max_open_seconds)
+                    self._open(now)
+                return
+
+            if self.state == OPEN:
+                return
+
+            self.calls.append((now, not success, slow))
+            self._prune(now)
+
+            total = len(self.calls)
+            if total < self.min_calls:
+                return
+
+            failed = sum(1 for _, is_failed, _ in self.calls if is_failed)
+            slow_calls = sum(1 for _, _, is_slow in self.calls if is_slow)
+
+            if failed / total >= self.error_rate or slow_calls / total >= self.slow_call_rate:
+                self._open(now)
+
+    def retry_after(self) -> float:
+        """Get the number of seconds until the circuit will accept probe calls.
+
+        Returns:
+            Seconds to wait, or 0 if calls are accepted now
+        """
+        now = time.monotonic()
+        with self.lock:
+            if self.state == HALF_OPEN and self.probes >= self.half_open_calls:
+                return max(self.probe_timeout - (now - self.probe_started), 0)
+            if self.state != OPEN:
+                return 0
+            return max(self.current_open_seconds - (now - self.opened_at), 0)
+
+    def deferred_result(self) -> Dict[str, Any]:
+        """Build the result returned for a call refused by the open circuit.
+
+        Returns:
+            Dictionary with status ``deferred`` and the seconds to wait
+        """
+        return {
+            'status': 'deferred',
+            'error': f"Circuit open for {self.name}",
+            'retry_after': self.retry_after()
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Convert breaker state to dictionary for API responses."""
+        with self.lock:
+            self._prune(time.monotonic())
+            total = len(self.calls)
+            failed = sum(1 for _, is_failed, _ in self.calls if is_failed)
+        return {
+            'name': self.name,
+            'state': self.state,
+            'calls': total,
+            'error_rate': round(failed / total, 2) if total else 0,
+            'retry_after': self.retry_after()
+        }
+
+
+def get_breaker(name: Optional[str]) -> Optional[CircuitBreaker]:
+    """Get the process-wide circuit breaker for an account.
+
+    Args:
+        name: Account key such as ``green_api:<instance_id>`` (None disables)
+
+    Returns:
+        CircuitBreaker instance, or None if no name was given
+    """
+    if not name:
+        return None
+
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = CircuitBreaker(
+                name,
+                window_seconds=get_setting('CIRCUIT_WINDOW_SECONDS', 60),
+                min_calls=get_setting('CIRCUIT_MIN_CALLS', 10),
+                error_rate=get_setting('CIRCUIT_ERROR_RATE', 0.5),
+                slow_call_seconds=get_setting('CIRCUIT_SLOW_CALL_SECONDS', 10),
+                slow_call_rate=get_setting('CIRCUIT_SLOW_CALL_RATE', 0.8),
+                open_seconds=get_setting('CIRCUIT_OPEN_SECONDS', 30),
+                max_open_seconds=get_setting('CIRCUIT_MAX_OPEN_SECONDS', 600),
+                probe_timeout=get_setting('CIRCUIT_PROBE_TIMEOUT', 60)
+            )
+            _breakers[name] = breaker
+        return breaker
@@ -0,0 +1,94 @@
+"""Real-time event publishing over Redis pub/sub."""
+
+import json
+import time
+import logging
+from typing import Dict, Any, Iterable, Iterator
+
+from app.utils.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_PREFIX = 'blastify:events'
+SESSIONS_CHANNEL = f'{CHANNEL_PREFIX}:sessions'
+DELIVERIES_CHANNEL = f'{CHANNEL_PREFIX}:deliveries'
+
+
+def job_channel(job_id: str) -> str:
+    """Get the channel that carries progress events for a bulk job.
+
+    Args:
+        job_id: The bulk job ID
+
+    Returns:
+        Redis channel name
+    """
+    return f'{CHANNEL_PREFIX}:job:{job_id}'
+
+
+def publish_event(channel: str, event: str, data: Dict[str, Any]) -> None:
+    """Publish an event to subscribers of a channel.
+
+    Publishing is best effort: failures are logged and never interrupt the
+    caller, which is usually in the middle of sending messages.
+
+    Args:
+        channel: Redis channel name
+        event: Event name sent to SSE clients
+        data: JSON-serializable event payload
+    """
+    try:
+        get_redis().publish(channel, json.dumps({'event': event, 'data': data}))
+    except Exception as e:
+        logger.warning(f"Could not publish {event} event to {channel}: {str(e)}")
+
+
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    """Format an event as a Server-Sent Events message.
+
+    Args:
+        event: Event name
+        data: JSON-serializable event payload
+
+    Returns:
+        SSE message string
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def stream_events(channels: Iterable[str], heartbeat: int = 15) -> Iterator[str]:
+    """Yield SSE messages for events published to the given channels.
+
+    Each stream holds a single Redis subscription, however many events flow
+    through it. A comment line is sent every ``heartbeat`` seconds so proxies
+    keep the connection open and disconnected clients are detected.
+
+    Args:
+        channels: Redis channel names to subscribe to
+        heartbeat: Seconds between keep-alive comments
+
+    Returns:
+        Iterator over SSE message strings
+    """
+    pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(*channels)
+
+    try:
+        yield "retry: 5000\n\n"
+        last_sent = time.monotonic()
+
+        while True:
+            message = pubsub.get_message(timeout=1.0)
+
+            if message and message.get('type') == 'message':
+                try:
+                    payload = json.loads(message['data'])
+                    yield format_sse(payload['event'], payload['data'])
+                    last_sent = time.monotonic()
+                except (ValueError, KeyError) as e:
+                    logger.warning(f"Dropping malformed event: {str(e)}")
+            elif time.monotonic() - last_sent >= heartbeat:
+                yield ": keepalive\n\n"
+                last_sent = time.monotonic()
+    finally:
+        pubsub.close()
@@ -0,0 +1,288 @@
+"""Fair scheduling of queued messages across users and campaigns."""
+
+import json
+import logging
+from typing import Dict, Any, List, Tuple, Optional, Hashable
+
+from app.models.message_queue import MessageQueue
+from app.utils.redis_client import get_redis
+from app.utils.settings import get_setting
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'blastify:fair_queue'
+KEY_TTL = 24 * 60 * 60
+
+
+def _flows_key(session_id: int) -> str:
+    return f"{KEY_PREFIX}:{session_id}:flows"
+
+
+def drr_allocate(available: Dict[Hashable, int], limit: int, deficits: Dict[Hashable, float],
+                 weights: Dict[Hashable, float] = None, quantum: float = 1.0,
+                 start_after: Hashable = None) -> Tuple[Dict[Hashable, int], Dict[Hashable, float], Any]:
+    """Share a batch between sub-queues with deficit round-robin.
+
+    Each round every sub-queue with messages earns ``quantum`` times its
+    weight in credit and takes as many messages as its credit covers. Credit
+    left over is carried to the next batch, and a sub-queue that runs empty
+    loses its credit. Rounds start after the sub-queue served last, so a
+    batch that ends mid-round does not favour the sub-queues first in line.
+
+    Args:
+        available: Number of messages waiting in each sub-queue
+        limit: Number of messages to allocate
+        deficits: Credit carried over from the previous batch
+        weights: Optional weight of each sub-queue (default 1)
+        quantum: Credit earned per round by a sub-queue of weight 1
+        start_after: Sub-queue served last in the previous batch
+
+    Returns:
+        Tuple of (messages allocated per sub-queue, credit to carry over,
+        sub-queue served last)
+    """
+    weights = weights or {}
+    keys = sorted(available, key=str)
+    if start_after in keys:
+        position = keys.index(start_after) + 1
+        keys = keys[position:] + keys[:position]
+
+    allocated = {key: 0 for key in keys}
+    deficit = {key: deficits.get(key, 0.0) for key in keys}
+    active = [key for key in keys if available[key] > 0]
+    remaining = limit
+    last = start_after
+
+    while remaining > 0 and active:
+        for key in list(active):
+            deficit[key] += quantum * weights.get(key, 1)
+            take = min(int(deficit[key]), available[key] - allocated[key], remaining)
+            if take:
+                allocated[key] += take
+                deficit[key] -= take
+                remaining -= take
+                last = key
+
+            if allocated[key] == available[key]:
+                deficit[key] = 0.0
+                active.remove(key)
+
+            if not remaining:
+                break
+
+    carried = {key: deficit[key] for key in active if deficit[key]}
+    return allocated, carried, last
+
+
+class FairQueue:
+    """Pick the next batch of queued messages for a session fairly.
+
+    Higher priorities are always served first. Within a priority, single
+    sends (messages without a campaign) come before campaign traffic, so
+    interactive messages are not stuck behind a large blast. Within each of
+    these tiers the batch is shared between owners with deficit round-robin,
+    and each owner's share is shared the same way between their campaigns.
+    One user's huge campaign therefore gets the same share as another user's
+    small one instead of the whole queue.
+
+    The credit each sub-queue carries between batches is kept in Redis, so
+    fairness holds across drain tasks running on different workers.
+
+    The flows (priority, owner and campaign) with messages waiting are kept
+    in a Redis set as well: queuing a message adds its flow, and a flow is
+    removed once it has no messages left. Each batch then counts only the
+    due messages of those flows, and only up to the batch size, instead of
+    grouping the whole queue. The set expires every ``FAIR_QUEUE_FLOW_TTL``
+    seconds and is rebuilt from the queue, which picks up any flow missed.
+    """
+
+    def __init__(self, session_id: int, quantum: float = None,
+                 owner_weights: Dict[int, float] = None):
+        """Initialize the fair queue.
+
+        Args:
+            session_id: ID of the session whose queue is read
+            quantum: Messages per round for a sub-queue of weight 1
+            owner_weights: Optional weight per owner user ID (default 1)
+        """
+        self.session_id = session_id
+        self.quantum = quantum or get_setting('FAIR_QUEUE_QUANTUM', 1)
+        self.owner_weights = owner_weights if owner_weights is not None \
+            else get_setting('FAIR_QUEUE_OWNER_WEIGHTS', {})
+        self.key = f"{KEY_PREFIX}:{session_id}"
+        self.flows_key = _flows_key(session_id)
+
+    @staticmethod
+    def register_flow(session_id: int, priority: Optional[int], owner_id: Optional[int],
+                      campaign_id: Optional[int]) -> None:
+        """Record that a flow has messages waiting; call after queuing a message.
+
+        Args:
+            session_id: ID of the session the message was queued for
+            priority: Message priority
+            owner_id: The owner's user ID
+            campaign_id: The campaign ID (None for single sends)
+        """
+        key = _flows_key(session_id)
+        pipe = get_redis().pipeline()
+        pipe.sadd(key, json.dumps([priority, owner_id, campaign_id]))
+        pipe.ttl(key)
+        _, ttl = pipe.execute()
+
+        # The set had expired; drop the partial set so the next batch rebuilds it
+        if ttl == -1:
+            get_redis().delete(key)
+
+    def flows(self) -> List[Tuple[Any, Optional[int], Optional[int]]]:
+        """Get the flows of the session that have messages waiting.
+
+        Returns:
+            List of (priority, owner_id, campaign_id) tuples
+        """
+        redis_client = get_redis()
+        members = redis_client.smembers(self.flows_key)
+        if members:
+            return [tuple(json.loads(member)) for member in members]
+
+        flows = [tuple(flow) for flow in MessageQueue.get_flows(self.session_id)]
+        pipe = redis_client.pipeline()
+        pipe.delete(self.flows_key)
+        if flows:
+            pipe.sadd(self.flows_key, *[json.dumps(list(flow)) for flow in flows])
+            pipe.expire(self.flows_key, int(get_setting('FAIR_QUEUE_FLOW_TTL', 60)))
+        pipe.execute()
+        return flows
+
+    def flow_counts(self, cap: int) -> List[Tuple[Any, Optional[int], Optional[int], int]]:
+        """Count the due messages of each flow, up to a cap, and forget finished flows.
+
+        Args:
+            cap: Maximum count per flow
+
+        Returns:
+            List of (priority, owner_id, campaign_id, count) tuples of flows
+            with messages due
+        """
+        flows = self.flows()
+        counts = MessageQueue.count_due_flows(self.session_id, flows, cap)
+
+        idle = [flow for flow, count in zip(flows, counts) if not count]
+        if idle:
+            unfinished = set(MessageQueue.get_unfinished_flows(self.session_id, idle))
+            finished = [json.dumps(list(flow)) for flow in idle if flow not in unfinished]
+            if finished:
+                get_redis().srem(self.flows_key, *finished)
+
+        return [flow + (count,) for flow, count in zip(flows, counts) if count]
+
+    def _load_state(self) -> Dict[str, Any]:
+        raw = get_redis().get(self.key)
+        return json.loads(raw) if raw else {}
+
+    def _save_state(self, state: Dict[str, Any]) -> None:
+        get_redis().set(self.key, json.dumps(state), ex=KEY_TTL)
+
+    def _share(self, state: Dict[str, Any], name: str, available: Dict[Any, int],
+               limit: int, weights: Dict[Any, float] = None) -> Dict[Any, int]:
+        """Run one round-robin allocation and store its carried credit under ``name``."""
+        saved = state.get(name, {})
+        keys = {json.dumps(key): key for key in available}
+
+        allocated, carried, last = drr_allocate(
+            {encoded: available[key] for encoded, key in keys.items()},
+            limit,
+            saved.get('deficits', {}),
+            {json.dumps(key): weight for key, weight in (weights or {}).items()},
+            self.quantum,
+            saved.get('last')
+        )
+
+        if carried or last:
+            state[name] = {'deficits': carried, 'last': last}
+        else:
+            state.pop(name, None)
+        return {keys[encoded]: count for encoded, count in allocated.items() if count}
+
+    def plan(self, limit: int) -> List[Tuple[Any, Optional[int], Optional[int], int]]:
+        """Decide how many messages to take from each sub-queue.
+
+        Args:
+            limit: Maximum number of messages in the batch
+
+        Returns:
+            List of (priority, owner_id, campaign_id, count) tuples in the
+            order the tiers are served
+        """
+        tiers: Dict[Tuple[Any, bool], Dict[Optional[int], Dict[Optional[int], int]]] = {}
+        # Counting one past the batch keeps a flow that fills the whole batch
+        # from looking drained, which would drop its carried credit
+        for priority, owner_id, campaign_id, count in self.flow_counts(limit + 1):
+            tier = (priority, campaign_id is None)
+            tiers.setdefault(tier, {}).setdefault(owner_id, {})[campaign_id] = count
+
+        def tier_name(tier):
+            return f"{tier[0]}:{'single' if tier[1] else 'campaign'}"
+
+        # Drop credit of sub-queues that have run empty
+        present = set()
+        for tier, owners in tiers.items():
+            present.add(tier_name(tier))
+            present.update(f"{tier_name(tier)}:{owner_id}" for owner_id in owners)
+        state = {name: saved for name, saved in self._load_state().items() if name in present}
+
+        plan = []
+        remaining = limit
+
+        # Highest priority first; single sends before campaigns at the same priority
+        for tier in sorted(tiers, key=lambda t: (t[0] or 0, t[1]), reverse=True):
+            if not remaining:
+                break
+
+            owners = tiers[tier]
+            owner_shares = self._share(
+                state, tier_name(tier),
+                {owner_id: sum(campaigns.values()) for owner_id, campaigns in owners.items()},
+                remaining,
+                {owner_id: weight for owner_id, weight in self.owner_weights.items() if owner_id in owners}
+            )
+
+            for owner_id, owner_share in owner_shares.items():
+                campaign_shares = self._share(state, f"{tier_name(tier)}:{owner_id}",
+                                              owners[owner_id], owner_share)
+                for campaign_id, count in campaign_shares.items():
+                    plan.append((tier[0], owner_id, campaign_id, count))
+                    remaining -= count
+
+        self._save_state(state)
+        return plan
+
+    def select(self, limit: int = 50) -> List[MessageQueue]:
+        """Get the next batch of due messages for the session.
+
+        Sub-queues are interleaved within each tier so the batch is also sent
+        in a fair order.
+
+        Args:
+            limit: Maximum number of messages to return
+
+        Returns:
+            List of MessageQueue instances in sending order
+        """
+        batch = []
+        current_tier = None
+        tier_flows = []
+
+        def interleave(flows):
+            for position in range(max((len(flow) for flow in flows), default=0)):
+                batch.extend(flow[position] for flow in flows if position < len(flow))
+
+        for priority, owner_id, campaign_id, count in self.plan(limit):
+            tier = (priority, campaign_id is None)
+            if tier != current_tier:
+                interleave(tier_flows)
+                current_tier, tier_flows = tier, []
+            tier_flows.append(MessageQueue.get_flow_messages(
+                self.session_id, priority, owner_id, campaign_id, count))
+
+        interleave(tier_flows)
+        return batch
@@ -0,0 +1,392 @@
+"""Asynchronous Green API sending backend."""
+
+import os
+import json
+import time
+import asyncio
+import logging
+from typing import Dict, Any, List, Optional, Callable
+
+from app.models.api_credential import ApiCredential
+from app.services.message_service import BaseMessageService, StagedMediaMixin
+from app.services.media_fetcher import get_media_fetcher
+from app.services.rate_limiter import SharedTokenBucket
+from app.services.retry_policy import is_provider_failure, get_policy, RATE_LIMIT
+from app.utils.settings import get_setting
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_API_URL = 'https://api.green-api.com'
+DEFAULT_MEDIA_URL = 'https://media.green-api.com'
+# Messages are deferred rather than held while the account's budget is blocked for longer
+MAX_RATE_WAIT = 30
+
+
+def _chat_id(recipient: str) -> str:
+    """Format a phone number as a Green API chat ID.
+
+    Args:
+        recipient: The recipient's phone number with country code
+
+    Returns:
+        Chat ID such as ``15551234567@c.us``
+    """
+    phone = ''.join(c for c in recipient if c.isdigit())
+    return f"{phone}@c.us"
+
+
+def _file_name(media_url: str) -> str:
+    """Build the file name Green API shows for a media URL.
+
+    Args:
+        media_url: URL of the media file
+
+    Returns:
+        File name with a type prefix and the URL's extension
+    """
+    media_ext = media_url.split('.')[-1].lower()
+
+    if media_ext in ['jpg', 'jpeg', 'png']:
+        return f"image.{media_ext}"
+    elif media_ext in ['mp4', 'avi', 'mov']:
+        return f"video.{media_ext}"
+    elif media_ext in ['mp3', 'wav', 'ogg']:
+        return f"audio.{media_ext}"
+    return f"document.{media_ext}"
+
+
+class AsyncGreenAPIService(StagedMediaMixin, BaseMessageService):
+    """Service for sending WhatsApp messages through the Green API REST endpoints.
+
+    Requests run on an asyncio event loop over a pooled keep-alive HTTP
+    client, so a batch keeps many sends in flight at once instead of waiting
+    for each response in turn. Sends are paced by a token bucket shared by
+    every worker at the instance's ``GREEN_API_RATE_PER_MINUTE``, so the
+    account's rate limit is used fully but not exceeded. ``send_message``
+    keeps the synchronous contract of the other services; bulk callers
+    should use ``send_many``.
+    """
+
+    def __init__(self, instance_id: str, api_token: str, api_url: str = None,
+                 media_url: str = None, max_in_flight: int = None,
+                 pool_size: int = None, timeout: float = None,
+                 rate_per_minute: int = None):
+        """Initialize the service.
+
+        Args:
+            instance_id: The Green API instance ID
+            api_token: The Green API token
+            api_url: Base URL of the Green API
+            media_url: Base URL of the Green API media host used for uploads
+            max_in_flight: Maximum number of requests in flight at once
+            pool_size: Maximum number of pooled connections
+            timeout: Total timeout per request in seconds
+            rate_per_minute: Maximum messages the instance sends per minute
+        """
+        try:
+            import aiohttp
+            self.aiohttp = aiohttp
+        except ImportError:
+            logger.error("aiohttp package not installed")
+            raise
+
+        self.instance_id = instance_id
+        self.api_token = api_token
+        self.api_url = (api_url or get_setting('GREEN_API_URL', DEFAULT_API_URL)).rstrip('/')
+        self.media_url = (media_url or get_setting('GREEN_API_MEDIA_URL', DEFAULT_MEDIA_URL)).rstrip('/')
+        self.max_in_flight = max_in_flight or get_setting('GREEN_API_MAX_IN_FLIGHT', 1000)
+        self.pool_size = pool_size or get_setting('GREEN_API_POOL_SIZE', 200)
+        self.timeout = timeout or get_setting('GREEN_API_TIMEOUT', 30)
+        self.rate_per_minute = rate_per_minute or get_setting('GREEN_API_RATE_PER_MINUTE', 60)
+
+    @classmethod
+    def from_credentials(cls, credential_name: str = None) -> 'AsyncGreenAPIService':
+        """Create a service from stored Green API credentials.
+
+        Credentials are read from the database first and then from the
+        credentials file written by ``WhatsAppService``.
+
+        Args:
+            credential_name: Optional name of the credential set to use
+
+        Returns:
+            AsyncGreenAPIService instance
+
+        Raises:
+            ValueError: If no credentials are stored
+        """
+        instance_id = ApiCredential.get_credential('whatsapp', 'instance_id', credential_name)
+        api_token = ApiCredential.get_credential('whatsapp', 'api_token', credential_name)
+
+        if not instance_id or not api_token:
+            credentials_file = os.path.join(os.getcwd(), 'app_data', 'whatsapp_session', 'credentials.json')
+            if os.path.exists(credentials_file):
+                with open(credentials_file, 'r') as f:
+                    credentials = json.load(f)
+                instance_id = credentials.get('instance_id')
+                api_token = credentials.get('api_token')
+
+        if not instance_id or not api_token:
+            raise ValueError("No Green API credentials configured")
+
+        return cls(instance_id, api_token)
+
+    @property
+    def breaker_key(self):
+        """Name of the Green API instance used for its circuit breaker."""
+        return f"green_api:{self.instance_id}"
+
+    def rate_limiter(self) -> SharedTokenBucket:
+        """Get the send budget of the instance, shared by every worker."""
+        return SharedTokenBucket(self.breaker_key, self.rate_per_minute / 60.0)
+
+    def _endpoint(self, method: str, base_url: str = None) -> str:
+        return f"{base_url or self.api_url}/waInstance{self.instance_id}/{method}/{self.api_token}"
+
+    def _create_session(self):
+        """Create an HTTP session with a pooled keep-alive connector."""
+        connector = self.aiohttp.TCPConnector(limit=self.pool_size, limit_per_host=0,
+                                              keepalive_timeout=60)
+        timeout = self.aiohttp.ClientTimeout(total=self.timeout)
+        return self.aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+    async def _request(self, session, http_method: str, url: str, **kwargs) -> Dict[str, Any]:
+        """Make a request and normalize the response.
+
+        Args:
+            session: The aiohttp session
+            http_method: HTTP method
+            url: Request URL
+            **kwargs: Extra arguments for the request
+
+        Returns:
+            Dictionary with status, the decoded response data or an error, the
+            HTTP status code and any ``Retry-After`` seconds
+        """
+        try:
+            async with session.request(http_method, url, **kwargs) as response:
+                if response.status == 200:
+                    return {'status': 'success', 'data': await response.json(content_type=None),
+                            'http_status': response.status}
+                text = await response.text()
+                result = {'status': 'failed', 'error': f"HTTP {response.status}: {text[:200]}",
+                          'http_status': response.status}
+                retry_after = response.headers.get('Retry-After', '')
+                if retry_after.isdigit():
+                    result['retry_after'] = int(retry_after)
+                return result
+        except asyncio.TimeoutError:
+            return {'status': 'failed', 'error': 'Request timed out'}
+        except self.aiohttp.ClientError as e:
+            return {'status': 'failed', 'error': str(e)}
+
+    async def _send(self, session, recipient: str, message: str,
+                    media_url: str = None) -> Dict[str, Any]:
+        """Send one message over an open session.
+
+        Args:
+            session: The aiohttp session
+            recipient: The recipient's phone number with country code
+            message: The message text to send
+            media_url: Optional URL to media to include
+
+        Returns:
+            Dictionary with status and message ID or error. A rate limited
+            message has status ``deferred`` and the seconds to wait.
+        """
+        chat_id = _chat_id(recipient)
+
+        if media_url:
+            response = await self._request(session, 'POST', self._endpoint('sendFileByUrl'), json={
+                'chatId': chat_id,
+                'urlFile': self._get_staged_media(media_url) or media_url,
+                'fileName': _file_name(media_url),
+                'caption': message or ''
+            })
+        else:
+            response = await self._request(session, 'POST', self._endpoint('sendMessage'), json={
+                'chatId': chat_id,
+                'message': message
+            })
+
+        if response['status'] == 'success':
+            return {
+                'status': 'sent',
+                'message_id': (response['data'] or {}).get('idMessage')
+            }
+
+        if response.get('http_status') == 429:
+            return {
+                'status': 'deferred',
+                'error': response.get('error'),
+                'retry_after': response.get('retry_after') or get_policy(RATE_LIMIT)['base_delay']
+            }
+
+        return {
+            'status': 'failed',
+            'error': response.get('error'),
+            'http_status': response.get('http_status')
+        }
+
+    async def send_many_async(self, messages: List[Dict[str, Any]],
+                              on_result: Optional[Callable[[int, Dict[str, Any]], None]] = None
+                              ) -> List[Dict[str, Any]]:
+        """Send a batch of messages concurrently at the instance's rate limit.
+
+        A 429 response blocks the shared budget for its ``Retry-After`` and
+        the message is deferred, as are the messages that would otherwise
+        wait longer than ``MAX_RATE_WAIT`` seconds for the budget, so the
+        caller re-queues them instead of failing them.
+
+        Args:
+            messages: List of dictionaries with recipient, message and
+                optional media_url
+            on_result: Optional callback called with the index and result of
+                each message as it completes
+
+        Returns:
+            List of results in the same order as the messages. Messages refused
+            by the open circuit or rate limited have status ``deferred``.
+        """
+        semaphore = asyncio.Semaphore(self.max_in_flight)
+        results: List[Optional[Dict[str, Any]]] = [None] * len(messages)
+        breaker = self.circuit_breaker()
+        bucket = self.rate_limiter()
+
+        async with self._create_session() as session:
+            async def send_one(index, msg):
+                async with semaphore:
+                    # Wait for the budget before asking the breaker, so a
+                    # half-open probe is not held while the message waits
+                    wait = await bucket.acquire_async(max_wait=MAX_RATE_WAIT)
+                    if wait:
+                        results[index] = {'status': 'deferred', 'error': 'Rate limited',
+                                          'retry_after': wait}
+                        return
+
+                    # Messages still waiting when the circuit opens are deferred
+                    if breaker and not breaker.allow_request():
+                        results[index] = breaker.deferred_result()
+                        return
+
+                    started = time.monotonic()
+                    try:
+                        result = await self._send(session, msg.get('recipient'),
+                                                  msg.get('message'), msg.get('media_url'))
+                    except Exception as e:
+                        logger.error(f"Error sending WhatsApp message to {msg.get('recipient')}: {str(e)}")
+                        result = {'status': 'failed', 'error': str(e)}
+
+                    if result.get('status') == 'deferred':
+                        # Rate limiting holds the account back; it is not an account failure
+                        logger.warning(f"Green API rate limited {self.instance_id}, "
+                                       f"deferring for {result['retry_after']}s")
+                        bucket.block(result['retry_after'])
+                        if breaker:
+                            breaker.release()
+                        results[index] = result
+                        return
+
+                    if breaker:
+                        breaker.record(not is_provider_failure(result), time.monotonic() - started)
+
+                results[index] = result
+                if on_result:
+                    on_result(index, result)
+
+            await asyncio.gather(*(send_one(i, msg) for i, msg in enumerate(messages)))
+
+        return results
+
+    def send_many(self, messages, on_result=None):
+        """Send a batch of messages concurrently from synchronous code.
+
+        Args:
+            messages: List of dictionaries with recipient, message and
+                optional media_url
+            on_result: Optional callback called with the index and result of
+                each message as it completes
+
+        Returns:
+            List of results in the same order as the messages
+        """
+        if not messages:
+            return []
+        return asyncio.run(self.send_many_async(messages, on_result))
+
+    def send_message(self, recipient, message, media_url=None):
+        """Send a WhatsApp message using Green API.
+
+        Args:
+            recipient: The recipient's phone number with country code
+            message: The message text to send
+            media_url: Optional URL to media to include
+
+        Returns:
+            Dictionary with status and any relevant information
+        """
+        return self.send_many([{
+            'recipient': recipient,
+            'message': message,
+            'media_url': media_url
+        }])[0]
+
+    def is_connected(self):
+        """Check if the Green API instance is authorized.
+
+        Returns:
+            Boolean indicating if WhatsApp is connected
+        """
+        async def check():
+            async with self._create_session() as session:
+                return await self._request(session, 'GET', self._endpoint('getStateInstance'))
+
+        response = asyncio.run(check())
+        if response['status'] != 'success':
+            logger.error(f"Error checking WhatsApp connection: {response.get('error')}")
+            return False
+        return (response['data'] or {}).get('stateInstance') == 'authorized'
+
+    def stage_media(self, media_url):
+        """Upload a media file to Green API once and cache the returned handle.
+
+        Args:
+            media_url: URL of the media file
+
+        Returns:
+            Green API file URL, or the original URL if the upload failed
+        """
+        url_file = self._get_staged_media(media_url)
+        if url_file:
+            return url_file
+
+        download = get_media_fetcher().fetch(media_url)
+        if download.get('status') != 'success':
+            logger.warning(f"Could not stage media {media_url}: {download.get('error')}")
+            return media_url
+
+        async def upload():
+            async with self._create_session() as session:
+                with open(download['path'], 'rb') as f:
+                    return await self._request(
+                        session, 'POST', self._endpoint('uploadFile', self.media_url),
+                        data=f,
+                        headers={
+                            'Content-Type': download.get('content_type') or 'application/octet-stream',
+                            'GA-Filename': _file_name(media_url)
+                        }
+                    )
+
+        try:
+            response = asyncio.run(upload())
+            url_file = (response.get('data') or {}).get('urlFile')
+            if response['status'] != 'success' or not url_file:
+                logger.warning(f"Green API upload failed for {media_url}: {response.get('error')}")
+                return media_url
+
+            self.register_staged_media({media_url: url_file})
+            logger.info(f"Staged media {media_url} as {url_file}")
+            return url_file
+        finally:
+            if os.path.exists(download['path']):
+                os.remove(download['path'])
@@ -0,0 +1,174 @@
+"""Live progress counters for bulk send jobs."""
+
+import time
+import logging
+from typing import Dict, Any, Optional
+
+from flask import current_app, has_app_context
+
+from app.utils.redis_client import get_redis
+from app.services.events import publish_event, job_channel
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'blastify:job'
+KEY_TTL = 7 * 24 * 60 * 60  # Keep progress for a week after the last update
+RATE_BUCKET_SECONDS = 10
+RATE_WINDOW_SECONDS = 60
+
+
+class JobProgress:
+    """Atomic sent/failed counters for a bulk job stored in Redis.
+
+    Several chunk tasks may update the same job concurrently, so every update
+    is a HINCRBY. Throughput is tracked in short time buckets to report the
+    current rate rather than the average since the job started.
+    """
+
+    def __init__(self, job_id: str, redis_client=None):
+        """Initialize progress tracking for a job.
+
+        Args:
+            job_id: The bulk job ID
+            redis_client: Optional Redis client (defaults to the shared client)
+        """
+        self.job_id = job_id
+        self.redis = redis_client or get_redis()
+        self.key = f"{KEY_PREFIX}:{job_id}:progress"
+
+    def _rate_key(self, bucket: int) -> str:
+        return f"{KEY_PREFIX}:{self.job_id}:rate:{bucket}"
+
+    def start(self, total: int) -> None:
+        """Register the job and its total number of messages.
+
+        Args:
+            total: Total number of messages in the job
+        """
+        try:
+            pipe = self.redis.pipeline()
+            pipe.hset(self.key, 'total', total)
+            pipe.hsetnx(self.key, 'started_at', time.time())
+            pipe.expire(self.key, KEY_TTL)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Could not start progress for job {self.job_id}: {str(e)}")
+
+    def add(self, sent: int = 0, failed: int = 0) -> None:
+        """Atomically add to the job's counters.
+
+        Args:
+            sent: Number of messages sent since the last update
+            failed: Number of messages failed since the last update
+        """
+        if not sent and not failed:
+            return
+
+        now = time.time()
+        bucket = int(now // RATE_BUCKET_SECONDS)
+
+        try:
+            pipe = self.redis.pipeline()
+            pipe.hincrby(self.key, 'sent', sent)
+            pipe.hincrby(self.key, 'failed', failed)
+            pipe.hset(self.key, 'updated_at', now)
+            pipe.expire(self.key, KEY_TTL)
+            pipe.incrby(self._rate_key(bucket), sent + failed)
+            pipe.expire(self._rate_key(bucket), RATE_WINDOW_SECONDS + RATE_BUCKET_SECONDS)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Could not update progress for job {self.job_id}: {str(e)}")
+
+    def snapshot(self) -> Optional[Dict[str, Any]]:
+        """Get the current progress of the job.
+
+        Returns:
+            Dictionary with counters, current rate (messages per second) and
+            ETA in seconds, or None if no progress has been recorded
+        """
+        try:
+            data = self.redis.hgetall(self.key)
+            if not data:
+                return None
+
+            now = time.time()
+            current_bucket = int(now // RATE_BUCKET_SECONDS)
+            buckets = range(current_bucket - RATE_WINDOW_SECONDS // RATE_BUCKET_SECONDS + 1, current_bucket + 1)
+            recent = sum(int(count or 0) for count in self.redis.mget([self._rate_key(b) for b in buckets]))
+        except Exception as e:
+            logger.warning(f"Could not read progress for job {self.job_id}: {str(e)}")
+            return None
+
+        total = int(data.get('total', 0))
+        sent = int(data.get('sent', 0))
+        failed = int(data.get('failed', 0))
+        remaining = max(total - sent - failed, 0)
+        started_at = float(data.get('started_at', now))
+
+        # Measure the rate over the window, or since the start for young jobs
+        window = min(RATE_WINDOW_SECONDS, max(now - started_at, 1))
+        rate = recent / window
+
+        return {
+            'total': total,
+            'sent': sent,
+            'failed': failed,
+            'remaining': remaining,
+            'rate': round(rate, 2),
+            'eta_seconds': int(remaining / rate) if rate > 0 else None,
+            'started_at': started_at,
+            'updated_at': float(data['updated_at']) if data.get('updated_at') else None
+        }
+
+
+class ProgressReporter:
+    """Buffer per-message outcomes and flush them to JobProgress periodically.
+
+    Flushing every message would cost a Redis round trip per send, so counts
+    are accumulated locally and written every ``flush_every`` messages or
+    ``flush_interval`` seconds, whichever comes first.
+    """
+
+    def __init__(self, job_id: Optional[str], flush_every: Optional[int] = None,
+                 flush_interval: Optional[float] = None):
+        """Initialize the reporter.
+
+        Args:
+            job_id: The bulk job ID (reporting is disabled if None)
+            flush_every: Number of messages between flushes
+            flush_interval: Maximum seconds between flushes
+        """
+        config = current_app.config if has_app_context() else {}
+        self.flush_every = flush_every or config.get('PROGRESS_FLUSH_EVERY', 25)
+        self.flush_interval = flush_interval or config.get('PROGRESS_FLUSH_INTERVAL', 2)
+        self.progress = JobProgress(job_id) if job_id else None
+        self.sent = 0
+        self.failed = 0
+        self.last_flush = time.monotonic()
+
+    def record(self, success: bool) -> None:
+        """Record the outcome of one message.
+
+        Args:
+            success: Whether the message was sent successfully
+        """
+        if success:
+            self.sent += 1
+        else:
+            self.failed += 1
+
+        if (self.sent + self.failed >= self.flush_every
+                or time.monotonic() - self.last_flush >= self.flush_interval):
+            self.flush()
+
+    def flush(self) -> None:
+        """Write buffered counts to Redis and notify progress subscribers."""
+        if self.progress and (self.sent or self.failed):
+            self.progress.add(sent=self.sent, failed=self.failed)
+            snapshot = self.progress.snapshot()
+            if snapshot:
+                publish_event(job_channel(self.progress.job_id), 'progress',
+                              dict(snapshot, job_id=self.progress.job_id))
+        self.sent = 0
+        self.failed = 0
+        self.last_flush = time.monotonic()
@@ -0,0 +1,219 @@
+"""Shared media downloader for outgoing media messages."""
+
+import os
+import time
+import socket
+import logging
+import tempfile
+import threading
+from typing import Dict, Any, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from flask import current_app, has_app_context
+
+logger = logging.getLogger(__name__)
+
+# Defaults used when no Flask configuration is available
+DEFAULT_MAX_BYTES = 16 * 1024 * 1024  # WhatsApp media limit
+DEFAULT_CONNECT_TIMEOUT = 5
+DEFAULT_READ_TIMEOUT = 30
+DEFAULT_TOTAL_TIMEOUT = 120
+DEFAULT_POOL_SIZE = 10
+CHUNK_SIZE = 64 * 1024
+
+
+class MediaTooLargeError(Exception):
+    """Raised when a media download exceeds the configured byte limit."""
+
+
+class MediaTimeoutError(Exception):
+    """Raised when a media download takes longer than the configured total time."""
+
+
+def _abort(response) -> None:
+    """Cut off a streaming response, waking a read that is blocked on it.
+
+    Closing the response would wait for the blocked read to finish;
+    shutting the socket down makes the read return immediately.
+    """
+    sock = getattr(getattr(response.raw, '_connection', None), 'sock', None)
+    if sock is None:
+        # The connection hands its socket to responses it will not reuse
+        fp = getattr(getattr(response.raw, '_fp', None), 'fp', None)
+        sock = getattr(getattr(fp, 'raw', None), '_sock', None)
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+            return
+        except OSError:
+            pass
+    response.close()
+
+
+class MediaFetcher:
+    """Download remote media to disk with pooled sessions, timeouts and a size cap."""
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES,
+                 connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout: float = DEFAULT_READ_TIMEOUT,
+                 pool_size: int = DEFAULT_POOL_SIZE,
+                 download_dir: Optional[str] = None,
+                 total_timeout: float = DEFAULT_TOTAL_TIMEOUT):
+        """Initialize the media fetcher.
+
+        Args:
+            max_bytes: Maximum number of bytes accepted for a single file
+            connect_timeout: Seconds to wait for the connection to be established
+            read_timeout: Seconds to wait between bytes received from the server
+            pool_size: Maximum number of pooled connections per host
+            download_dir: Directory for downloaded files (defaults to app_data/media)
+            total_timeout: Seconds a whole download may take
+        """
+        self.max_bytes = max_bytes
+        self.timeout = (connect_timeout, read_timeout)
+        self.total_timeout = total_timeout
+        self.pool_size = pool_size
+        self.download_dir = download_dir or os.path.join(os.getcwd(), 'app_data', 'media')
+        os.makedirs(self.download_dir, exist_ok=True)
+
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def _get_session(self, url: str) -> requests.Session:
+        """Get the pooled session for the host of a URL.
+
+        Args:
+            url: The URL that will be requested
+
+        Returns:
+            requests.Session dedicated to the URL's scheme and host
+        """
+        parts = urlsplit(url)
+        host_key = f"{parts.scheme}://{parts.netloc}"
+
+        with self._lock:
+            session = self._sessions.get(host_key)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount(host_key, adapter)
+                self._sessions[host_key] = session
+
+        return session
+
+    def fetch(self, url: str) -> Dict[str, Any]:
+        """Download a media file to disk.
+
+        The body is streamed in chunks and the download is aborted as soon as
+        it grows past ``max_bytes`` or runs past ``total_timeout``, so large or
+        slow URLs cannot exhaust memory or hold the caller. The read timeout
+        only bounds the gap between bytes; a server that keeps sending a
+        trickle is cut off by the total deadline, at which point the
+        connection is closed even if a read is blocked.
+
+        Args:
+            url: The HTTP/HTTPS URL of the media file
+
+        Returns:
+            Dictionary with status, and on success the local path, content type
+            and size in bytes. The caller owns the file and should remove it.
+        """
+        path = None
+        timer = None
+        deadline = time.monotonic() + self.total_timeout
+        try:
+            session = self._get_session(url)
+
+            with session.get(url, stream=True, timeout=self.timeout) as response:
+                # Cut off a read that is stuck on a slow server at the deadline
+                timer = threading.Timer(max(deadline - time.monotonic(), 0), _abort, args=(response,))
+                timer.daemon = True
+                timer.start()
+
+                if response.status_code != 200:
+                    return {
+                        "status": "failed",
+                        "error": f"Failed to download media: {response.status_code}"
+                    }
+
+                # Reject early when the server announces an oversized body
+                content_length = response.headers.get('Content-Length')
+                if content_length and content_length.isdigit() and int(content_length) > self.max_bytes:
+                    raise MediaTooLargeError(
+                        f"Media size {content_length} bytes exceeds limit of {self.max_bytes} bytes"
+                    )
+
+                fd, path = tempfile.mkstemp(dir=self.download_dir, prefix='media_')
+                size = 0
+                with os.fdopen(fd, 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                        if time.monotonic() >= deadline:
+                            break
+                        if not chunk:
+                            continue
+                        size += len(chunk)
+                        if size > self.max_bytes:
+                            raise MediaTooLargeError(
+                                f"Media exceeds limit of {self.max_bytes} bytes"
+                            )
+                        f.write(chunk)
+
+                # A body cut short by the deadline is incomplete
+                if time.monotonic() >= deadline:
+                    raise MediaTimeoutError(f"Media download exceeded {self.total_timeout} seconds")
+
+                return {
+                    "status": "success",
+                    "path": path,
+                    "content_type": response.headers.get('Content-Type', 'application/octet-stream'),
+                    "size": size
+                }
+
+        except Exception as e:
+            if time.monotonic() >= deadline and not isinstance(e, MediaTimeoutError):
+                e = MediaTimeoutError(f"Media download exceeded {self.total_timeout} seconds")
+            logger.error(f"Error downloading media from {url}: {str(e)}")
+            if path and os.path.exists(path):
+                os.remove(path)
+            return {
+                "status": "failed",
+                "error": str(e)
+            }
+        finally:
+            if timer:
+                timer.cancel()
+
+    def close(self) -> None:
+        """Close all pooled sessions."""
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions = {}
+
+
+_media_fetcher = None
+_media_fetcher_lock = threading.Lock()
+
+
+def get_media_fetcher() -> MediaFetcher:
+    """Get the shared media fetcher, configured from the Flask app if available.
+
+    Returns:
+        MediaFetcher instance shared by the whole process
+    """
+    global _media_fetcher
+
+    with _media_fetcher_lock:
+        if _media_fetcher is None:
+            config = current_app.config if has_app_context() else {}
+            _media_fetcher = MediaFetcher(
+                max_bytes=config.get('MEDIA_MAX_BYTES', DEFAULT_MAX_BYTES),
+                connect_timeout=config.get('MEDIA_CONNECT_TIMEOUT', DEFAULT_CONNECT_TIMEOUT),
+                read_timeout=config.get('MEDIA_READ_TIMEOUT', DEFAULT_READ_TIMEOUT),
+                pool_size=config.get('MEDIA_POOL_SIZE', DEFAULT_POOL_SIZE),
+                total_timeout=config.get('MEDIA_TOTAL_TIMEOUT', DEFAULT_TOTAL_TIMEOUT)
+            )
+
+    return _media_fetcher
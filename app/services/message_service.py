@@ -11,13 +11,28 @@ import qrcode
 from PIL import Image
 import io
 import json
+import threading
 from app.models.api_credential import ApiCredential
+from app.services.media_fetcher import get_media_fetcher
+from app.services.telegram_dispatcher import TelegramDispatcher
+from app.services.circuit_breaker import get_breaker
+from app.services.retry_policy import is_provider_failure
+from app.utils.settings import get_setting
 
 logger = logging.getLogger(__name__)
 
+# Media uploaded to Green API, keyed by (instance_id, media_url) -> (url_file, expires_at)
+_staged_media = {}
+_staged_media_lock = threading.Lock()
+
+DEFAULT_MEDIA_HANDLE_TTL = 24 * 60 * 60
+
 class BaseMessageService(ABC):
     """Base abstract class for all message services."""
     
+    # Seconds to wait between messages when sending a batch sequentially
+    send_interval = 0.2
+    
     @abstractmethod
     def send_message(self, recipient, message, media_url=None):
         """Send a message to a recipient.
@@ -31,8 +46,132 @@ class BaseMessageService(ABC):
             Dictionary with status and any relevant information
         """
         pass
+    
+    def stage_media(self, media_url):
+        """Prepare a media file once before it is sent to many recipients.
+        
+        Services that cannot pre-upload media simply return the original URL.
+        
+        Args:
+            media_url: URL of the media file
+            
+        Returns:
+            URL or handle to use when sending the media
+        """
+        return media_url
+    
+    def register_staged_media(self, staged_media):
+        """Reuse media that was already staged by another worker.
+        
+        Args:
+            staged_media: Mapping of media URL to the handle returned by stage_media
+        """
+        pass
+    
+    @property
+    def breaker_key(self):
+        """Name of the provider account used for its circuit breaker (None disables it)."""
+        return None
+    
+    def circuit_breaker(self):
+        """Get the circuit breaker for this service's provider account.
+        
+        Returns:
+            CircuitBreaker instance or None
+        """
+        return get_breaker(self.breaker_key)
+    
+    def send_many(self, messages, on_result=None):
+        """Send a batch of messages.
+        
+        Messages are sent one at a time with ``send_interval`` seconds between
+        them. Services that can send concurrently override this. If the
+        account's circuit opens, the remaining messages are returned with
+        status ``deferred`` without being sent.
+        
+        Args:
+            messages: List of dictionaries with recipient, message and optional media_url
+            on_result: Optional callback called with the index and result of each sent message
+            
+        Returns:
+            List of results in the same order as the messages
+        """
+        results = []
+        breaker = self.circuit_breaker()
+        
+        for index, msg in enumerate(messages):
+            if breaker and not breaker.allow_request():
+                deferred = breaker.deferred_result()
+                results.extend(dict(deferred) for _ in messages[index:])
+                break
+            
+            if index:
+                # Add a small delay to avoid rate limiting
+                time.sleep(self.send_interval)
+            
+            started = time.monotonic()
+            try:
+                result = self.send_message(
+                    recipient=msg.get('recipient'),
+                    message=msg.get('message'),
+                    media_url=msg.get('media_url')
+                )
+            except Exception as e:
+                logger.error(f"Error sending message to {msg.get('recipient')}: {str(e)}")
+                result = {'status': 'failed', 'error': str(e)}
+            
+            if breaker:
+                breaker.record(not is_provider_failure(result), time.monotonic() - started)
+            
+            results.append(result)
+            if on_result:
+                on_result(index, result)
+        
+        return results
+
+class StagedMediaMixin:
+    """Per-instance cache of media files uploaded to Green API."""
+    
+    def register_staged_media(self, staged_media):
+        """Cache media handles staged for this instance.
+        
+        Entries whose handle is the original URL (staging failed) are ignored.
+        
+        Args:
+            staged_media: Mapping of media URL to Green API file URL
+        """
+        ttl = get_setting('MEDIA_HANDLE_TTL', DEFAULT_MEDIA_HANDLE_TTL)
+        expires_at = time.time() + ttl
+        
+        with _staged_media_lock:
+            for media_url, url_file in staged_media.items():
+                if url_file and url_file != media_url:
+                    _staged_media[(self.instance_id, media_url)] = (url_file, expires_at)
+    
+    def _get_staged_media(self, media_url):
+        """Get the cached Green API handle for a media URL.
+        
+        Args:
+            media_url: URL of the media file
+            
+        Returns:
+            Green API file URL or None if not staged or expired
+        """
+        key = (self.instance_id, media_url)
+        
+        with _staged_media_lock:
+            entry = _staged_media.get(key)
+            if not entry:
+                return None
+            
+            url_file, expires_at = entry
+            if expires_at <= time.time():
+                del _staged_media[key]
+                return None
+        
+        return url_file
 
-class WhatsAppService(BaseMessageService):
+class WhatsAppService(StagedMediaMixin, BaseMessageService):
     """Service for sending WhatsApp messages using Green API."""
     
     def __init__(self, generate_qr=False):
@@ -83,8 +222,8 @@ class WhatsAppService(BaseMessageService):
         """
         try:
             # Try to load from database first
-            db_instance_id = ApiCredential.get_credential('whatsapp', credential_name, 'instance_id')
-            db_api_token = ApiCredential.get_credential('whatsapp', credential_name, 'api_token')
+            db_instance_id = ApiCredential.get_credential('whatsapp', 'instance_id', credential_name)
+            db_api_token = ApiCredential.get_credential('whatsapp', 'api_token', credential_name)
             
             if db_instance_id and db_api_token:
                 self.instance_id = db_instance_id
@@ -210,6 +349,52 @@ class WhatsAppService(BaseMessageService):
             logger.error(f"Error checking WhatsApp connection: {str(e)}")
             return False
 
+    @property
+    def breaker_key(self):
+        """Name of the Green API instance used for its circuit breaker."""
+        return f"green_api:{self.instance_id}"
+    
+    def stage_media(self, media_url):
+        """Upload a media file to Green API once and cache the returned handle.
+        
+        The handle is cached per instance with an expiry, so bulk jobs can send
+        the same file to every recipient without Green API fetching the remote
+        URL again for each message.
+        
+        Args:
+            media_url: URL of the media file
+            
+        Returns:
+            Green API file URL, or the original URL if the upload failed
+        """
+        url_file = self._get_staged_media(media_url)
+        if url_file:
+            return url_file
+        
+        download = get_media_fetcher().fetch(media_url)
+        if download.get('status') != 'success':
+            logger.warning(f"Could not stage media {media_url}: {download.get('error')}")
+            return media_url
+        
+        try:
+            response = self.green_api.sending.uploadFile(download['path'])
+            
+            if response.code != 200 or not response.data.get('urlFile'):
+                logger.warning(f"Green API upload failed for {media_url}: {response.error}")
+                return media_url
+            
+            url_file = response.data['urlFile']
+            self.register_staged_media({media_url: url_file})
+            
+            logger.info(f"Staged media {media_url} as {url_file}")
+            return url_file
+        except Exception as e:
+            logger.error(f"Error staging media {media_url}: {str(e)}")
+            return media_url
+        finally:
+            if os.path.exists(download['path']):
+                os.remove(download['path'])
+    
     def send_message(self, recipient, message, media_url=None):
         """Send a WhatsApp message using Green API.
         
@@ -240,11 +425,14 @@ class WhatsAppService(BaseMessageService):
                 # Determine media type and send appropriate message
                 media_ext = media_url.split('.')[-1].lower()
                 
+                # Use the uploaded copy if the media was staged for this job
+                file_url = self._get_staged_media(media_url) or media_url
+                
                 if media_ext in ['jpg', 'jpeg', 'png']:
                     # Send image with caption
                     response = self.green_api.sending.sendFileByUrl(
                         chat_id,
-                        media_url,
+                        file_url,
                         f"image.{media_ext}",
                         message
                     )
@@ -252,7 +440,7 @@ class WhatsAppService(BaseMessageService):
                     # Send video with caption
                     response = self.green_api.sending.sendFileByUrl(
                         chat_id,
-                        media_url,
+                        file_url,
                         f"video.{media_ext}",
                         message
                     )
@@ -260,7 +448,7 @@ class WhatsAppService(BaseMessageService):
                     # Send audio with caption
                     response = self.green_api.sending.sendFileByUrl(
                         chat_id,
-                        media_url,
+                        file_url,
                         f"audio.{media_ext}",
                         message
                     )
@@ -268,7 +456,7 @@ class WhatsAppService(BaseMessageService):
                     # Send document with caption
                     response = self.green_api.sending.sendFileByUrl(
                         chat_id,
-                        media_url,
+                        file_url,
                         f"document.{media_ext}",
                         message
                     )
@@ -306,8 +494,8 @@ class WhatsAppService(BaseMessageService):
         """
         try:
             # Get credentials from database
-            instance_id = ApiCredential.get_credential('whatsapp', credential_name, 'instance_id')
-            api_token = ApiCredential.get_credential('whatsapp', credential_name, 'api_token')
+            instance_id = ApiCredential.get_credential('whatsapp', 'instance_id', credential_name)
+            api_token = ApiCredential.get_credential('whatsapp', 'api_token', credential_name)
             
             if not instance_id or not api_token:
                 logger.warning(f"Credential set '{credential_name}' not found or incomplete")
@@ -433,6 +621,23 @@ class TelegramService(BaseMessageService):
                 'status': 'failed',
                 'error': str(e)
             }
+    
+    def send_many(self, messages, on_result=None):
+        """Send a batch of Telegram messages concurrently within the Bot API limits.
+        
+        Args:
+            messages: List of dictionaries with recipient, message and optional media_url
+            on_result: Optional callback called with the index and result of each message
+            
+        Returns:
+            List of results in the same order as the messages
+        """
+        return TelegramDispatcher(self.bot_token, breaker=self.circuit_breaker()).send_many(messages, on_result)
+    
+    @property
+    def breaker_key(self):
+        """Name of the bot used for its circuit breaker."""
+        return f"telegram:{self.bot_token.split(':')[0]}"
 
 class FreeWhatsAppService(BaseMessageService):
     """Service for sending WhatsApp messages using a free API."""
@@ -498,6 +703,30 @@ class MessageService:
         platform = platform.lower()
         
         if platform == 'whatsapp':
+            use_async = get_setting('GREEN_API_ASYNC', False)
+            use_pool = get_setting('WHATSAPP_SENDER_POOL', False)
+            
+            if use_pool:
+                try:
+                    from app.services.sender_pool import SenderPool
+                    pool = SenderPool.from_accounts()
+                    if pool.is_connected():
+                        return pool
+                    logger.warning("No WhatsApp accounts available for the sender pool")
+                except Exception as e:
+                    logger.error(f"Error creating SenderPool: {str(e)}")
+            
+            if use_async:
+                try:
+                    from app.services.green_api_async import AsyncGreenAPIService
+                    async_service = AsyncGreenAPIService.from_credentials()
+                    if async_service.is_connected():
+                        return async_service
+                    logger.warning("WhatsApp is not connected, using FreeWhatsAppService instead")
+                    return FreeWhatsAppService()
+                except Exception as e:
+                    logger.error(f"Error creating AsyncGreenAPIService: {str(e)}")
+            
             # Try to use WhatsAppService first, fall back to FreeWhatsAppService
             try:
                 whatsapp_service = WhatsAppService()
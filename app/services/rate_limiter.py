@@ -0,0 +1,150 @@
+"""Token buckets for pacing sends to a provider's rate limit."""
+
+import math
+import time
+import asyncio
+import logging
+
+from redis.exceptions import RedisError
+
+from app.utils.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'blastify:rate'
+
+
+class TokenBucket:
+    """Token bucket that refills continuously at a fixed rate."""
+
+    def __init__(self, rate: float, capacity: float = None):
+        """Initialize the bucket.
+
+        Args:
+            rate: Tokens added per second
+            capacity: Maximum number of tokens (defaults to 1, which spaces
+                sends evenly so no one-second window exceeds the rate)
+        """
+        self.rate = rate
+        self.capacity = capacity or 1
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self) -> float:
+        """Get the number of seconds until a token is available."""
+        self._refill()
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        """Consume one token."""
+        self._refill()
+        self.tokens -= 1
+
+
+class SharedTokenBucket:
+    """Token bucket kept in Redis, so every worker draws from one budget.
+
+    A provider limits an account or bot as a whole, however many worker
+    processes send through it. The bucket is stored as the time the next
+    token becomes available (the generic cell rate algorithm), which takes
+    one key per bucket and is updated in a WATCH transaction. If Redis is
+    unreachable the bucket falls back to pacing this process only.
+    """
+
+    def __init__(self, name: str, rate: float, capacity: float = None, redis_client=None):
+        """Initialize the bucket.
+
+        Args:
+            name: Name of the limited account, part of the Redis key
+            rate: Tokens added per second
+            capacity: Maximum number of tokens (defaults to 1)
+            redis_client: Optional Redis client (defaults to the shared client)
+        """
+        self.key = f"{KEY_PREFIX}:{name}"
+        self.rate = rate
+        self.capacity = capacity or 1
+        self.interval = 1.0 / rate
+        self.tolerance = (self.capacity - 1) * self.interval
+        self.redis = redis_client or get_redis()
+        self.local = TokenBucket(rate, capacity)
+        self._lock = None
+
+    def _ttl_ms(self, available_at: float, now: float) -> int:
+        return int(math.ceil((available_at - now + self.tolerance) * 1000)) + 1000
+
+    def try_acquire(self) -> float:
+        """Take a token if one is available.
+
+        Returns:
+            0 if a token was taken, otherwise the seconds until one is available
+        """
+        def take(pipe):
+            now = time.time()
+            available_at = max(float(pipe.get(self.key) or 0), now)
+            wait = available_at - self.tolerance - now
+            if wait > 0:
+                return wait
+            pipe.multi()
+            pipe.set(self.key, available_at + self.interval,
+                     px=self._ttl_ms(available_at + self.interval, now))
+            return 0.0
+
+        try:
+            return self.redis.transaction(take, self.key, value_from_callable=True)
+        except RedisError as e:
+            logger.warning(f"Rate limiter {self.key} unavailable, pacing locally: {str(e)}")
+            wait = self.local.wait_time()
+            if wait == 0:
+                self.local.take()
+            return wait
+
+    def block(self, seconds: float) -> None:
+        """Hold every worker off the bucket, e.g. after the provider returned 429.
+
+        Args:
+            seconds: Seconds until the next token may be taken
+        """
+        now = time.time()
+        available_at = now + seconds + self.tolerance
+        try:
+            def push_back(pipe):
+                if float(pipe.get(self.key) or 0) >= available_at:
+                    return
+                pipe.multi()
+                pipe.set(self.key, available_at, px=self._ttl_ms(available_at, now))
+
+            self.redis.transaction(push_back, self.key)
+        except RedisError as e:
+            logger.warning(f"Rate limiter {self.key} unavailable: {str(e)}")
+        self.local.wait_time()
+        self.local.tokens = min(self.local.tokens, 1 - seconds * self.rate)
+
+    async def acquire_async(self, max_wait: float = None) -> float:
+        """Wait until a token is taken.
+
+        Coroutines of one event loop queue up for the bucket, so only one of
+        them polls Redis at a time. Use a bucket from a single event loop.
+
+        Args:
+            max_wait: Give up instead of waiting longer than this many seconds
+                for the next token
+
+        Returns:
+            0 once a token was taken, or the wait that exceeded ``max_wait``
+        """
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            while True:
+                wait = self.try_acquire()
+                if wait <= 0:
+                    return 0
+                if max_wait is not None and wait > max_wait:
+                    return wait
+                await asyncio.sleep(wait)
@@ -0,0 +1,198 @@
+"""Ingestion of delivery and read receipts from provider webhooks."""
+
+import json
+import time
+import logging
+from typing import Dict, Any, List, Optional, Tuple
+
+from app.utils.redis_client import get_redis
+from app.utils.settings import get_setting
+
+logger = logging.getLogger(__name__)
+
+STREAM_KEY = 'blastify:receipts'
+CONSUMER_GROUP = 'receipt-appliers'
+
+# Statuses only move forward. A failure reported after the provider accepted
+# a message replaces ``sent``, but never a delivery or read receipt.
+STATUS_RANK = {
+    'pending': 0,
+    'processing': 1,
+    'queued': 1,
+    'sent': 2,
+    'success': 2,
+    'failed': 3,
+    'delivered': 4,
+    'read': 5
+}
+
+GREEN_API_STATUSES = {
+    'sent': 'sent',
+    'delivered': 'delivered',
+    'read': 'read',
+    'failed': 'failed',
+    'noAccount': 'failed',
+    'notInGroup': 'failed',
+    'yellowCard': 'failed'
+}
+
+
+def parse_green_api_notification(payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Turn a Green API webhook notification into a receipt.
+
+    Args:
+        payload: The notification body
+
+    Returns:
+        Receipt dictionary with provider, external_id, status, timestamp and
+        error, or None for notifications that are not message statuses
+
+    Raises:
+        ValueError: If a status notification is missing its message ID or
+            has an unknown status
+    """
+    if payload.get('typeWebhook') != 'outgoingMessageStatus':
+        return None
+
+    external_id = payload.get('idMessage')
+    status = GREEN_API_STATUSES.get(payload.get('status'))
+
+    if not external_id or not isinstance(external_id, str):
+        raise ValueError('idMessage is required')
+    if not status:
+        raise ValueError(f"Unknown status: {payload.get('status')}")
+
+    return {
+        'provider': 'green_api',
+        'external_id': external_id,
+        'status': status,
+        'timestamp': payload.get('timestamp') or int(time.time()),
+        'error': payload.get('description') if status == 'failed' else None
+    }
+
+
+class ReceiptStream:
+    """Redis stream between the webhook endpoint and the receipt consumers.
+
+    The web tier only appends to the stream, so a burst of receipts costs
+    one Redis command per notification. Consumers read it in batches as a
+    consumer group; entries are acknowledged after their updates are
+    committed, and entries left unacknowledged by a dead consumer are
+    claimed by the next one.
+    """
+
+    def __init__(self, redis_client=None, key: str = STREAM_KEY, group: str = CONSUMER_GROUP):
+        """Initialize the stream.
+
+        Args:
+            redis_client: Optional Redis client (defaults to the shared client)
+            key: Stream key
+            group: Consumer group name
+        """
+        self.redis = redis_client or get_redis()
+        self.key = key
+        self.group = group
+
+    def add(self, receipt: Dict[str, Any]) -> str:
+        """Append a receipt to the stream.
+
+        The stream is trimmed to about ``RECEIPT_STREAM_MAXLEN`` entries.
+
+        Args:
+            receipt: Receipt dictionary
+
+        Returns:
+            The stream entry ID
+        """
+        return self.redis.xadd(self.key, {'receipt': json.dumps(receipt)},
+                               maxlen=get_setting('RECEIPT_STREAM_MAXLEN', 1000000), approximate=True)
+
+    def ensure_group(self) -> None:
+        """Create the consumer group and stream if they do not exist."""
+        try:
+            self.redis.xgroup_create(self.key, self.group, id='0', mkstream=True)
+        except Exception as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+
+    def _decode(self, entries) -> List[Tuple[str, Dict[str, Any]]]:
+        decoded = []
+        for entry_id, fields in entries:
+            if not fields:
+                continue
+            try:
+                decoded.append((entry_id, json.loads(fields['receipt'])))
+            except (KeyError, ValueError, TypeError):
+                logger.warning(f"Dropping malformed receipt entry {entry_id}")
+                self.ack([entry_id])
+        return decoded
+
+    def claim_stale(self, consumer: str, count: int) -> List[Tuple[str, Dict[str, Any]]]:
+        """Take over entries another consumer read but never acknowledged.
+
+        Args:
+            consumer: Name of the claiming consumer
+            count: Maximum number of entries to claim
+
+        Returns:
+            List of (entry ID, receipt) pairs
+        """
+        idle_ms = get_setting('RECEIPT_CLAIM_IDLE', 60) * 1000
+        pending = self.redis.xpending_range(self.key, self.group, '-', '+', count)
+        stale = [entry['message_id'] for entry in pending if entry['time_since_delivered'] >= idle_ms]
+        if not stale:
+            return []
+        return self._decode(self.redis.xclaim(self.key, self.group, consumer, idle_ms, stale))
+
+    def read(self, consumer: str, count: int, block: int = None) -> List[Tuple[str, Dict[str, Any]]]:
+        """Read the next batch of receipts for a consumer.
+
+        Stale entries of dead consumers are returned first.
+
+        Args:
+            consumer: Name of the reading consumer
+            count: Maximum number of receipts
+            block: Optional milliseconds to wait for new entries
+
+        Returns:
+            List of (entry ID, receipt) pairs
+        """
+        self.ensure_group()
+
+        entries = self.claim_stale(consumer, count)
+        if entries:
+            return entries
+
+        response = self.redis.xreadgroup(self.group, consumer, {self.key: '>'}, count=count, block=block)
+        return self._decode(response[0][1]) if response else []
+
+    def ack(self, entry_ids: List[str]) -> None:
+        """Acknowledge and delete processed entries.
+
+        Args:
+            entry_ids: Stream entry IDs
+        """
+        if entry_ids:
+            self.redis.xack(self.key, self.group, *entry_ids)
+            self.redis.xdel(self.key, *entry_ids)
+
+
+def collapse_receipts(receipts: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Keep the furthest status reported for each message.
+
+    Args:
+        receipts: Receipt dictionaries
+
+    Returns:
+        Dictionary mapping external ID to its furthest receipt
+    """
+    latest = {}
+    for receipt in receipts:
+        external_id = receipt.get('external_id')
+        status = receipt.get('status')
+        if not external_id or status not in STATUS_RANK:
+            continue
+        current = latest.get(external_id)
+        if current is None or STATUS_RANK[status] > STATUS_RANK[current['status']]:
+            latest[external_id] = receipt
+    return latest
@@ -0,0 +1,196 @@
+"""Matching of provider receipts to locally stored messages."""
+
+import json
+import time
+import logging
+from datetime import datetime
+from typing import Dict, Any, List, Set, Tuple
+
+from app import db
+from app.models.message import Message, MessageEvent
+from app.models.message_queue import MessageQueue
+from app.models.campaign import CampaignRecipient
+from app.services.receipts import STATUS_RANK, collapse_receipts
+from app.utils.redis_client import get_redis
+from app.utils.settings import get_setting
+
+logger = logging.getLogger(__name__)
+
+# Receipts whose message is not stored yet, by external ID, and when each was first seen
+BUFFER_KEY = 'blastify:receipts:unmatched'
+BUFFER_SEEN_KEY = 'blastify:receipts:unmatched:seen'
+MATCH_BATCH_SIZE = 500
+
+
+def _earlier_statuses(status: str) -> List[str]:
+    return [name for name, rank in STATUS_RANK.items() if rank < STATUS_RANK[status]]
+
+
+class ReceiptReconciler:
+    """Apply receipts to messages, queued messages and campaign recipients.
+
+    Each batch of receipts is matched with one ``external_id IN (...)`` query
+    per table, served by the external ID indexes, so the cost of a batch
+    depends on its size and not on the size of the tables. A receipt can
+    arrive before the worker that sent the message has committed its row;
+    receipts that match nothing are buffered in Redis and retried until
+    ``RECEIPT_BUFFER_TTL`` seconds after they were first seen.
+    """
+
+    def __init__(self, redis_client=None):
+        """Initialize the reconciler.
+
+        Args:
+            redis_client: Optional Redis client (defaults to the shared client)
+        """
+        self.redis = redis_client or get_redis()
+
+    def _match(self, external_ids: List[str]) -> Tuple[list, list, list]:
+        """Load the rows carrying the given external IDs, one query per table."""
+        messages = db.session.query(Message.id, Message.external_id, Message.status).filter(
+            Message.external_id.in_(external_ids)
+        ).all()
+
+        # Queued messages carry their external ID on their ledger row
+        queued = db.session.query(
+            MessageQueue.id, Message.external_id, MessageQueue.status
+        ).join(MessageQueue, Message.queue_id == MessageQueue.id).filter(
+            Message.external_id.in_(external_ids)
+        ).distinct().all()
+
+        recipients = db.session.query(
+            CampaignRecipient.id, CampaignRecipient.external_id, CampaignRecipient.status
+        ).filter(CampaignRecipient.external_id.in_(external_ids)).all()
+
+        return messages, queued, recipients
+
+    def _apply(self, latest: Dict[str, Dict[str, Any]]) -> Tuple[Set[str], Dict[str, int]]:
+        """Apply collapsed receipts and commit.
+
+        Returns:
+            Tuple of (external IDs that matched a row, rows updated per table)
+        """
+        matched = set()
+        updates = {Message: {}, MessageQueue: {}, CampaignRecipient: {}}
+        event_rows = []
+        now = datetime.utcnow()
+
+        external_ids = list(latest)
+        for start in range(0, len(external_ids), MATCH_BATCH_SIZE):
+            messages, queued, recipients = self._match(external_ids[start:start + MATCH_BATCH_SIZE])
+
+            for model, rows in ((Message, messages), (MessageQueue, queued), (CampaignRecipient, recipients)):
+                for row_id, external_id, current in rows:
+                    matched.add(external_id)
+                    receipt = latest[external_id]
+                    if STATUS_RANK[receipt['status']] <= STATUS_RANK.get(current, 0):
+                        continue
+                    updates[model].setdefault(receipt['status'], []).append(row_id)
+
+                    if model is Message:
+                        event_rows.append({
+                            'message_id': row_id,
+                            'status': receipt['status'],
+                            'error_message': receipt.get('error'),
+                            'created_at': now
+                        })
+
+        # The status guard keeps a concurrent newer update from being overwritten
+        counts = {}
+        for model, by_status in updates.items():
+            counts[model.__tablename__] = 0
+            for status, row_ids in by_status.items():
+                values = {model.status: status}
+                if model is Message:
+                    # Bulk updates skip column onupdate defaults
+                    values[Message.updated_at] = now
+                for start in range(0, len(row_ids), MATCH_BATCH_SIZE):
+                    counts[model.__tablename__] += model.query.filter(
+                        model.id.in_(row_ids[start:start + MATCH_BATCH_SIZE]),
+                        db.or_(model.status.in_(_earlier_statuses(status)), model.status.is_(None))
+                    ).update(values, synchronize_session=False)
+
+        if event_rows:
+            db.session.bulk_insert_mappings(MessageEvent, event_rows)
+
+        db.session.commit()
+        return matched, counts
+
+    def _buffer(self, receipts: Dict[str, Dict[str, Any]]) -> None:
+        """Keep unmatched receipts for a later attempt, merged with any already buffered."""
+        if not receipts:
+            return
+
+        external_ids = list(receipts)
+        buffered = self.redis.hmget(BUFFER_KEY, external_ids)
+        merged = collapse_receipts(
+            [json.loads(raw) for raw in buffered if raw] + list(receipts.values())
+        )
+
+        pipe = self.redis.pipeline()
+        pipe.hset(BUFFER_KEY, mapping={
+            external_id: json.dumps(merged[external_id]) for external_id in external_ids
+        })
+        pipe.zadd(BUFFER_SEEN_KEY, {external_id: time.time() for external_id in external_ids}, nx=True)
+        pipe.execute()
+
+    def _unbuffer(self, external_ids: List[str]) -> None:
+        if external_ids:
+            pipe = self.redis.pipeline()
+            pipe.hdel(BUFFER_KEY, *external_ids)
+            pipe.zrem(BUFFER_SEEN_KEY, *external_ids)
+            pipe.execute()
+
+    def reconcile(self, receipts: List[Dict[str, Any]]) -> Dict[str, int]:
+        """Apply a batch of receipts.
+
+        Receipts are collapsed to the furthest status per message and applied
+        with one bulk UPDATE per table and status. Statuses only move
+        forward, so receipts arriving out of order are harmless. Each
+        transition of a ledger message is recorded as a ``MessageEvent``.
+
+        Args:
+            receipts: Receipt dictionaries
+
+        Returns:
+            Dictionary with the number of receipts, rows updated per table
+            and receipts buffered because nothing matched
+        """
+        latest = collapse_receipts(receipts)
+        matched, counts = self._apply(latest) if latest else (set(), {})
+
+        unmatched = {external_id: receipt for external_id, receipt in latest.items()
+                     if external_id not in matched}
+        self._buffer(unmatched)
+
+        # A buffered receipt may have been superseded by one that matched now
+        self._unbuffer([external_id for external_id in matched])
+
+        return dict(counts, receipts=len(receipts), buffered=len(unmatched))
+
+    def retry_buffered(self, limit: int = None) -> Dict[str, int]:
+        """Retry the oldest buffered receipts and drop those that expired.
+
+        Args:
+            limit: Maximum number of buffered receipts to retry
+
+        Returns:
+            Dictionary with the number of receipts retried, matched and expired
+        """
+        limit = limit or get_setting('RECEIPT_BATCH_SIZE', 500)
+        cutoff = time.time() - get_setting('RECEIPT_BUFFER_TTL', 60 * 60)
+
+        expired = self.redis.zrangebyscore(BUFFER_SEEN_KEY, '-inf', cutoff)
+        if expired:
+            logger.warning(f"Dropping {len(expired)} receipts that never matched a message")
+            self._unbuffer(expired)
+
+        external_ids = self.redis.zrange(BUFFER_SEEN_KEY, 0, limit - 1)
+        if not external_ids:
+            return {'retried': 0, 'matched': 0, 'expired': len(expired)}
+
+        receipts = [json.loads(raw) for raw in self.redis.hmget(BUFFER_KEY, external_ids) if raw]
+        matched, _ = self._apply(collapse_receipts(receipts))
+        self._unbuffer(list(matched))
+
+        return {'retried': len(external_ids), 'matched': len(matched), 'expired': len(expired)}
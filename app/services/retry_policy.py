@@ -0,0 +1,133 @@
+"""Retry scheduling for queued messages."""
+
+import random
+from typing import Dict, Any, Optional, Union
+
+from app.utils.settings import get_setting
+
+TRANSIENT = 'transient'
+RATE_LIMIT = 'rate_limit'
+PERMANENT = 'permanent'
+
+# Used when no app context is available; mirrors the defaults in config.Config
+DEFAULT_POLICIES = {
+    TRANSIENT: {'base_delay': 30, 'max_delay': 3600, 'max_retries': None},
+    RATE_LIMIT: {'base_delay': 60, 'max_delay': 1800, 'max_retries': 10},
+    PERMANENT: {'base_delay': 0, 'max_delay': 0, 'max_retries': 0},
+}
+
+RATE_LIMIT_MARKERS = ('too many requests', 'rate limit', 'flood', 'quota')
+PERMANENT_MARKERS = (
+    'invalid phone', 'invalid number', 'not registered', 'not on whatsapp',
+    'no whatsapp', 'chat not found', 'bot was blocked', 'user is deactivated',
+    'missing recipient', 'missing message', 'missing required data'
+)
+RATE_LIMIT_STATUS_CODES = (429, 466)
+PERMANENT_STATUS_CODES = (400, 403, 404)
+
+
+def classify_error(result: Union[Dict[str, Any], str, None]) -> str:
+    """Classify a failed send so it can be retried appropriately.
+
+    Args:
+        result: The failed send result (with ``error`` and optional
+            ``http_status``) or an error message
+
+    Returns:
+        One of ``transient``, ``rate_limit`` or ``permanent``
+    """
+    if isinstance(result, dict):
+        error = (result.get('error') or '').lower()
+        http_status = result.get('http_status')
+    else:
+        error = (result or '').lower()
+        http_status = None
+
+    if http_status in RATE_LIMIT_STATUS_CODES or any(marker in error for marker in RATE_LIMIT_MARKERS):
+        return RATE_LIMIT
+    if http_status in PERMANENT_STATUS_CODES or any(marker in error for marker in PERMANENT_MARKERS):
+        return PERMANENT
+    return TRANSIENT
+
+
+def is_provider_failure(result: Dict[str, Any]) -> bool:
+    """Check whether a send result points at a problem with the provider account.
+
+    Permanent errors such as an invalid number are answered normally by the
+    provider, so they do not count against the account's circuit breaker.
+
+    Args:
+        result: The send result
+
+    Returns:
+        True if the send failed for a transient or rate limit reason
+    """
+    if result.get('status') in ['queued', 'sent', 'success']:
+        return False
+    return classify_error(result) != PERMANENT
+
+
+def get_policy(error_class: str) -> Dict[str, Any]:
+    """Get the retry policy for an error class.
+
+    Args:
+        error_class: One of ``transient``, ``rate_limit`` or ``permanent``
+
+    Returns:
+        Dictionary with base_delay, max_delay and max_retries (None means the
+        message's own max_retries applies)
+    """
+    policies = get_setting('RETRY_POLICIES', DEFAULT_POLICIES)
+    return policies.get(error_class) or policies[TRANSIENT]
+
+
+def backoff_delay(attempt: int, base: float = None, cap: float = None) -> float:
+    """Get the delay before a retry using exponential backoff with jitter.
+
+    The delay doubles with every attempt up to ``cap``. Half of it is fixed
+    and half is random, so retries of messages that failed together are
+    spread out instead of arriving at the provider at the same moment.
+
+    Args:
+        attempt: Number of the failed attempt (1 for the first failure)
+        base: Delay after the first failure in seconds
+        cap: Maximum delay in seconds
+
+    Returns:
+        Delay in seconds
+    """
+    policy = get_policy(TRANSIENT)
+    base = base if base is not None else policy['base_delay']
+    cap = cap if cap is not None else policy['max_delay']
+
+    delay = min(cap, base * (2 ** max(attempt - 1, 0)))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def retry_delay(result: Union[Dict[str, Any], str, None], attempt: int,
+                max_retries: int) -> Optional[float]:
+    """Decide whether and when to retry a failed send.
+
+    Args:
+        result: The failed send result or an error message
+        attempt: Number of the failed attempt (1 for the first failure)
+        max_retries: The message's own retry limit
+
+    Returns:
+        Delay in seconds before the next attempt, or None if the message
+        should not be retried
+    """
+    policy = get_policy(classify_error(result))
+    limit = policy['max_retries'] if policy['max_retries'] is not None else max_retries
+
+    if attempt >= limit:
+        return None
+
+    delay = backoff_delay(attempt, policy['base_delay'], policy['max_delay'])
+
+    # Never retry sooner than the provider asked us to wait
+    retry_after = result.get('retry_after') if isinstance(result, dict) else None
+    if retry_after:
+        delay = max(delay, retry_after)
+
+    return delay
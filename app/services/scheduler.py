@@ -0,0 +1,168 @@
+"""In-memory scheduler for messages queued with a scheduled time."""
+
+import time
+import heapq
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional, Callable
+
+from sqlalchemy import func
+
+from app import db
+from app.models.message_queue import MessageQueue
+from app.utils.settings import get_setting
+
+logger = logging.getLogger(__name__)
+
+
+def _dispatch_to_worker(queue_id: int) -> None:
+    """Hand a due message to a send worker."""
+    from app.tasks.whatsapp_tasks import send_queued_message_task
+    send_queued_message_task.delay(queue_id)
+
+
+class MessageScheduler:
+    """Dispatch scheduled messages when they become due.
+
+    Messages due within the next ``window_seconds`` are loaded into a
+    min-heap ordered by scheduled time. The loop sleeps until the earliest
+    message is due (at most ``tick_seconds``) and dispatches it to a send
+    worker, so messages go out within a tick of their time.
+
+    The database is read in two cheap ways instead of being scanned on every
+    run: the window ahead is read from the (status, scheduled_at) index as it
+    advances, and messages queued since the last check are found by primary
+    key range. Workers claim each message with a conditional update, so a
+    message dispatched twice is still sent once.
+    """
+
+    def __init__(self, dispatch: Optional[Callable[[int], None]] = None,
+                 window_seconds: float = None, refill_interval: float = None,
+                 batch_size: int = None, tick_seconds: float = None):
+        """Initialize the scheduler.
+
+        Args:
+            dispatch: Callable that sends a due queue item ID to a worker
+            window_seconds: How far ahead to load scheduled messages
+            refill_interval: Seconds between database checks
+            batch_size: Maximum rows read per query
+            tick_seconds: Maximum time the loop sleeps
+        """
+        self.dispatch = dispatch or _dispatch_to_worker
+        self.window = timedelta(seconds=window_seconds or get_setting('SCHEDULER_WINDOW_SECONDS', 300))
+        self.refill_interval = refill_interval or get_setting('SCHEDULER_REFILL_INTERVAL', 1)
+        self.batch_size = batch_size or get_setting('SCHEDULER_BATCH_SIZE', 1000)
+        self.tick_seconds = tick_seconds or get_setting('SCHEDULER_TICK_SECONDS', 0.5)
+
+        self.heap = []  # (scheduled_at, queue_id)
+        self.loaded = set()
+        self.cursor = None  # (scheduled_at, id) of the last row read from the window
+        self.max_seen_id = None
+        self.next_refill = 0.0
+        self.stop_event = threading.Event()
+
+    def _push(self, rows) -> None:
+        for queue_id, scheduled_at in rows:
+            if queue_id not in self.loaded:
+                self.loaded.add(queue_id)
+                heapq.heappush(self.heap, (scheduled_at, queue_id))
+
+    def refill(self, now: datetime = None) -> int:
+        """Load messages that are due within the window.
+
+        Args:
+            now: Current UTC time (defaults to now)
+
+        Returns:
+            Number of messages now waiting in the heap
+        """
+        now = now or datetime.utcnow()
+        horizon = now + self.window
+
+        # Messages queued since the last check, at any time within the horizon
+        if self.max_seen_id is not None:
+            max_id = db.session.query(func.max(MessageQueue.id)).scalar() or 0
+            rows = MessageQueue.get_new_scheduled(self.max_seen_id, horizon, self.batch_size)
+            self._push(rows)
+            self.max_seen_id = rows[-1][0] if len(rows) == self.batch_size else max_id
+        else:
+            self.max_seen_id = db.session.query(func.max(MessageQueue.id)).scalar() or 0
+
+        # Advance through the window, a batch at a time while the heap has room
+        while len(self.heap) < self.batch_size:
+            after, after_id = self.cursor if self.cursor else (None, None)
+            rows = MessageQueue.get_scheduled_window(horizon, after, after_id, self.batch_size)
+            self._push(rows)
+
+            if len(rows) < self.batch_size:
+                # Everything up to the horizon is loaded; continue from there next time
+                self.cursor = (horizon, None)
+                break
+            self.cursor = (rows[-1][1], rows[-1][0])
+
+        # Release the read transaction so later checks see new rows
+        db.session.commit()
+        return len(self.heap)
+
+    def dispatch_due(self, now: datetime = None) -> int:
+        """Dispatch every loaded message whose time has come.
+
+        Args:
+            now: Current UTC time (defaults to now)
+
+        Returns:
+            Number of messages dispatched
+        """
+        now = now or datetime.utcnow()
+        dispatched = 0
+
+        while self.heap and self.heap[0][0] <= now:
+            _, queue_id = heapq.heappop(self.heap)
+            self.loaded.discard(queue_id)
+            try:
+                self.dispatch(queue_id)
+                dispatched += 1
+            except Exception as e:
+                logger.error(f"Error dispatching scheduled message {queue_id}: {str(e)}")
+
+        return dispatched
+
+    def run_once(self) -> Dict[str, Any]:
+        """Run one iteration of the scheduler loop.
+
+        Returns:
+            Dictionary with the number of messages dispatched and waiting
+        """
+        if time.monotonic() >= self.next_refill:
+            self.refill()
+            self.next_refill = time.monotonic() + self.refill_interval
+
+        return {
+            'dispatched': self.dispatch_due(),
+            'waiting': len(self.heap)
+        }
+
+    def run(self) -> None:
+        """Run the scheduler until ``stop`` is called."""
+        logger.info(f"Message scheduler started (window {self.window.total_seconds():.0f}s)")
+
+        while not self.stop_event.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Scheduler iteration failed: {str(e)}")
+                db.session.rollback()
+
+            # Sleep until the next message is due, the next refill, or a tick
+            wait = min(self.tick_seconds, max(self.next_refill - time.monotonic(), 0))
+            if self.heap:
+                due_in = (self.heap[0][0] - datetime.utcnow()).total_seconds()
+                wait = min(wait, max(due_in, 0))
+            self.stop_event.wait(wait)
+
+        logger.info("Message scheduler stopped")
+
+    def stop(self) -> None:
+        """Stop the scheduler loop."""
+        self.stop_event.set()
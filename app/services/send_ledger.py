@@ -0,0 +1,90 @@
+"""Record of messages already sent by a bulk job or campaign."""
+
+import json
+import hashlib
+import logging
+from typing import Dict, Any, List, Optional
+
+from app.utils.redis_client import get_redis
+from app.utils.settings import get_setting
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'blastify:sent'
+DEFAULT_TTL = 24 * 60 * 60
+SENT_STATUSES = ('queued', 'sent', 'success')
+
+
+def message_key(msg: Dict[str, Any]) -> str:
+    """Identify a message within a job by its recipient and content.
+
+    Args:
+        msg: Dictionary with recipient, message and optional media_url
+
+    Returns:
+        Hex digest identifying the message
+    """
+    content = '\x00'.join(str(msg.get(field) or '') for field in ('recipient', 'message', 'media_url'))
+    return hashlib.sha1(content.encode()).hexdigest()
+
+
+class SendLedger:
+    """Per-job record of sent messages kept in a Redis hash.
+
+    Before a chunk or campaign page is sent, messages already recorded for
+    the job are answered from the ledger, so a retried task does not call
+    the provider again for recipients it already reached. Only successful
+    sends are recorded; failures are sent again on retry.
+    """
+
+    def __init__(self, job_id: str, ttl: int = None, redis_client=None):
+        """Initialize the ledger for a job.
+
+        Args:
+            job_id: The bulk job ID, or ``campaign:<id>`` for a campaign
+            ttl: Seconds the ledger is kept after its last update
+            redis_client: Optional Redis client (defaults to the shared client)
+        """
+        self.key = f"{KEY_PREFIX}:{job_id}"
+        if ttl is None:
+            ttl = get_setting('IDEMPOTENCY_KEY_TTL', DEFAULT_TTL)
+        self.ttl = ttl
+        self.redis = redis_client or get_redis()
+
+    def lookup(self, messages: List[Dict[str, Any]]) -> List[Optional[Dict[str, Any]]]:
+        """Get the recorded result of each message.
+
+        Args:
+            messages: Messages of the job
+
+        Returns:
+            The recorded result for each message, or None if it was not sent
+        """
+        if not messages:
+            return []
+
+        try:
+            stored = self.redis.hmget(self.key, [message_key(msg) for msg in messages])
+        except Exception as e:
+            logger.warning(f"Could not read send ledger {self.key}: {str(e)}")
+            return [None] * len(messages)
+
+        return [dict(json.loads(value), replayed=True) if value else None for value in stored]
+
+    def record(self, msg: Dict[str, Any], result: Dict[str, Any]) -> None:
+        """Record the result of a message if it was sent.
+
+        Args:
+            msg: The message
+            result: The send result
+        """
+        if result.get('status') not in SENT_STATUSES:
+            return
+
+        try:
+            pipe = self.redis.pipeline()
+            pipe.hset(self.key, message_key(msg), json.dumps(result, default=str))
+            pipe.expire(self.key, self.ttl)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Could not update send ledger {self.key}: {str(e)}")
@@ -0,0 +1,375 @@
+"""Load balancing of bulk sends across WhatsApp accounts."""
+
+import math
+import time
+import queue
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Any, List, Optional, Callable
+
+from flask import current_app, has_app_context
+
+from app.models.api_credential import ApiCredential
+from app.models.whatsapp_session import WhatsAppSession
+from app.services.message_service import BaseMessageService
+from app.utils.redis_client import get_redis
+from app.utils.settings import get_setting
+
+logger = logging.getLogger(__name__)
+
+PIN_PREFIX = 'blastify:sender_pin'
+USAGE_PREFIX = 'blastify:sender_usage'
+
+
+def _rendezvous_score(recipient: str, key: str, weight: float) -> float:
+    """Score a recipient and account pair for weighted rendezvous hashing.
+
+    Every recipient ranks the accounts in its own stable order, and each
+    account wins a share of recipients proportional to its weight. Adding or
+    removing an account only moves the recipients that it wins or loses.
+
+    Args:
+        recipient: The recipient's phone number
+        key: The account key
+        weight: The account's weight
+
+    Returns:
+        Score; the account with the highest score is chosen
+    """
+    digest = hashlib.sha1(f"{recipient}|{key}".encode()).digest()
+    # Uniform value in (0, 1)
+    point = (int.from_bytes(digest[:8], 'big') + 1) / (2 ** 64 + 2)
+    return -weight / math.log(point)
+
+
+class SessionSender(BaseMessageService):
+    """Bulk sending interface for a WhatsApp Web session."""
+
+    def __init__(self, service):
+        """Initialize the sender.
+
+        Args:
+            service: WhatsAppMessageService bound to the session
+        """
+        self.service = service
+
+    def send_message(self, recipient, message, media_url=None):
+        """Send a message through the session.
+
+        The bulk task records the result, so the session does not.
+
+        Returns:
+            Dictionary with status and any relevant information
+        """
+        return self.service.send_message(recipient, message, media_url, record=False)
+
+    def circuit_breaker(self):
+        """The session service guards its own calls with this breaker."""
+        return None
+
+    def send_many(self, messages, on_result=None):
+        """Send a batch of messages through the session one at a time.
+
+        Args:
+            messages: List of dictionaries with recipient, message and optional media_url
+            on_result: Optional callback called with the index and result of each sent message
+
+        Returns:
+            List of results in the same order as the messages
+        """
+        results = []
+
+        for index, msg in enumerate(messages):
+            result = self.service.send_message(msg.get('recipient'), msg.get('message'), msg.get('media_url'),
+                                               validated=msg.get('validated', False), record=False)
+
+            # Stop once the session's circuit opens
+            if result.get('status') == 'deferred':
+                results.extend(dict(result) for _ in messages[index:])
+                break
+
+            results.append(result)
+            if on_result:
+                on_result(index, result)
+
+        return results
+
+
+class SenderAccount:
+    """One WhatsApp account in the pool with its send budget."""
+
+    def __init__(self, key: str, service: BaseMessageService, rate_per_minute: int, breaker=None):
+        """Initialize the account.
+
+        Args:
+            key: Unique account key, also the name of its circuit breaker
+            service: Service that sends through the account
+            rate_per_minute: Maximum messages the account should send per minute
+            breaker: The account's circuit breaker
+        """
+        self.key = key
+        self.service = service
+        self.rate_per_minute = rate_per_minute
+        self.breaker = breaker
+
+    def circuit_open(self) -> bool:
+        """Check whether the account's circuit is refusing calls."""
+        return bool(self.breaker) and self.breaker.retry_after() > 0
+
+    def weight(self, used: int) -> float:
+        """Get the account's share of new recipients.
+
+        The weight is the send budget left in the current minute scaled down
+        by the recent error rate. Accounts whose circuit is open get none.
+
+        Args:
+            used: Messages already sent through the account this minute
+
+        Returns:
+            Weight, 0 if the account should not be used
+        """
+        remaining = max(self.rate_per_minute - used, 0)
+        if not self.breaker:
+            return float(remaining)
+
+        state = self.breaker.to_dict()
+        if state['state'] == 'open' and state['retry_after'] > 0:
+            return 0.0
+        return remaining * (1 - state['error_rate'])
+
+
+class SenderPool(BaseMessageService):
+    """Spread a bulk send across every healthy WhatsApp account.
+
+    The pool includes Green API credential sets and connected WhatsApp Web
+    sessions. Each recipient stays pinned to the account that first messaged
+    it, as long as that account is in the pool and its circuit is not open,
+    even when its budget for the minute is spent; the account's own rate
+    limit paces or defers the send. New recipients are assigned by
+    weighted rendezvous hashing, using each account's remaining rate budget
+    and recent error rate as its weight. Accounts send their share of a batch
+    in parallel, so throughput grows with the number of connected accounts.
+    """
+
+    def __init__(self, accounts: List[SenderAccount], pin_ttl: int = None):
+        """Initialize the pool.
+
+        Args:
+            accounts: Accounts to send through
+            pin_ttl: Seconds a recipient stays pinned to an account
+        """
+        self.accounts = {account.key: account for account in accounts}
+        self.pin_ttl = pin_ttl or get_setting('SENDER_PIN_TTL', 30 * 24 * 60 * 60)
+
+    @classmethod
+    def from_accounts(cls) -> 'SenderPool':
+        """Create a pool of all stored Green API credential sets and connected sessions.
+
+        Returns:
+            SenderPool instance (may be empty)
+        """
+        accounts = []
+
+        green_api_rate = get_setting('GREEN_API_RATE_PER_MINUTE', 60)
+        for credentials in ApiCredential.get_credential_sets('whatsapp'):
+            try:
+                from app.services.green_api_async import AsyncGreenAPIService
+                service = AsyncGreenAPIService(credentials['instance_id'], credentials['api_token'])
+            except Exception as e:
+                logger.error(f"Error creating sender for credential set '{credentials['name']}': {str(e)}")
+                continue
+            accounts.append(SenderAccount(service.breaker_key, service, green_api_rate,
+                                          service.circuit_breaker()))
+
+        from app.services.whatsapp.message import WhatsAppMessageService
+        session_rate = get_setting('WHATSAPP_SESSION_RATE_PER_MINUTE', 20)
+        for session in WhatsAppSession.get_active_sessions():
+            if session.status != 'connected':
+                continue
+            service = WhatsAppMessageService(session_id=session.session_id)
+            accounts.append(SenderAccount(f"whatsapp_web:{session.session_id}", SessionSender(service),
+                                          session.rate_per_minute or session_rate, service.breaker))
+
+        return cls(accounts)
+
+    def _usage_key(self, key: str) -> str:
+        return f"{USAGE_PREFIX}:{key}:{int(time.time() // 60)}"
+
+    def weights(self) -> Dict[str, float]:
+        """Get the current weight of every account.
+
+        Returns:
+            Dictionary mapping account key to weight
+        """
+        keys = list(self.accounts)
+        used = get_redis().mget([self._usage_key(key) for key in keys]) if keys else []
+        return {key: self.accounts[key].weight(int(count or 0)) for key, count in zip(keys, used)}
+
+    def assign(self, recipients: List[str]) -> List[Optional[str]]:
+        """Choose an account for each recipient.
+
+        Args:
+            recipients: Recipient phone numbers
+
+        Returns:
+            Account key for each recipient, or None if no account is available
+        """
+        weights = self.weights()
+        available = {key: weight for key, weight in weights.items() if weight > 0}
+
+        # Pinned recipients stay on any account that is not failing
+        usable = {key for key, account in self.accounts.items() if not account.circuit_open()}
+
+        # With every budget spent, keep sending through accounts that are not failing
+        if not available:
+            available = {key: 1.0 for key in usable}
+        if not available:
+            return [None] * len(recipients)
+
+        redis_client = get_redis()
+        pin_keys = [f"{PIN_PREFIX}:{recipient}" for recipient in recipients]
+        pins = redis_client.mget(pin_keys) if pin_keys else []
+
+        assigned = []
+        pipe = redis_client.pipeline(transaction=False)
+        usage = {}
+
+        for recipient, pin_key, pinned in zip(recipients, pin_keys, pins):
+            if pinned in usable:
+                key = pinned
+            else:
+                key = max(available, key=lambda k: _rendezvous_score(recipient, k, available[k]))
+                pipe.set(pin_key, key, ex=self.pin_ttl)
+            assigned.append(key)
+            usage[key] = usage.get(key, 0) + 1
+
+        for key, count in usage.items():
+            pipe.incrby(self._usage_key(key), count)
+            pipe.expire(self._usage_key(key), 120)
+        pipe.execute()
+
+        return assigned
+
+    def stage_media(self, media_url):
+        """Stage a media file on every account that supports it.
+
+        Returns:
+            Mapping of Green API instance ID to the staged file URL
+        """
+        handles = {}
+        for account in self.accounts.values():
+            instance_id = getattr(account.service, 'instance_id', None)
+            if instance_id:
+                handles[instance_id] = account.service.stage_media(media_url)
+        return handles
+
+    def register_staged_media(self, staged_media):
+        """Hand media staged by another worker to the matching accounts.
+
+        Args:
+            staged_media: Mapping of media URL to the handles returned by stage_media
+        """
+        for account in self.accounts.values():
+            instance_id = getattr(account.service, 'instance_id', None)
+            if not instance_id:
+                continue
+            account.service.register_staged_media({
+                media_url: handles.get(instance_id)
+                for media_url, handles in staged_media.items()
+                if isinstance(handles, dict) and handles.get(instance_id)
+            })
+
+    def send_many(self, messages: List[Dict[str, Any]],
+                  on_result: Optional[Callable[[int, Dict[str, Any]], None]] = None
+                  ) -> List[Dict[str, Any]]:
+        """Send a batch of messages, split across the pool's accounts.
+
+        Args:
+            messages: List of dictionaries with recipient, message and optional media_url
+            on_result: Optional callback called with the index and result of each
+                sent message. It runs on the calling thread, never on the
+                threads sending through the accounts.
+
+        Returns:
+            List of results in the same order as the messages. Messages no
+            account could take have status ``deferred``.
+        """
+        if not messages:
+            return []
+
+        results: List[Optional[Dict[str, Any]]] = [None] * len(messages)
+        groups: Dict[str, List[int]] = {}
+
+        for index, key in enumerate(self.assign([msg.get('recipient') or '' for msg in messages])):
+            if key is None:
+                results[index] = {'status': 'deferred', 'error': 'No healthy WhatsApp account available',
+                                  'retry_after': min((account.breaker.retry_after()
+                                                      for account in self.accounts.values() if account.breaker),
+                                                     default=60)}
+            else:
+                groups.setdefault(key, []).append(index)
+
+        app = current_app._get_current_object() if has_app_context() else None
+        reported = queue.Queue()
+
+        def send_group(key, indexes):
+            # Results are handed to the calling thread, which runs on_result
+            def report(position, result):
+                reported.put((indexes[position], result))
+
+            batch = [messages[index] for index in indexes]
+            try:
+                if app:
+                    with app.app_context():
+                        group_results = self.accounts[key].service.send_many(batch, on_result=report)
+                else:
+                    group_results = self.accounts[key].service.send_many(batch, on_result=report)
+            except Exception as e:
+                logger.error(f"Error sending through {key}: {str(e)}")
+                group_results = [{'status': 'failed', 'error': str(e)}] * len(batch)
+
+            for index, result in zip(indexes, group_results):
+                results[index] = dict(result, sender=key)
+
+        def drain_reported():
+            while True:
+                try:
+                    index, result = reported.get_nowait()
+                except queue.Empty:
+                    return
+                if on_result:
+                    on_result(index, result)
+
+        if groups:
+            with ThreadPoolExecutor(max_workers=len(groups)) as executor:
+                futures = [executor.submit(send_group, key, indexes) for key, indexes in groups.items()]
+                pending = set(futures)
+                while pending:
+                    _, pending = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+                    drain_reported()
+                for future in futures:
+                    future.result()
+
+        drain_reported()
+        return results
+
+    def send_message(self, recipient, message, media_url=None):
+        """Send one message through the recipient's account.
+
+        Returns:
+            Dictionary with status and any relevant information
+        """
+        return self.send_many([{
+            'recipient': recipient,
+            'message': message,
+            'media_url': media_url
+        }])[0]
+
+    def is_connected(self):
+        """Check whether the pool has any account to send through.
+
+        Returns:
+            True if at least one account is available
+        """
+        return bool(self.accounts)
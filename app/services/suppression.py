@@ -0,0 +1,180 @@
+"""In-memory snapshot of the suppression list for senders."""
+
+import json
+import time
+import logging
+import threading
+from typing import Dict, Any, List, Optional
+
+from app import db
+from app.models.suppression import SuppressedRecipient, suppression_key
+from app.utils.redis_client import get_redis
+from app.utils.settings import get_setting
+
+logger = logging.getLogger(__name__)
+
+# Bumped whenever suppressions are lifted, so snapshots reload in full
+VERSION_KEY = 'blastify:suppression:version'
+LOAD_BATCH_SIZE = 10000
+
+
+class SuppressionList:
+    """Set of suppressed recipients held in memory by each process.
+
+    Checking a recipient is a set lookup. The snapshot is refreshed at most
+    every ``SUPPRESSION_SNAPSHOT_TTL`` seconds: new suppressions are loaded
+    by ID, and the whole list is reloaded only when a suppression has been
+    lifted since the last load.
+    """
+
+    def __init__(self, ttl: int = None):
+        """Initialize an empty snapshot.
+
+        Args:
+            ttl: Seconds between refreshes
+        """
+        self.ttl = ttl
+        self.keys = set()
+        self.max_id = 0
+        self.version = None
+        self.loaded_at = None
+        self._lock = threading.Lock()
+
+    def _read_version(self) -> Optional[str]:
+        try:
+            return get_redis().get(VERSION_KEY)
+        except Exception as e:
+            logger.warning(f"Could not read suppression version: {str(e)}")
+            return self.version
+
+    def _load(self, after_id: int) -> None:
+        """Add suppressions with an ID greater than ``after_id`` to the snapshot."""
+        while True:
+            rows = db.session.query(SuppressedRecipient.id, SuppressedRecipient.recipient).filter(
+                SuppressedRecipient.id > after_id
+            ).order_by(SuppressedRecipient.id).limit(LOAD_BATCH_SIZE).all()
+
+            self.keys.update(recipient for _, recipient in rows)
+            if rows:
+                after_id = rows[-1][0]
+                self.max_id = max(self.max_id, after_id)
+            if len(rows) < LOAD_BATCH_SIZE:
+                return
+
+    def refresh(self, force: bool = False) -> None:
+        """Bring the snapshot up to date if it is older than its TTL.
+
+        Args:
+            force: Refresh regardless of the snapshot's age
+        """
+        ttl = self.ttl if self.ttl is not None else get_setting('SUPPRESSION_SNAPSHOT_TTL', 60)
+        if not force and self.loaded_at is not None and time.monotonic() - self.loaded_at < ttl:
+            return
+
+        with self._lock:
+            version = self._read_version()
+            try:
+                if self.loaded_at is None or version != self.version:
+                    self.keys = set()
+                    self.max_id = 0
+                self._load(self.max_id)
+            except Exception as e:
+                logger.error(f"Error loading suppression list: {str(e)}")
+                return
+
+            self.version = version
+            self.loaded_at = time.monotonic()
+
+    def is_suppressed(self, recipient: str) -> bool:
+        """Check whether a recipient is suppressed.
+
+        Args:
+            recipient: Phone number or chat ID
+
+        Returns:
+            True if the recipient must not be messaged
+        """
+        self.refresh()
+        return suppression_key(recipient) in self.keys
+
+    def filter_messages(self, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Drop suppressed and duplicate rows from a bulk send.
+
+        A row is a duplicate when an earlier row has the same recipient
+        (however formatted) and content.
+
+        Args:
+            messages: List of dictionaries with recipient, message and optional media_url
+
+        Returns:
+            Dictionary with the rows to send and the skipped rows' details
+            (recipient, status ``suppressed`` or ``duplicate`` and error)
+        """
+        self.refresh()
+
+        kept = []
+        skipped = []
+        seen = set()
+
+        for msg in messages:
+            if not isinstance(msg, dict):
+                kept.append(msg)
+                continue
+
+            key = suppression_key(msg.get('recipient'))
+
+            if key and key in self.keys:
+                skipped.append({
+                    'recipient': msg.get('recipient'),
+                    'status': 'suppressed',
+                    'error': 'Recipient is on the suppression list'
+                })
+                continue
+
+            identity = (key, msg.get('message'), msg.get('media_url'), msg.get('template_id'),
+                        msg.get('contact_id'), json.dumps(msg.get('variables'), sort_keys=True))
+            if key and identity in seen:
+                skipped.append({
+                    'recipient': msg.get('recipient'),
+                    'status': 'duplicate',
+                    'error': 'Duplicate of an earlier message in the job'
+                })
+                continue
+            seen.add(identity)
+
+            kept.append(msg)
+
+        return {
+            'messages': kept,
+            'skipped': skipped
+        }
+
+
+_suppression_list = None
+
+
+def get_suppression_list() -> SuppressionList:
+    """Get the process-wide suppression snapshot.
+
+    Returns:
+        SuppressionList instance
+    """
+    global _suppression_list
+    if _suppression_list is None:
+        _suppression_list = SuppressionList()
+    return _suppression_list
+
+
+def invalidate_suppression_snapshots() -> None:
+    """Make every process reload its snapshot on its next refresh.
+
+    Called when suppressions are lifted; new suppressions are picked up by
+    the regular refresh without a full reload.
+    """
+    try:
+        get_redis().incr(VERSION_KEY)
+    except Exception as e:
+        logger.warning(f"Could not bump suppression version: {str(e)}")
+
+    if _suppression_list is not None:
+        _suppression_list.loaded_at = None
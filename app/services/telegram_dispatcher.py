@@ -0,0 +1,257 @@
+"""Rate-aware concurrent dispatcher for Telegram broadcasts."""
+
+import heapq
+import asyncio
+import logging
+import itertools
+from collections import deque, defaultdict
+from typing import Dict, Any, List, Optional, Callable
+
+from app.services.rate_limiter import SharedTokenBucket
+from app.services.retry_policy import is_provider_failure
+from app.utils.settings import get_setting
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_API_URL = 'https://api.telegram.org'
+
+
+class TelegramDispatcher:
+    """Send Telegram broadcasts concurrently within the Bot API limits.
+
+    Sends go through a global token bucket (about 30 messages per second per
+    bot) kept in Redis, so the limit holds however many workers broadcast
+    through the same bot, and each chat is paced separately in the
+    dispatcher (about one message per second).
+    Messages to one chat are sent in order, one at a time, while many chats
+    are served in parallel over a pooled HTTP client. A 429 response puts the
+    message back at the head of its chat's queue for ``retry_after`` seconds
+    instead of failing it.
+    """
+
+    def __init__(self, bot_token: str, api_url: str = None, global_rate: float = None,
+                 chat_rate: float = None, max_in_flight: int = None,
+                 max_retries: int = None, timeout: float = None, breaker=None):
+        """Initialize the dispatcher.
+
+        Args:
+            bot_token: The Telegram bot token
+            api_url: Base URL of the Bot API
+            global_rate: Maximum messages per second across all chats
+            chat_rate: Maximum messages per second to a single chat
+            max_in_flight: Maximum number of requests in flight at once
+            max_retries: Maximum number of re-queues after a 429 response
+            timeout: Total timeout per request in seconds
+            breaker: Optional CircuitBreaker for the bot
+        """
+        try:
+            import aiohttp
+            self.aiohttp = aiohttp
+        except ImportError:
+            logger.error("aiohttp package not installed")
+            raise
+
+        self.bot_token = bot_token
+        self.api_url = (api_url or get_setting('TELEGRAM_API_URL', DEFAULT_API_URL)).rstrip('/')
+        self.global_rate = global_rate or get_setting('TELEGRAM_GLOBAL_RATE', 30)
+        self.chat_rate = chat_rate or get_setting('TELEGRAM_CHAT_RATE', 1)
+        self.max_in_flight = max_in_flight or get_setting('TELEGRAM_MAX_IN_FLIGHT', 100)
+        self.max_retries = max_retries if max_retries is not None else get_setting('TELEGRAM_MAX_RETRIES', 5)
+        self.timeout = timeout or get_setting('TELEGRAM_TIMEOUT', 30)
+        self.breaker = breaker
+
+    def rate_limiter(self) -> SharedTokenBucket:
+        """Get the bot-wide send budget, shared by every worker.
+
+        The bucket is named after the bot ID, the part of the token before
+        the colon, so the secret part of the token is not stored in Redis.
+        """
+        return SharedTokenBucket(f"telegram:{self.bot_token.split(':')[0]}", self.global_rate)
+
+    def _build_request(self, msg: Dict[str, Any]):
+        """Choose the Bot API method and payload for a message.
+
+        Args:
+            msg: Dictionary with recipient, message and optional media_url
+
+        Returns:
+            Tuple of (method name, JSON payload)
+        """
+        chat_id = msg.get('recipient')
+        text = msg.get('message')
+        media_url = msg.get('media_url')
+
+        if not media_url:
+            return 'sendMessage', {'chat_id': chat_id, 'text': text}
+
+        media_ext = media_url.split('.')[-1].lower()
+
+        if media_ext in ['jpg', 'jpeg', 'png']:
+            method, field = 'sendPhoto', 'photo'
+        elif media_ext in ['mp4', 'avi', 'mov']:
+            method, field = 'sendVideo', 'video'
+        elif media_ext in ['mp3', 'wav', 'ogg']:
+            method, field = 'sendAudio', 'audio'
+        else:
+            method, field = 'sendDocument', 'document'
+
+        return method, {'chat_id': chat_id, field: media_url, 'caption': text}
+
+    async def _send(self, session, msg: Dict[str, Any]) -> Dict[str, Any]:
+        """Send one message through the Bot API.
+
+        Args:
+            session: The aiohttp session
+            msg: Dictionary with recipient, message and optional media_url
+
+        Returns:
+            Dictionary with status and message ID or error. Rate limited
+            responses include ``retry_after`` in seconds.
+        """
+        method, payload = self._build_request(msg)
+        url = f"{self.api_url}/bot{self.bot_token}/{method}"
+
+        try:
+            async with session.post(url, json=payload) as response:
+                data = await response.json(content_type=None)
+        except asyncio.TimeoutError:
+            return {'status': 'failed', 'error': 'Request timed out'}
+        except (self.aiohttp.ClientError, ValueError) as e:
+            return {'status': 'failed', 'error': str(e)}
+
+        if data.get('ok'):
+            return {'status': 'sent', 'message_id': data['result'].get('message_id')}
+
+        result = {
+            'status': 'failed',
+            'error': data.get('description', 'Unknown error'),
+            'http_status': data.get('error_code')
+        }
+        retry_after = (data.get('parameters') or {}).get('retry_after')
+        if data.get('error_code') == 429 and retry_after is not None:
+            result['retry_after'] = retry_after
+        return result
+
+    async def send_many_async(self, messages: List[Dict[str, Any]],
+                              on_result: Optional[Callable[[int, Dict[str, Any]], None]] = None
+                              ) -> List[Dict[str, Any]]:
+        """Send a batch of messages as fast as the rate limits allow.
+
+        Args:
+            messages: List of dictionaries with recipient (chat ID), message
+                and optional media_url
+            on_result: Optional callback called with the index and result of
+                each message as it completes
+
+        Returns:
+            List of results in the same order as the messages. Messages still
+            queued when the bot's circuit opens have status ``deferred``.
+        """
+        loop = asyncio.get_running_loop()
+        results: List[Optional[Dict[str, Any]]] = [None] * len(messages)
+        global_bucket = self.rate_limiter()
+        chat_interval = 1.0 / self.chat_rate
+
+        # Pending (index, attempts) per chat, and a heap of chats ready to send.
+        # A chat is in the heap only while it has pending messages and none in flight.
+        queues = defaultdict(deque)
+        for index, msg in enumerate(messages):
+            queues[str(msg.get('recipient'))].append((index, 0))
+
+        sequence = itertools.count()
+        ready = [(0.0, next(sequence), chat) for chat in queues]
+        heapq.heapify(ready)
+        in_flight = set()
+
+        async def send_job(session, chat, index, attempts, started):
+            try:
+                result = await self._send(session, messages[index])
+            except Exception as e:
+                logger.error(f"Error sending Telegram message to {chat}: {str(e)}")
+                result = {'status': 'failed', 'error': str(e)}
+
+            # Rate limiting is handled by re-queuing, not counted as an account failure
+            if self.breaker:
+                if 'retry_after' in result:
+                    self.breaker.release()
+                else:
+                    self.breaker.record(not is_provider_failure(result), loop.time() - started)
+
+            next_at = started + chat_interval
+            if 'retry_after' in result and attempts < self.max_retries:
+                logger.warning(f"Telegram rate limited chat {chat}, retrying in {result['retry_after']}s")
+                queues[chat].appendleft((index, attempts + 1))
+                next_at = loop.time() + result['retry_after']
+            else:
+                result.pop('retry_after', None)
+                results[index] = result
+                if on_result:
+                    on_result(index, result)
+
+            if queues[chat]:
+                heapq.heappush(ready, (next_at, next(sequence), chat))
+
+        async with self.aiohttp.ClientSession(
+            connector=self.aiohttp.TCPConnector(limit=self.max_in_flight, keepalive_timeout=60),
+            timeout=self.aiohttp.ClientTimeout(total=self.timeout)
+        ) as session:
+            while ready or in_flight:
+                if not ready or len(in_flight) >= self.max_in_flight:
+                    wait = float('inf')
+                else:
+                    wait = ready[0][0] - loop.time()
+
+                if wait <= 0:
+                    # Defer everything still queued once the bot's circuit opens;
+                    # while sends are in flight, such as a half-open probe, wait for them
+                    if self.breaker and not self.breaker.allow_request():
+                        if in_flight:
+                            await asyncio.wait(set(in_flight), return_when=asyncio.FIRST_COMPLETED)
+                            continue
+                        deferred = self.breaker.deferred_result()
+                        for pending in queues.values():
+                            for index, _ in pending:
+                                results[index] = dict(deferred)
+                            pending.clear()
+                        ready.clear()
+                        continue
+
+                    # Takes a token from the bot-wide budget when one is available;
+                    # otherwise the call allowed by the breaker is handed back
+                    wait = global_bucket.try_acquire()
+                    if wait > 0 and self.breaker:
+                        self.breaker.release()
+
+                if wait > 0:
+                    # Sleep until the next chat is due or a send completes and re-queues
+                    if in_flight:
+                        await asyncio.wait(set(in_flight), return_when=asyncio.FIRST_COMPLETED,
+                                           timeout=None if wait == float('inf') else wait)
+                    else:
+                        await asyncio.sleep(wait)
+                    continue
+
+                _, _, chat = heapq.heappop(ready)
+                index, attempts = queues[chat].popleft()
+
+                task = asyncio.ensure_future(send_job(session, chat, index, attempts, loop.time()))
+                in_flight.add(task)
+                task.add_done_callback(in_flight.discard)
+
+        return results
+
+    def send_many(self, messages, on_result=None):
+        """Send a batch of messages from synchronous code.
+
+        Args:
+            messages: List of dictionaries with recipient (chat ID), message
+                and optional media_url
+            on_result: Optional callback called with the index and result of
+                each message as it completes
+
+        Returns:
+            List of results in the same order as the messages
+        """
+        if not messages:
+            return []
+        return asyncio.run(self.send_many_async(messages, on_result))
@@ -0,0 +1,261 @@
+"""Rendering of message templates with per-recipient variables."""
+
+import re
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Mapping, Tuple
+
+from app import db
+from app.models.contact import Contact
+from app.models.message_queue import MessageTemplate
+from app.utils.settings import get_setting
+
+logger = logging.getLogger(__name__)
+
+# Placeholders look like {name}; anything else in braces is left as written
+PLACEHOLDER = re.compile(r'\{(\w+)\}')
+CONTACT_FIELDS = ('id', 'name', 'phone', 'email', 'group', 'notes')
+
+
+def contact_variables(contact: Optional[Contact]) -> Dict[str, Any]:
+    """Get the template variables provided by a contact.
+
+    Args:
+        contact: The contact, or None
+
+    Returns:
+        Dictionary of contact fields usable as placeholders
+    """
+    if contact is None:
+        return {}
+    return {field: getattr(contact, field) for field in CONTACT_FIELDS}
+
+
+class CompiledTemplate:
+    """Template content split once into literal text and placeholders."""
+
+    def __init__(self, content: str, media_url: str = None):
+        """Compile template content.
+
+        Args:
+            content: Template text with {placeholder} variables
+            media_url: Optional media URL sent with the template
+        """
+        self.media_url = media_url
+        self.parts: List[Tuple[bool, str]] = []
+
+        position = 0
+        for match in PLACEHOLDER.finditer(content or ''):
+            if match.start() > position:
+                self.parts.append((False, content[position:match.start()]))
+            self.parts.append((True, match.group(1)))
+            position = match.end()
+        if position < len(content or ''):
+            self.parts.append((False, content[position:]))
+
+        self.variables = {value for is_variable, value in self.parts if is_variable}
+
+    def render(self, variables: Mapping[str, Any]) -> str:
+        """Render the template for one recipient.
+
+        Placeholders without a value are left as written, so a typo shows up
+        in the message instead of silently disappearing.
+
+        Args:
+            variables: Values for the placeholders
+
+        Returns:
+            The rendered text
+        """
+        rendered = []
+        for is_variable, value in self.parts:
+            if not is_variable:
+                rendered.append(value)
+            elif variables.get(value) is not None:
+                rendered.append(str(variables[value]))
+            else:
+                rendered.append('{' + value + '}')
+        return ''.join(rendered)
+
+    def missing(self, variables: Mapping[str, Any]) -> List[str]:
+        """Get the placeholders that have no value.
+
+        Args:
+            variables: Values for the placeholders
+
+        Returns:
+            Sorted list of placeholder names left unrendered
+        """
+        return sorted(name for name in self.variables if variables.get(name) is None)
+
+
+class TemplateEngine:
+    """LRU cache of compiled templates keyed by template ID and ``updated_at``.
+
+    A template is compiled once per version; editing it changes
+    ``updated_at`` and the next lookup compiles the new content. Unsaved
+    content previewed from the compose form is cached by its text. The
+    least recently used entries are dropped beyond ``TEMPLATE_CACHE_SIZE``.
+    """
+
+    def __init__(self, max_size: int = None):
+        """Initialize an empty cache.
+
+        Args:
+            max_size: Maximum number of compiled templates kept
+        """
+        self.max_size = max_size or get_setting('TEMPLATE_CACHE_SIZE', 256)
+        self._cache: 'OrderedDict[Any, Tuple[Any, CompiledTemplate]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _cached(self, key: Any, version: Any) -> Optional[CompiledTemplate]:
+        with self._lock:
+            cached = self._cache.get(key)
+            if not cached or cached[0] != version:
+                return None
+            self._cache.move_to_end(key)
+            return cached[1]
+
+    def _store(self, key: Any, version: Any, compiled: CompiledTemplate) -> None:
+        with self._lock:
+            self._cache[key] = (version, compiled)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+
+    def compile(self, content: str, media_url: str = None) -> CompiledTemplate:
+        """Compile template content that is not stored, such as a draft.
+
+        Args:
+            content: Template text with {placeholder} variables
+            media_url: Optional media URL sent with the template
+
+        Returns:
+            CompiledTemplate instance
+        """
+        key = ('content', content, media_url)
+        compiled = self._cached(key, None)
+        if compiled is None:
+            compiled = CompiledTemplate(content, media_url)
+            self._store(key, None, compiled)
+        return compiled
+
+    def get(self, template_id: int) -> Optional[CompiledTemplate]:
+        """Get the compiled version of a template.
+
+        Args:
+            template_id: The MessageTemplate ID
+
+        Returns:
+            CompiledTemplate instance, or None if there is no such active template
+        """
+        row = db.session.query(MessageTemplate.updated_at, MessageTemplate.is_active).filter(
+            MessageTemplate.id == template_id
+        ).first()
+        if row is None or row.is_active is False:
+            return None
+
+        compiled = self._cached(template_id, row.updated_at)
+        if compiled is not None:
+            return compiled
+
+        template = MessageTemplate.query.get(template_id)
+        compiled = CompiledTemplate(template.content, template.media_url)
+        self._store(template_id, template.updated_at, compiled)
+        return compiled
+
+    def preview(self, template: CompiledTemplate, contacts: List[Contact],
+                variables: Mapping[str, Any] = None) -> List[Dict[str, Any]]:
+        """Render a template for a list of contacts.
+
+        Args:
+            template: The compiled template
+            contacts: Contacts to render for
+            variables: Optional values that override the contact fields
+
+        Returns:
+            List of dictionaries with contact_id, recipient, content,
+            media_url and the placeholders left unrendered
+        """
+        previews = []
+        for contact in contacts:
+            values = contact_variables(contact)
+            values.update(variables or {})
+            previews.append({
+                'contact_id': contact.id,
+                'recipient': contact.phone,
+                'content': template.render(values),
+                'media_url': template.media_url,
+                'missing': template.missing(values)
+            })
+        return previews
+
+    def render_messages(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Fill in the text of bulk rows that reference a template.
+
+        Rows with a ``template_id`` are rendered with the fields of their
+        ``contact_id`` and any ``variables`` given in the row, which take
+        precedence. All contacts of the batch are loaded with one query.
+        Other rows are returned unchanged.
+
+        Args:
+            messages: List of dictionaries with recipient and either message
+                or template_id (plus optional contact_id and variables)
+
+        Returns:
+            List of message dictionaries in the same order; rows whose
+            template does not exist are returned without a message
+        """
+        if not any(isinstance(msg, dict) and msg.get('template_id') for msg in messages):
+            return messages
+
+        contact_ids = {msg.get('contact_id') for msg in messages
+                       if isinstance(msg, dict) and msg.get('template_id') and msg.get('contact_id')}
+        contacts = {}
+        if contact_ids:
+            contacts = {contact.id: contact for contact in Contact.query.filter(Contact.id.in_(contact_ids))}
+
+        templates = {}
+        rendered = []
+
+        for msg in messages:
+            if not isinstance(msg, dict) or not msg.get('template_id'):
+                rendered.append(msg)
+                continue
+
+            template_id = msg['template_id']
+            if template_id not in templates:
+                templates[template_id] = self.get(template_id)
+            template = templates[template_id]
+
+            if template is None:
+                logger.warning(f"Template {template_id} not found for message to {msg.get('recipient')}")
+                rendered.append(dict(msg, message=None))
+                continue
+
+            variables = contact_variables(contacts.get(msg.get('contact_id')))
+            variables.update(msg.get('variables') or {})
+
+            rendered.append(dict(
+                msg,
+                message=template.render(variables),
+                media_url=msg.get('media_url') or template.media_url
+            ))
+
+        return rendered
+
+
+_engine = None
+
+
+def get_template_engine() -> TemplateEngine:
+    """Get the process-wide template engine.
+
+    Returns:
+        TemplateEngine instance
+    """
+    global _engine
+    if _engine is None:
+        _engine = TemplateEngine()
+    return _engine
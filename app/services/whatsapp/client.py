@@ -1,5 +1,6 @@
 """WhatsApp Web client implementation."""
 
+import os
 import json
 import time
 import logging
@@ -9,7 +10,6 @@ from datetime import datetime
 from typing import Dict, List, Optional, Callable, Any, Union
 
 import websocket
-import requests
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.chrome.service import Service
@@ -22,6 +22,8 @@ from selenium.common.exceptions import TimeoutException, WebDriverException
 from app import db
 from app.models.whatsapp_session import WhatsAppSession, WhatsAppDevice
 from app.utils.qr_generator import generate_qr_code
+from app.services.media_fetcher import get_media_fetcher
+from app.services.events import publish_event, SESSIONS_CHANNEL
 
 logger = logging.getLogger(__name__)
 
@@ -189,6 +191,7 @@ class WhatsAppClient:
             self._connect_websocket()
             
             self.is_connected = True
+            self._publish_status()
             
         except Exception as e:
             logger.error(f"Error handling successful login: {str(e)}")
@@ -380,21 +383,20 @@ class WhatsAppClient:
         Returns:
             Dictionary with send status and message ID if successful
         """
+        media_path = None
         try:
-            # Download media
-            response = requests.get(media_url, stream=True)
-            if response.status_code != 200:
-                return {
-                    "status": "failed",
-                    "error": f"Failed to download media: {response.status_code}"
-                }
+            # Download media to disk (size-capped, with timeouts)
+            download = get_media_fetcher().fetch(media_url)
+            if download.get("status") != "success":
+                return download
             
-            # Get media content and type
-            media_data = response.content
-            media_type = response.headers.get('Content-Type', '').split('/')[0]
+            media_path = download["path"]
+            content_type = download["content_type"]
+            media_type = content_type.split('/')[0]
             
             # Convert to base64
-            media_b64 = base64.b64encode(media_data).decode('utf-8')
+            with open(media_path, 'rb') as f:
+                media_b64 = base64.b64encode(f.read()).decode('utf-8')
             
             # Execute JavaScript to send media message
             result = self.driver.execute_script(
@@ -402,7 +404,7 @@ class WhatsAppClient:
                 return window.WWebJS.sendMessage(
                     "{phone}@c.us",
                     "{caption}",
-                    {{linkPreview: null, media: {{data: "{media_b64}", mimetype: "{response.headers.get('Content-Type')}", type: "{media_type}"}} }}
+                    {{linkPreview: null, media: {{data: "{media_b64}", mimetype: "{content_type}", type: "{media_type}"}} }}
                 );
                 """
             )
@@ -425,6 +427,9 @@ class WhatsAppClient:
                 "status": "failed",
                 "error": str(e)
             }
+        finally:
+            if media_path and os.path.exists(media_path):
+                os.remove(media_path)
     
     def get_qr_code(self) -> Dict[str, Any]:
         """Get the current QR code for authentication.
@@ -511,6 +516,16 @@ class WhatsAppClient:
         if self.session:
             self.session.status = "disconnected"
             db.session.commit()
+            self._publish_status()
         
         self.is_connected = False
-        self.qr_code = None
\ No newline at end of file
+        self.qr_code = None
+    
+    def _publish_status(self) -> None:
+        """Notify event stream subscribers of the session's current status."""
+        publish_event(SESSIONS_CHANNEL, 'session_status', {
+            'session_id': self.session.session_id,
+            'name': self.session.name,
+            'status': self.session.status,
+            'last_connected': self.session.last_connected.isoformat() if self.session.last_connected else None
+        })
\ No newline at end of file
@@ -1,13 +1,20 @@
 """WhatsApp messaging service."""
 
+import time
 import logging
-from datetime import datetime
+from datetime import datetime, timedelta
 from typing import Dict, Any, List, Optional, Union
 
 from app import db
 from app.models.whatsapp_session import WhatsAppSession
-from app.models.message_queue import MessageQueue, MessageStatus
+from app.models.message import Message
+from app.models.message_queue import MessageQueue
 from app.services.whatsapp.client import WhatsAppClient
+from app.services.events import publish_event, DELIVERIES_CHANNEL
+from app.services.fair_queue import FairQueue
+from app.services.suppression import get_suppression_list
+from app.services.circuit_breaker import get_breaker
+from app.services.retry_policy import is_provider_failure
 from app.utils.validators import validate_message_request_new
 from app.utils.phone_formatter import format_phone_for_whatsapp
 
@@ -30,6 +37,8 @@ class WhatsAppMessageService:
             active_sessions = WhatsAppSession.get_active_sessions()
             if active_sessions and active_sessions[0].status == "connected":
                 self.session_id = active_sessions[0].session_id
+        
+        self.breaker = get_breaker(f"whatsapp_web:{self.session_id}") if self.session_id else None
     
     def connect(self) -> Dict[str, Any]:
         """Connect to WhatsApp Web.
@@ -68,53 +77,77 @@ class WhatsAppMessageService:
                 "error": str(e)
             }
     
-    def send_message(self, recipient: str, message: str = None, media_url: str = None) -> Dict[str, Any]:
+    def send_message(self, recipient: str, message: str = None, media_url: str = None,
+                     validated: bool = False, job_id: str = None, record: bool = True) -> Dict[str, Any]:
         """Send a message to a WhatsApp contact.
         
         Args:
             recipient: The phone number to send the message to
             message: The message text to send
             media_url: Optional URL to media to send
+            validated: Whether the bulk validator already checked the message
+                and formatted the recipient (never taken from client input)
+            job_id: The bulk job the message belongs to, if any
+            record: Whether to write the message to the ledger; callers that
+                record the result themselves pass False
             
         Returns:
-            Dictionary with send status and message ID if successful
+            Dictionary with send status and message ID if successful, and
+            the ledger ID as ``record_id`` if it was recorded
         """
-        # Validate request
-        validation = validate_message_request_new({
-            "_use_new_format": True,
-            "recipient": recipient,
-            "message": message,
-            "media_url": media_url
-        })
+        if validated:
+            phone = recipient
+        else:
+            # Validate request
+            validation = validate_message_request_new({
+                "_use_new_format": True,
+                "recipient": recipient,
+                "message": message,
+                "media_url": media_url
+            })
+            
+            if validation.get("status") == "failed":
+                return validation
+            
+            # Format phone number
+            phone = format_phone_for_whatsapp(recipient)
+            if not phone:
+                return {
+                    "status": "failed",
+                    "error": "Invalid phone number"
+                }
         
-        if validation.get("status") == "failed":
-            return validation
+        # Stop calling a session that keeps failing until it recovers
+        if self.breaker and not self.breaker.allow_request():
+            return self.breaker.deferred_result()
         
-        # Format phone number
-        phone = format_phone_for_whatsapp(recipient)
-        if not phone:
-            return {
-                "status": "failed",
-                "error": "Invalid phone number"
-            }
+        started = time.monotonic()
         
         # Connect if not connected
         if not self.client or not self.client.is_connected:
             connect_result = self.connect()
             if connect_result.get("status") == "failed":
+                if self.breaker:
+                    self.breaker.record(False, time.monotonic() - started)
                 return connect_result
         
         # Send message
         result = self.client.send_message(phone, message, media_url)
         
-        # Save message status
-        if result.get("status") == "success":
-            self._save_message_status(phone, message, media_url, result)
+        if self.breaker:
+            self.breaker.record(not is_provider_failure(result), time.monotonic() - started)
+        
+        # Record the attempt in the message ledger
+        if record:
+            ledger_entry = self._record_message(phone, message, media_url, result, job_id=job_id)
+            if ledger_entry:
+                result = dict(result, record_id=ledger_entry.id)
         
         return result
     
     def queue_message(self, recipient: str, message: str = None, media_url: str = None, 
-                     priority: int = 0, scheduled_at: datetime = None) -> Dict[str, Any]:
+                     priority: int = 0, scheduled_at: datetime = None,
+                     owner_id: int = None, campaign_id: int = None) -> Dict[str, Any]:
         """Queue a message to be sent later.
         
         Args:
@@ -123,6 +156,8 @@ class WhatsAppMessageService:
             media_url: Optional URL to media to send
             priority: Message priority (higher number = higher priority)
             scheduled_at: When to send the message (if None, will be sent ASAP)
+            owner_id: ID of the user queuing the message
+            campaign_id: ID of the campaign the message belongs to (None for single sends)
             
         Returns:
             Dictionary with queue status and message ID if successful
@@ -167,6 +202,8 @@ class WhatsAppMessageService:
             # Create queue item
             queue_item = MessageQueue(
                 session_id=session.id,
+                owner_id=owner_id,
+                campaign_id=campaign_id,
                 recipient=phone,
                 message=message,
                 media_url=media_url,
@@ -178,6 +215,12 @@ class WhatsAppMessageService:
             db.session.add(queue_item)
             db.session.commit()
             
+            try:
+                FairQueue.register_flow(session.id, queue_item.priority, owner_id, campaign_id)
+            except Exception as e:
+                # The flow is found when the fair queue next rebuilds its flow list
+                logger.warning(f"Could not register queue flow: {str(e)}")
+            
             return {
                 "status": "success",
                 "message": "Message queued successfully",
@@ -222,85 +265,39 @@ class WhatsAppMessageService:
                 if connect_result.get("status") == "failed":
                     return connect_result
             
-            # Get pending messages
-            pending_messages = MessageQueue.get_pending_messages(session.id, limit)
+            # Get pending messages, shared fairly between users and campaigns
+            try:
+                pending_messages = FairQueue(session.id).select(limit)
+            except Exception as e:
+                logger.warning(f"Fair queue unavailable, using priority order: {str(e)}")
+                pending_messages = MessageQueue.get_pending_messages(session.id, limit)
             
             processed_count = 0
             success_count = 0
             failed_count = 0
+            circuit_open = False
             
             # Process each message
             for queue_item in pending_messages:
-                # Update status to processing
-                queue_item.status = "processing"
-                db.session.commit()
+                # Skip messages another worker has already taken
+                if not MessageQueue.claim(queue_item.id):
+                    continue
+                db.session.refresh(queue_item)
+                
+                result = self.send_queued(queue_item)
                 
-                try:
-                    # Send message
-                    result = self.client.send_message(
-                        queue_item.recipient,
-                        queue_item.message,
-                        queue_item.media_url
-                    )
-                    
-                    processed_count += 1
-                    
-                    if result.get("status") == "success":
-                        # Update status to sent
-                        queue_item.status = "sent"
-                        success_count += 1
-                        
-                        # Save message status
-                        message_status = MessageStatus(
-                            message_id=queue_item.id,
-                            status="sent",
-                            external_id=result.get("message_id")
-                        )
-                        db.session.add(message_status)
-                        
-                    else:
-                        # Update status to failed
-                        queue_item.status = "failed"
-                        queue_item.retry_count += 1
-                        failed_count += 1
-                        
-                        # If retry limit not reached, set back to pending
-                        if queue_item.retry_count < queue_item.max_retries:
-                            queue_item.status = "pending"
-                        
-                        # Save error message
-                        message_status = MessageStatus(
-                            message_id=queue_item.id,
-                            status="failed",
-                            error_message=result.get("error")
-                        )
-                        db.session.add(message_status)
-                    
-                    db.session.commit()
-                    
-                except Exception as e:
-                    logger.error(f"Error processing queue item {queue_item.id}: {str(e)}")
-                    
-                    # Update status to failed
-                    queue_item.status = "failed"
-                    queue_item.retry_count += 1
+                # Leave the rest pending while the session is failing
+                if result.get("status") == "deferred":
+                    circuit_open = True
+                    break
+                
+                processed_count += 1
+                if result.get("status") == "success":
+                    success_count += 1
+                else:
                     failed_count += 1
-                    
-                    # If retry limit not reached, set back to pending
-                    if queue_item.retry_count < queue_item.max_retries:
-                        queue_item.status = "pending"
-                    
-                    # Save error message
-                    message_status = MessageStatus(
-                        message_id=queue_item.id,
-                        status="failed",
-                        error_message=str(e)
-                    )
-                    db.session.add(message_status)
-                    
-                    db.session.commit()
             
-            return {
+            result = {
                 "status": "success",
                 "message": f"Processed {processed_count} messages",
                 "processed_count": processed_count,
@@ -308,6 +305,12 @@ class WhatsAppMessageService:
                 "failed_count": failed_count
             }
             
+            if circuit_open:
+                result["circuit_open"] = True
+                result["retry_after"] = self.breaker.retry_after()
+            
+            return result
+            
         except Exception as e:
             logger.error(f"Error processing queue: {str(e)}")
             return {
@@ -315,44 +318,136 @@ class WhatsAppMessageService:
                 "error": str(e)
             }
     
-    def _save_message_status(self, recipient: str, message: str, media_url: str, result: Dict[str, Any]) -> None:
-        """Save message status to database.
+    def send_queued(self, queue_item: MessageQueue) -> Dict[str, Any]:
+        """Send a queued message that has been claimed for processing.
+        
+        On success the message is marked sent. On failure it is scheduled for
+        a retry or marked failed. If the session's circuit is open the message
+        is put back to pending until the circuit can be probed again. Messages
+        to suppressed recipients are marked failed without being sent.
+        
+        Args:
+            queue_item: The claimed queue item
+            
+        Returns:
+            Dictionary with send status and message ID if successful
+        """
+        if get_suppression_list().is_suppressed(queue_item.recipient):
+            result = {"status": "failed", "error": "Recipient is on the suppression list"}
+            queue_item.status = "failed"
+            queue_item.next_attempt_at = None
+            self._record_message(queue_item.recipient, queue_item.message, queue_item.media_url,
+                                 result, queue_item=queue_item)
+            return result
+        
+        if self.breaker and not self.breaker.allow_request():
+            result = self.breaker.deferred_result()
+            queue_item.status = "pending"
+            queue_item.next_attempt_at = datetime.utcnow() + timedelta(seconds=result["retry_after"])
+            db.session.commit()
+            return result
+        
+        started = time.monotonic()
+        
+        try:
+            result = None
+            
+            # Connect if not connected
+            if not self.client or not self.client.is_connected:
+                connect_result = self.connect()
+                if connect_result.get("status") == "failed":
+                    result = connect_result
+            
+            # Send message
+            if result is None:
+                result = self.client.send_message(
+                    queue_item.recipient,
+                    queue_item.message,
+                    queue_item.media_url
+                )
+        except Exception as e:
+            logger.error(f"Error processing queue item {queue_item.id}: {str(e)}")
+            result = {"status": "failed", "error": str(e)}
+        
+        if self.breaker:
+            self.breaker.record(not is_provider_failure(result), time.monotonic() - started)
+        
+        if result.get("status") == "success":
+            # Update status to sent
+            queue_item.status = "sent"
+            queue_item.next_attempt_at = None
+        else:
+            # Back to pending with a delayed retry, or failed if out of retries
+            queue_item.schedule_retry(result)
+        
+        # The ledger gets the final outcome; attempts that will be retried
+        # only update the queue item
+        if queue_item.status == "pending":
+            try:
+                db.session.commit()
+            except Exception as e:
+                logger.error(f"Error saving status of queue item {queue_item.id}: {str(e)}")
+                db.session.rollback()
+        else:
+            self._record_message(queue_item.recipient, queue_item.message, queue_item.media_url,
+                                 result, queue_item=queue_item)
+        
+        return result
+    
+    def _record_message(self, recipient: str, message: str, media_url: str, result: Dict[str, Any],
+                        queue_item: MessageQueue = None, job_id: str = None) -> Optional[Message]:
+        """Write a send attempt to the message ledger.
+        
+        The ledger row is the only record written per message; it is
+        committed together with any change to the queue item. Attempts
+        refused by an open circuit were never made and are not recorded.
         
         Args:
             recipient: The phone number the message was sent to
             message: The message text that was sent
             media_url: The media URL that was sent (if any)
             result: The result of sending the message
+            queue_item: The queue item the message was sent for, if any
+            job_id: The bulk job the message belongs to, if any
+            
+        Returns:
+            The saved Message, or None if nothing was recorded
         """
+        if result.get("status") == "deferred":
+            return None
+        
         try:
-            # Get session
-            session = WhatsAppSession.get_session_by_id(self.session_id)
-            if not session:
-                logger.error(f"Session with ID '{self.session_id}' not found")
-                return
-            
-            # Create queue item (for record keeping)
-            queue_item = MessageQueue(
-                session_id=session.id,
-                recipient=recipient,
-                message=message,
-                media_url=media_url,
-                status="sent"
+            ledger_entry = Message.from_result(
+                "whatsapp", recipient, message, media_url, result,
+                session_id=self.session_id,
+                job_id=job_id,
+                queue_id=queue_item.id if queue_item else None,
+                campaign_id=queue_item.campaign_id if queue_item else None
             )
-            
-            db.session.add(queue_item)
-            db.session.commit()
-            
-            # Create status record
-            message_status = MessageStatus(
-                message_id=queue_item.id,
-                status="sent",
-                external_id=result.get("message_id")
-            )
-            
-            db.session.add(message_status)
+            db.session.add(ledger_entry)
             db.session.commit()
+            self._publish_delivery(ledger_entry, queue_item)
+            return ledger_entry
             
         except Exception as e:
-            logger.error(f"Error saving message status: {str(e)}")
-            db.session.rollback()
\ No newline at end of file
+            logger.error(f"Error recording message to {recipient}: {str(e)}")
+            db.session.rollback()
+            return None
+    
+    def _publish_delivery(self, ledger_entry: Message, queue_item: MessageQueue = None) -> None:
+        """Notify event stream subscribers of a message status change.
+        
+        Args:
+            ledger_entry: The message ledger row that was just saved
+            queue_item: The queued message, if the message was queued
+        """
+        publish_event(DELIVERIES_CHANNEL, 'delivery', {
+            'message_id': ledger_entry.id,
+            'queue_id': queue_item.id if queue_item else None,
+            'session_id': self.session_id,
+            'recipient': ledger_entry.recipient,
+            'status': ledger_entry.status,
+            'queue_status': queue_item.status if queue_item else None,
+            'external_id': ledger_entry.external_id,
+            'error': ledger_entry.error_message
+        })
\ No newline at end of file
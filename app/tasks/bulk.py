@@ -0,0 +1,104 @@
+"""Helpers shared by the chunked bulk send tasks."""
+
+from typing import List, Dict, Any, Iterator, Tuple, Optional, Callable
+
+
+def chunked(items: List[Any], size: int) -> Iterator[List[Any]]:
+    """Split a list into consecutive chunks.
+
+    Args:
+        items: The list to split
+        size: Maximum number of items per chunk
+
+    Returns:
+        Iterator over lists of at most ``size`` items
+    """
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def merge_chunk_results(chunk_results: List[Dict[str, Any]], total: int,
+                        job_id: str = None, skipped: int = 0) -> Dict[str, Any]:
+    """Combine the counters of chunk tasks into a single bulk result.
+
+    Per-recipient details are stored in ``BulkJobResult`` by the chunk tasks,
+    so the merged result stays the same size however large the job is.
+
+    Args:
+        chunk_results: Results returned by the chunk tasks
+        total: Total number of messages in the bulk job
+        job_id: The bulk job ID the details are stored under
+        skipped: Number of suppressed or duplicate messages dropped before sending
+
+    Returns:
+        Dictionary with results summary
+    """
+    results = {
+        'job_id': job_id,
+        'total': total,
+        'successful': 0,
+        'failed': 0,
+        'skipped': skipped,
+        'chunks': len(chunk_results)
+    }
+
+    for chunk_result in chunk_results:
+        results['successful'] += chunk_result.get('successful', 0)
+        results['failed'] += chunk_result.get('failed', 0)
+
+    return results
+
+
+def split_deferred(messages: List[Dict[str, Any]], send_results: List[Dict[str, Any]]
+                   ) -> Tuple[List[Tuple[Dict[str, Any], Dict[str, Any]]], List[Dict[str, Any]], float]:
+    """Separate messages refused by an open circuit from those that were attempted.
+
+    Args:
+        messages: The messages passed to ``send_many``
+        send_results: The results returned by ``send_many``
+
+    Returns:
+        Tuple of (attempted (message, result) pairs, deferred messages,
+        seconds to wait before retrying the deferred messages)
+    """
+    attempted = []
+    deferred = []
+    retry_after = 0
+
+    for msg, result in zip(messages, send_results):
+        if result.get('status') == 'deferred':
+            deferred.append(msg)
+            retry_after = max(retry_after, result.get('retry_after') or 0)
+        else:
+            attempted.append((msg, result))
+
+    return attempted, deferred, retry_after
+
+
+def send_once(message_service, messages: List[Dict[str, Any]], ledger,
+              on_result: Optional[Callable[[int, Dict[str, Any]], None]] = None) -> List[Dict[str, Any]]:
+    """Send a batch, skipping messages an earlier attempt of the job already sent.
+
+    Messages found in the ledger are answered with their recorded result and
+    are not passed to the provider again. Each new successful send is
+    recorded as soon as it completes.
+
+    Args:
+        message_service: The service to send with
+        messages: List of message dictionaries
+        ledger: The job's SendLedger
+        on_result: Optional callback called with each new send result
+
+    Returns:
+        List of results in the same order as the messages
+    """
+    previous = ledger.lookup(messages)
+    fresh = [msg for msg, result in zip(messages, previous) if result is None]
+
+    def record(index, result):
+        ledger.record(fresh[index], result)
+        if on_result:
+            on_result(index, result)
+
+    fresh_results = iter(message_service.send_many(fresh, on_result=record) if fresh else [])
+    return [result or next(fresh_results) for result in previous]
@@ -1,10 +1,19 @@
 """Celery tasks for asynchronous message processing."""
 
-import time
 import logging
-from celery import Celery
+from datetime import datetime
+from celery import Celery, chord
+from celery.exceptions import Ignore, Retry
 from app.services.message_service import MessageService
+from app.services.job_progress import JobProgress, ProgressReporter
+from app.services.events import publish_event, job_channel
 from app.models.message import Message
+from app.models.campaign import Campaign, CampaignRecipient
+from app.models.bulk_job import BulkJobResult
+from app.services.send_ledger import SendLedger
+from app.services.suppression import get_suppression_list
+from app.services.template_engine import get_template_engine
+from app.tasks.bulk import chunked, merge_chunk_results, split_deferred, send_once
 from app import create_app, db
 
 logger = logging.getLogger(__name__)
@@ -20,6 +29,11 @@ celery.conf.update(app.config)
 def send_bulk_messages_task(self, platform, messages):
     """Send multiple messages asynchronously.
     
+    The job is split into chunks of ``BULK_CHUNK_SIZE`` messages that run as
+    separate tasks across the worker pool. A chord callback aggregates the
+    chunk results under this task's ID. Suppressed recipients and repeated
+    rows are dropped first and recorded as skipped in the job's details.
+    
     Args:
         platform: The messaging platform to use
         messages: List of message dictionaries with recipient and message text
@@ -29,83 +43,400 @@ def send_bulk_messages_task(self, platform, messages):
     """
     logger.info(f"Starting bulk send task for {len(messages)} messages on {platform}")
     
+    if not messages:
+        return merge_chunk_results([], 0, job_id=self.request.id)
+    
+    total = len(messages)
+    
+    try:
+        # Drop suppressed recipients and repeated rows before anything is sent
+        with app.app_context():
+            filtered = get_suppression_list().filter_messages(messages)
+            messages = filtered['messages']
+            skipped = len(filtered['skipped'])
+            BulkJobResult.record(self.request.id, filtered['skipped'])
+        
+        if not messages:
+            return merge_chunk_results([], total, job_id=self.request.id, skipped=skipped)
+        
+        # Upload each distinct media file once so every chunk reuses it
+        staged_media = {}
+        media_urls = {msg.get('media_url') for msg in messages if msg.get('media_url')}
+        if media_urls:
+            with app.app_context():
+                message_service = MessageService.create(platform)
+                staged_media = {url: message_service.stage_media(url) for url in media_urls}
+        
+        JobProgress(self.request.id).start(len(messages))
+        
+        chunk_size = app.config.get('BULK_CHUNK_SIZE', 100)
+        header = [
+            send_bulk_chunk_task.s(platform, chunk, staged_media, job_id=self.request.id)
+            for chunk in chunked(messages, chunk_size)
+        ]
+        
+        return self.replace(chord(header, aggregate_bulk_results_task.s(
+            total=total, job_id=self.request.id, skipped=skipped
+        )))
+        
+    except Ignore:
+        raise
+    except Exception as e:
+        logger.error(f"Bulk send task failed: {str(e)}")
+        self.retry(exc=e)
+
+@celery.task(bind=True, max_retries=3, default_retry_delay=60,
+             acks_late=True, reject_on_worker_lost=True)
+def send_bulk_chunk_task(self, platform, messages, staged_media=None, job_id=None, carried=None):
+    """Send one chunk of a bulk job.
+    
+    A retry only re-runs this chunk; chunks that already finished are not
+    sent again. Per-recipient outcomes are written to ``BulkJobResult`` and
+    only counters are returned. If the provider account's circuit opens,
+    the messages not yet sent are retried once it is expected to recover.
+    The task is acknowledged only when it finishes, so a chunk whose worker
+    dies is delivered again; messages it already sent are not sent twice.
+    
+    Args:
+        platform: The messaging platform to use
+        messages: List of message dictionaries with recipient and message text
+            (or template_id with optional contact_id and variables)
+        staged_media: Mapping of media URL to the handle staged for the job
+        job_id: The bulk job ID to store per-recipient outcomes under
+        carried: Counters from earlier attempts of a deferred chunk
+        
+    Returns:
+        Dictionary with the chunk's counters
+    """
     results = {
         'total': len(messages),
         'successful': 0,
-        'failed': 0,
-        'details': []
+        'failed': 0
     }
+    if carried:
+        results.update(carried)
+    details = []
+    reporter = ProgressReporter(job_id)
     
     try:
-        # Create message service
-        message_service = MessageService.create(platform)
+        # Create message service and render rows that reference a template
+        with app.app_context():
+            message_service = MessageService.create(platform)
+            messages = get_template_engine().render_messages(messages)
+        
+        if staged_media:
+            message_service.register_staged_media(staged_media)
         
-        # Process each message
+        to_send = []
         for msg_data in messages:
-            try:
-                # Get message details
-                recipient = msg_data.get('recipient')
-                message_text = msg_data.get('message')
-                media_url = msg_data.get('media_url')
-                
-                if not recipient or not message_text:
-                    logger.warning(f"Skipping message with missing data: {msg_data}")
-                    results['failed'] += 1
-                    results['details'].append({
-                        'recipient': recipient,
-                        'status': 'failed',
-                        'error': 'Missing required data'
-                    })
-                    continue
-                
-                # Send message
-                result = message_service.send_message(
-                    recipient=recipient,
-                    message=message_text,
-                    media_url=media_url
+            if not msg_data.get('recipient') or not msg_data.get('message'):
+                logger.warning(f"Skipping message with missing data: {msg_data}")
+                results['failed'] += 1
+                reporter.record(False)
+                details.append({
+                    'recipient': msg_data.get('recipient'),
+                    'status': 'failed',
+                    'error': 'Missing required data'
+                })
+                continue
+            to_send.append(msg_data)
+        
+        # Send the chunk; concurrent services keep many requests in flight.
+        # Messages a failed earlier attempt already sent are not sent again.
+        with app.app_context():
+            send_results = send_once(
+                message_service,
+                to_send,
+                SendLedger(job_id or self.request.id),
+                on_result=lambda index, result: reporter.record(result.get('status') in ['queued', 'sent'])
+            )
+        
+        attempted, deferred, retry_after = split_deferred(to_send, send_results)
+        max_deferrals = app.config.get('CIRCUIT_MAX_DEFERRALS', 20)
+        
+        if deferred and self.request.retries >= max_deferrals:
+            # The account did not recover in time; give up on the rest
+            for msg_data in deferred:
+                attempted.append((msg_data, {'status': 'failed', 'error': 'Provider unavailable (circuit open)'}))
+                reporter.record(False)
+            deferred = []
+        
+        # Save all messages of the chunk in one transaction
+        with app.app_context():
+            saved = []
+            for msg_data, result in attempted:
+                message = Message.from_result(
+                    platform,
+                    msg_data.get('recipient'),
+                    msg_data.get('message'),
+                    msg_data.get('media_url'),
+                    result,
+                    job_id=job_id or self.request.id
                 )
-                
-                # Create app context for database operations
-                with app.app_context():
-                    # Save to database
-                    message = Message(
-                        platform=platform,
-                        recipient=recipient,
-                        message_text=message_text,
-                        media_url=media_url,
-                        status=result.get('status', 'unknown'),
-                        external_id=result.get('message_sid') or result.get('message_id')
-                    )
-                    db.session.add(message)
-                    db.session.commit()
-                
-                # Update results
+                db.session.add(message)
+                saved.append(message)
+            db.session.commit()
+            
+            for message, (_, result) in zip(saved, attempted):
                 if result.get('status') in ['queued', 'sent']:
                     results['successful'] += 1
                 else:
                     results['failed'] += 1
-                    
-                results['details'].append({
-                    'recipient': recipient,
+                
+                details.append({
+                    'recipient': message.recipient,
                     'status': result.get('status', 'unknown'),
                     'message_id': message.id,
-                    'external_id': result.get('message_sid') or result.get('message_id')
-                })
-                
-                # Add a small delay to avoid rate limiting
-                time.sleep(0.2)
-                
-            except Exception as e:
-                logger.error(f"Error processing message to {recipient}: {str(e)}")
-                results['failed'] += 1
-                results['details'].append({
-                    'recipient': recipient,
-                    'status': 'failed',
-                    'error': str(e)
+                    'external_id': message.external_id,
+                    'error': result.get('error')
                 })
         
+        reporter.flush()
+        
+        with app.app_context():
+            BulkJobResult.record(job_id or self.request.id, details)
+        
+        if deferred:
+            logger.warning(f"Circuit open, deferring {len(deferred)} messages for {retry_after:.0f}s")
+            raise self.retry(
+                args=(platform, deferred, staged_media),
+                kwargs={'job_id': job_id, 'carried': results},
+                countdown=max(retry_after, 1),
+                max_retries=max_deferrals
+            )
+        
         return results
         
+    except Retry:
+        raise
     except Exception as e:
-        logger.error(f"Bulk send task failed: {str(e)}")
-        self.retry(exc=e)
\ No newline at end of file
+        logger.error(f"Bulk send chunk failed: {str(e)}")
+        self.retry(exc=e)
+
+@celery.task
+def aggregate_bulk_results_task(chunk_results, total, job_id=None, skipped=0):
+    """Aggregate chunk results into the bulk job result.
+    
+    Args:
+        chunk_results: Results returned by the chunk tasks
+        total: Total number of messages in the bulk job
+        job_id: The bulk job ID the details are stored under
+        skipped: Number of suppressed or duplicate messages dropped before sending
+        
+    Returns:
+        Dictionary with results summary
+    """
+    results = merge_chunk_results(chunk_results, total, job_id=job_id, skipped=skipped)
+    if job_id:
+        publish_event(job_channel(job_id), 'completed', results)
+    return results
+
+
+def _campaign_stop_reason(campaign, task_id):
+    """Get the reason a campaign task has to stop, or None if it may go on.
+    
+    A task stops when the campaign was claimed by another task or is no
+    longer running. A pause requested while the task was sending is
+    completed here, which makes the campaign resumable only once this
+    task has stopped.
+    
+    Args:
+        campaign: The refreshed Campaign instance
+        task_id: ID of the task asking
+        
+    Returns:
+        The status to report when stopping, or None
+    """
+    if campaign.task_id != task_id:
+        return 'superseded'
+    
+    if campaign.status == 'pausing':
+        Campaign.query.filter_by(id=campaign.id, task_id=task_id, status='pausing').update(
+            {Campaign.status: 'paused'}, synchronize_session=False
+        )
+        db.session.commit()
+        db.session.refresh(campaign)
+        return campaign.status
+    
+    if campaign.status != 'running':
+        return campaign.status
+    
+    return None
+
+@celery.task(bind=True, max_retries=3, default_retry_delay=60,
+             acks_late=True, reject_on_worker_lost=True)
+def send_campaign_task(self, campaign_id, page_size=500):
+    """Send a campaign by paging through its materialized recipient list.
+    
+    Only the campaign ID travels through the broker. Recipients are read in
+    ID ranges of ``page_size`` and the campaign status is checked between
+    pages, so a paused campaign stops and a resumed one continues with the
+    recipients that are still pending. The task only sends while it is the
+    campaign's current task; starting or resuming a campaign claims it for
+    a new task ID.
+    
+    Each page is committed when it finishes, and the task is acknowledged
+    only when it ends. A campaign whose worker dies is delivered again and
+    continues from the first unfinished page; recipients of that page who
+    were already sent are answered from the send ledger.
+    
+    A campaign with a template is rendered per recipient from the fields of
+    the recipient's contact; the contacts of a page are loaded in one query.
+    
+    Args:
+        campaign_id: The ID of the campaign to send
+        page_size: Width of the recipient ID range processed per page
+        
+    Returns:
+        Dictionary with results summary
+    """
+    logger.info(f"Starting campaign send task for campaign {campaign_id}")
+    
+    results = {
+        'campaign_id': campaign_id,
+        'successful': 0,
+        'failed': 0,
+        'skipped': 0
+    }
+    
+    try:
+        with app.app_context():
+            campaign = Campaign.query.get(campaign_id)
+            stop_reason = _campaign_stop_reason(campaign, self.request.id) if campaign else 'not_found'
+            if stop_reason:
+                logger.warning(f"Campaign {campaign_id} is {stop_reason} for task {self.request.id}, nothing to send")
+                results['status'] = stop_reason
+                return results
+            
+            message_service = MessageService.create(campaign.platform)
+            
+            # Templated campaigns are rendered per recipient from the contact's fields
+            templates = get_template_engine()
+            template = templates.get(campaign.template_id) if campaign.template_id else None
+            if campaign.template_id and not template:
+                # Pause rather than fail so the campaign can resume once the template is fixed
+                logger.error(f"Template {campaign.template_id} of campaign {campaign_id} not found, pausing")
+                campaign.status = 'paused'
+                db.session.commit()
+                results['status'] = 'paused'
+                return results
+            
+            media_url = campaign.media_url or (template.media_url if template else None)
+            if media_url:
+                message_service.stage_media(media_url)
+            
+            min_id, max_id = CampaignRecipient.get_pending_id_range(campaign_id)
+            
+            # A retried or redelivered run continues the same job, so keep the original total
+            progress = JobProgress(self.request.id)
+            if not progress.snapshot():
+                progress.start(campaign.get_recipient_stats().get('pending', 0))
+            reporter = ProgressReporter(self.request.id)
+            ledger = SendLedger(f"campaign:{campaign_id}")
+            suppressions = get_suppression_list()
+            
+            if min_id is not None:
+                for start_id in range(min_id, max_id + 1, page_size):
+                    # Stop between pages if the campaign was paused, cancelled or restarted
+                    db.session.refresh(campaign)
+                    stop_reason = _campaign_stop_reason(campaign, self.request.id)
+                    if stop_reason:
+                        logger.info(f"Campaign {campaign_id} is {stop_reason}, stopping")
+                        results['status'] = stop_reason
+                        return results
+                    
+                    page = CampaignRecipient.get_pending_page(campaign_id, start_id, start_id + page_size - 1)
+                    
+                    # Recipients who opted out after the campaign was built are not sent
+                    sendable = []
+                    for recipient in page:
+                        if suppressions.is_suppressed(recipient.recipient):
+                            recipient.status = 'suppressed'
+                            recipient.error_message = 'Recipient is on the suppression list'
+                            results['skipped'] += 1
+                            reporter.record(False)
+                        else:
+                            sendable.append(recipient)
+                    page = sendable
+                    
+                    outgoing = [{
+                        'recipient': recipient.recipient,
+                        'message': campaign.message,
+                        'media_url': campaign.media_url
+                    } for recipient in page]
+                    
+                    if template:
+                        outgoing = templates.render_messages([
+                            dict(msg, template_id=campaign.template_id, contact_id=recipient.contact_id)
+                            for msg, recipient in zip(outgoing, page)
+                        ])
+                    
+                    send_results = send_once(message_service, outgoing, ledger)
+                    
+                    # Recipients refused by an open circuit stay pending for the retry
+                    attempted, deferred, retry_after = split_deferred(list(zip(page, outgoing)), send_results)
+                    
+                    for (recipient, msg), result in attempted:
+                        external_id = result.get('message_sid') or result.get('message_id')
+                        
+                        if result.get('status') in ['queued', 'sent']:
+                            recipient.status = 'sent'
+                            recipient.sent_at = datetime.utcnow()
+                            results['successful'] += 1
+                            reporter.record(True)
+                        else:
+                            recipient.status = 'failed'
+                            results['failed'] += 1
+                            reporter.record(False)
+                        recipient.external_id = external_id
+                        recipient.error_message = result.get('error')
+                        
+                        db.session.add(Message.from_result(
+                            campaign.platform,
+                            recipient.recipient,
+                            msg.get('message'),
+                            msg.get('media_url'),
+                            result,
+                            campaign_id=campaign.id,
+                            job_id=self.request.id
+                        ))
+                    
+                    db.session.commit()
+                    reporter.flush()
+                    
+                    if deferred:
+                        logger.warning(f"Circuit open, pausing campaign {campaign_id} for {retry_after:.0f}s")
+                        raise self.retry(
+                            countdown=max(retry_after, 1),
+                            max_retries=app.config.get('CIRCUIT_MAX_DEFERRALS', 20)
+                        )
+            
+            # Only the campaign's current task completes it
+            completed = Campaign.query.filter(
+                Campaign.id == campaign_id,
+                Campaign.task_id == self.request.id,
+                Campaign.status.in_(['running', 'pausing'])
+            ).update({
+                Campaign.status: 'completed',
+                Campaign.completed_at: datetime.utcnow()
+            }, synchronize_session=False)
+            db.session.commit()
+            
+            results['status'] = 'completed' if completed else 'superseded'
+            return results
+        
+    except Retry:
+        raise
+    except Exception as e:
+        logger.error(f"Campaign send task failed: {str(e)}")
+        if self.request.retries >= self.max_retries:
+            # Out of retries: leave the campaign paused so it can be resumed
+            with app.app_context():
+                db.session.rollback()
+                Campaign.query.filter(
+                    Campaign.id == campaign_id,
+                    Campaign.task_id == self.request.id,
+                    Campaign.status.in_(['running', 'pausing'])
+                ).update({Campaign.status: 'paused'}, synchronize_session=False)
+                db.session.commit()
+        self.retry(exc=e)
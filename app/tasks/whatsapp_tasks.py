@@ -1,16 +1,32 @@
 """Celery tasks for asynchronous WhatsApp message processing."""
 
+import os
 import time
+import socket
 import logging
+from datetime import datetime, timedelta
 from typing import List, Dict, Any, Optional
-from celery import Celery, Task
-from flask import current_app
+from celery import Celery, Task, chord
+from celery.exceptions import Ignore, Retry
+from flask import current_app, has_app_context
 
 # Remove the import of create_app, just keep db
 from app import db
 from app.models.whatsapp_session import WhatsAppSession
 from app.models.message_queue import MessageQueue
+from app.models.bulk_job import BulkJobResult
+from app.models.idempotency_key import IdempotencyKey
 from app.services.whatsapp.message import WhatsAppMessageService
+from app.services.job_progress import JobProgress, ProgressReporter
+from app.services.events import publish_event, job_channel, DELIVERIES_CHANNEL
+from app.services.send_ledger import SendLedger
+from app.services.checkpoint import TaskCheckpoint
+from app.services.suppression import get_suppression_list
+from app.services.template_engine import get_template_engine
+from app.services.receipts import ReceiptStream
+from app.services.reconciliation import ReceiptReconciler
+from app.tasks.bulk import chunked, merge_chunk_results
+from app.utils.redis_client import acquire_lock, refresh_lock, release_lock
 
 logger = logging.getLogger(__name__)
 
@@ -25,14 +41,63 @@ celery.conf.update({
     'accept_content': ['json'],
     'result_serializer': 'json',
     'enable_utc': True,
+    # Tasks acknowledged late are redelivered if still unacknowledged after
+    # this long, so it must exceed the longest chunk
+    'broker_transport_options': {'visibility_timeout': 12 * 60 * 60},
+    # Start queue drains for every active session; run with `celery beat`
+    'beat_schedule': {
+        'dispatch-queue-drains': {
+            'task': 'app.tasks.whatsapp_tasks.dispatch_queue_drains_task',
+            'schedule': float(os.environ.get('WHATSAPP_DRAIN_INTERVAL') or 10),
+        },
+        'apply-receipts': {
+            'task': 'app.tasks.whatsapp_tasks.apply_receipts_task',
+            'schedule': float(os.environ.get('RECEIPT_CONSUME_INTERVAL') or 5),
+        },
+        'release-stale-claims': {
+            'task': 'app.tasks.whatsapp_tasks.release_stale_claims_task',
+            'schedule': float(os.environ.get('QUEUE_CLAIM_SWEEP_INTERVAL') or 60),
+        },
+        'purge-idempotency-keys': {
+            'task': 'app.tasks.whatsapp_tasks.purge_idempotency_keys_task',
+            'schedule': float(os.environ.get('IDEMPOTENCY_PURGE_INTERVAL') or 60 * 60),
+        },
+    },
 })
 
 
+_flask_app = None
+
+
+def get_flask_app():
+    """Get the Flask application used by the worker.
+    
+    The app is created lazily because this module is imported while the
+    application itself is being created.
+    
+    Returns:
+        Flask application instance
+    """
+    global _flask_app
+    if _flask_app is None:
+        from app import create_app
+        _flask_app = create_app()
+    return _flask_app
+
+
 class WhatsAppTask(Task):
     """Base task for WhatsApp operations."""
     
     _whatsapp_services = {}
     
+    def __call__(self, *args, **kwargs):
+        """Run the task inside a Flask application context."""
+        if has_app_context():
+            return self.run(*args, **kwargs)
+        
+        with get_flask_app().app_context():
+            return self.run(*args, **kwargs)
+    
     def get_whatsapp_service(self, session_id: Optional[str] = None) -> WhatsAppMessageService:
         """Get or create a WhatsApp service instance.
         
@@ -66,6 +131,11 @@ def send_bulk_messages_task(self, session_id: Optional[str], messages: List[Dict
                           rate_limit_ms: int = 200) -> Dict[str, Any]:
     """Send multiple WhatsApp messages asynchronously.
     
+    The job is split into chunks of ``BULK_CHUNK_SIZE`` messages that run as
+    separate tasks across the worker pool. A chord callback aggregates the
+    chunk results under this task's ID. Suppressed recipients and repeated
+    rows are dropped first and recorded as skipped in the job's details.
+    
     Args:
         session_id: The WhatsApp session ID to use (if None, will use first active session)
         messages: List of message dictionaries with recipient, message text, and optional media_url
@@ -76,19 +146,114 @@ def send_bulk_messages_task(self, session_id: Optional[str], messages: List[Dict
     """
     logger.info(f"Starting WhatsApp bulk send task for {len(messages)} messages")
     
+    if not messages:
+        return merge_chunk_results([], 0, job_id=self.request.id)
+    
+    total = len(messages)
+    
+    try:
+        # Drop suppressed recipients and repeated rows before anything is sent
+        filtered = get_suppression_list().filter_messages(messages)
+        messages = filtered['messages']
+        skipped = len(filtered['skipped'])
+        BulkJobResult.record(self.request.id, filtered['skipped'])
+        
+        if not messages:
+            return merge_chunk_results([], total, job_id=self.request.id, skipped=skipped)
+        
+        JobProgress(self.request.id).start(len(messages))
+        
+        chunk_size = current_app.config.get('BULK_CHUNK_SIZE', 100)
+        header = [
+            send_bulk_chunk_task.s(session_id, chunk, rate_limit_ms, job_id=self.request.id)
+            for chunk in chunked(messages, chunk_size)
+        ]
+        
+        return self.replace(chord(header, aggregate_bulk_results_task.s(
+            total=total, job_id=self.request.id, skipped=skipped
+        )))
+        
+    except Ignore:
+        raise
+    except Exception as e:
+        logger.error(f"WhatsApp bulk send task failed: {str(e)}")
+        self.retry(exc=e)
+
+
+@celery.task(bind=True, base=WhatsAppTask, max_retries=3, default_retry_delay=60,
+             acks_late=True, reject_on_worker_lost=True)
+def send_bulk_chunk_task(self, session_id: Optional[str], messages: List[Dict[str, Any]], 
+                         rate_limit_ms: int = 200, job_id: Optional[str] = None,
+                         carried: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Send one chunk of a WhatsApp bulk job.
+    
+    A retry only re-runs this chunk; chunks that already finished are not
+    sent again. Per-recipient outcomes are written to ``BulkJobResult`` and
+    only counters are returned. If the session's circuit opens, the messages
+    not yet sent are retried once it is expected to recover.
+    
+    Every ``BULK_CHECKPOINT_EVERY`` messages the outcomes so far are stored
+    and a checkpoint is saved. The task is acknowledged only when it
+    finishes, so a chunk whose worker dies is delivered again and, like a
+    retried chunk, continues from its checkpoint.
+    
+    Args:
+        session_id: The WhatsApp session ID to use (if None, will use first active session)
+        messages: List of message dictionaries with recipient, message text (or template_id
+            with optional contact_id and variables), and optional media_url
+        rate_limit_ms: Milliseconds to wait between messages to avoid rate limiting
+        job_id: The bulk job ID to store per-recipient outcomes under
+        carried: Counters from earlier attempts of a deferred chunk
+        
+    Returns:
+        Dictionary with the chunk's counters
+    """
     results = {
         'total': len(messages),
         'successful': 0,
-        'failed': 0,
-        'details': []
+        'failed': 0
     }
+    if carried:
+        results.update(carried)
+    details = []
+    deferred = []
+    retry_after = 0
+    reporter = ProgressReporter(job_id)
+    max_deferrals = current_app.config.get('CIRCUIT_MAX_DEFERRALS', 20)
+    checkpoint_every = current_app.config.get('BULK_CHECKPOINT_EVERY', 25)
+    checkpoint = TaskCheckpoint(self.request.id)
+    
+    def save_progress(offset):
+        # Store outcomes before the checkpoint that skips their messages
+        reporter.flush()
+        BulkJobResult.record(job_id or self.request.id, details)
+        details.clear()
+        checkpoint.save(offset, results)
     
     try:
+        # Continue after the last checkpoint of an interrupted run
+        offset = 0
+        saved = checkpoint.load()
+        if saved:
+            offset = saved['offset']
+            results.update(saved['results'])
+            logger.info(f"Resuming chunk {self.request.id} at message {offset}")
+        
         # Get WhatsApp service
         whatsapp_service = self.get_whatsapp_service(session_id)
         
+        # Render rows that reference a template with their contact's fields
+        messages = get_template_engine().render_messages(messages)
+        
+        # Messages a failed earlier attempt already sent are not sent again
+        ledger = SendLedger(job_id or self.request.id)
+        previous = ledger.lookup(messages)
+        
         # Process each message
-        for msg_data in messages:
+        for index, msg_data in enumerate(messages[offset:], start=offset):
+            if index > offset and (index - offset) % checkpoint_every == 0:
+                save_progress(index)
+            
             try:
                 # Get message details
                 recipient = msg_data.get('recipient')
@@ -98,7 +263,8 @@ def send_bulk_messages_task(self, session_id: Optional[str], messages: List[Dict
                 if not recipient:
                     logger.warning(f"Skipping message with missing recipient: {msg_data}")
                     results['failed'] += 1
-                    results['details'].append({
+                    reporter.record(False)
+                    details.append({
                         'recipient': recipient,
                         'status': 'failed',
                         'error': 'Missing recipient'
@@ -109,52 +275,148 @@ def send_bulk_messages_task(self, session_id: Optional[str], messages: List[Dict
                 if not message_text and not media_url:
                     logger.warning(f"Skipping message with no content: {msg_data}")
                     results['failed'] += 1
-                    results['details'].append({
+                    reporter.record(False)
+                    details.append({
                         'recipient': recipient,
                         'status': 'failed',
                         'error': 'Missing message content'
                     })
                     continue
                 
-                # Send message
-                result = whatsapp_service.send_message(
-                    recipient=recipient,
-                    message=message_text,
-                    media_url=media_url
-                )
+                # Send message, or reuse the result of an earlier attempt
+                result = previous[index]
+                replayed = result is not None
+                if not replayed:
+                    result = whatsapp_service.send_message(
+                        recipient=recipient,
+                        message=message_text,
+                        media_url=media_url,
+                        validated=msg_data.get('validated', False),
+                        job_id=job_id or self.request.id
+                    )
+                    ledger.record(msg_data, result)
                 
-                # Update results
+                # The session's circuit is open: retry the rest of the chunk later
+                if result.get('status') == 'deferred':
+                    if self.request.retries < max_deferrals:
+                        deferred = messages[index:]
+                        retry_after = result.get('retry_after') or 0
+                        break
+                    result = {'status': 'failed', 'error': 'Provider unavailable (circuit open)'}
+                
+                # Update results; replayed sends were reported by the earlier attempt
                 if result.get('status') == 'success':
                     results['successful'] += 1
+                    if not replayed:
+                        reporter.record(True)
                 else:
                     results['failed'] += 1
+                    reporter.record(False)
                     
-                results['details'].append({
+                details.append({
                     'recipient': recipient,
                     'status': result.get('status'),
-                    'message_id': result.get('message_id'),
+                    'message_id': result.get('record_id'),
+                    'external_id': result.get('message_id'),
                     'error': result.get('error')
                 })
                 
                 # Add a small delay to avoid rate limiting
-                time.sleep(rate_limit_ms / 1000)
+                if not replayed:
+                    time.sleep(rate_limit_ms / 1000)
                 
             except Exception as e:
                 logger.error(f"Error processing message to {recipient}: {str(e)}")
                 results['failed'] += 1
-                results['details'].append({
+                reporter.record(False)
+                details.append({
                     'recipient': recipient,
                     'status': 'failed',
                     'error': str(e)
                 })
         
+        reporter.flush()
+        
+        BulkJobResult.record(job_id or self.request.id, details)
+        
+        # The retry below gets a new message list, so the offset no longer applies
+        checkpoint.clear()
+        
+        if deferred:
+            logger.warning(f"Circuit open, deferring {len(deferred)} messages for {retry_after:.0f}s")
+            raise self.retry(
+                args=(session_id, deferred, rate_limit_ms),
+                kwargs={'job_id': job_id, 'carried': results},
+                countdown=max(retry_after, 1),
+                max_retries=max_deferrals
+            )
+        
         return results
         
+    except Retry:
+        raise
     except Exception as e:
-        logger.error(f"WhatsApp bulk send task failed: {str(e)}")
+        logger.error(f"WhatsApp bulk send chunk failed: {str(e)}")
         self.retry(exc=e)
 
 
+@celery.task
+def aggregate_bulk_results_task(chunk_results: List[Dict[str, Any]], total: int,
+                                job_id: Optional[str] = None, skipped: int = 0) -> Dict[str, Any]:
+    """Aggregate chunk results into the bulk job result.
+    
+    Args:
+        chunk_results: Results returned by the chunk tasks
+        total: Total number of messages in the bulk job
+        job_id: The bulk job ID the details are stored under
+        skipped: Number of suppressed or duplicate messages dropped before sending
+        
+    Returns:
+        Dictionary with results summary
+    """
+    results = merge_chunk_results(chunk_results, total, job_id=job_id, skipped=skipped)
+    if job_id:
+        publish_event(job_channel(job_id), 'completed', results)
+    return results
+
+
+@celery.task(bind=True, base=WhatsAppTask, acks_late=True, reject_on_worker_lost=True)
+def send_queued_message_task(self, queue_id: int) -> Dict[str, Any]:
+    """Send one queued message that has become due.
+    
+    The message is claimed with a conditional update first, so it is sent
+    once even if it was dispatched more than once or picked up by a queue
+    drain at the same time. Failures are rescheduled by the retry policy
+    rather than retried by Celery. The task is acknowledged only when it
+    finishes, so it is redelivered if the worker dies before claiming; a
+    message the worker claimed but never finished is returned to the queue
+    by ``release_stale_claims_task``.
+    
+    Args:
+        queue_id: The queue item ID
+        
+    Returns:
+        Dictionary with send status
+    """
+    queue_item = MessageQueue.query.get(queue_id)
+    if not queue_item:
+        return {'status': 'skipped', 'error': f"Queue item {queue_id} not found"}
+    
+    if not MessageQueue.claim(queue_id):
+        return {'status': 'skipped', 'error': f"Queue item {queue_id} is no longer pending"}
+    
+    db.session.refresh(queue_item)
+    
+    try:
+        whatsapp_service = self.get_whatsapp_service(queue_item.session.session_id)
+        return whatsapp_service.send_queued(queue_item)
+    except Exception as e:
+        logger.error(f"Error sending queued message {queue_id}: {str(e)}")
+        queue_item.schedule_retry(str(e))
+        db.session.commit()
+        return {'status': 'failed', 'error': str(e)}
+
+
 @celery.task(bind=True, base=WhatsAppTask, max_retries=3, default_retry_delay=60)
 def process_message_queue_task(self, session_id: Optional[str] = None, 
                              batch_size: int = 50) -> Dict[str, Any]:
@@ -179,17 +441,16 @@ def process_message_queue_task(self, session_id: Optional[str] = None,
     
     try:
         # Get sessions to process
-        with app.app_context():
-            if session_id:
-                sessions = [WhatsAppSession.get_session_by_id(session_id)]
-                if not sessions[0]:
-                    logger.error(f"Session with ID {session_id} not found")
-                    return {
-                        'status': 'failed',
-                        'error': f"Session with ID {session_id} not found"
-                    }
-            else:
-                sessions = WhatsAppSession.get_active_sessions()
+        if session_id:
+            sessions = [WhatsAppSession.get_session_by_id(session_id)]
+            if not sessions[0]:
+                logger.error(f"Session with ID {session_id} not found")
+                return {
+                    'status': 'failed',
+                    'error': f"Session with ID {session_id} not found"
+                }
+        else:
+            sessions = WhatsAppSession.get_active_sessions()
         
         # Process each session
         for session in sessions:
@@ -213,7 +474,8 @@ def process_message_queue_task(self, session_id: Optional[str] = None,
                     'successful': result.get('success_count', 0),
                     'failed': result.get('failed_count', 0),
                     'status': result.get('status'),
-                    'error': result.get('error')
+                    'error': result.get('error'),
+                    'circuit_open': result.get('circuit_open', False)
                 })
                 
             except Exception as e:
@@ -229,4 +491,213 @@ def process_message_queue_task(self, session_id: Optional[str] = None,
         
     except Exception as e:
         logger.error(f"WhatsApp message queue processing task failed: {str(e)}")
-        self.retry(exc=e)
\ No newline at end of file
+        self.retry(exc=e)
+
+
+def _drain_lock_key(session_id: str) -> str:
+    return f"blastify:drain:{session_id}"
+
+
+def _drain_batch_size(session: WhatsAppSession, depth: int) -> int:
+    """Size a drain batch by queue depth and the session's send budget.
+    
+    Args:
+        session: The WhatsApp session
+        depth: Number of messages due for the session
+        
+    Returns:
+        Number of messages to send in one drain task
+    """
+    config = current_app.config
+    rate = session.rate_per_minute or config.get('WHATSAPP_SESSION_RATE_PER_MINUTE', 20)
+    interval = config.get('WHATSAPP_DRAIN_INTERVAL', 10)
+    budget = max(int(rate * interval / 60), 1)
+    return min(depth, budget, config.get('WHATSAPP_DRAIN_MAX_BATCH', 200))
+
+
+@celery.task(bind=True, base=WhatsAppTask)
+def dispatch_queue_drains_task(self) -> Dict[str, Any]:
+    """Start one drain task for each active session with messages due.
+    
+    Run periodically by Celery beat. Each session is drained by its own task,
+    so sessions are processed in parallel by separate workers. A lock per
+    session makes sure only one drain runs for it at a time.
+    
+    Returns:
+        Dictionary with the sessions a drain was started for
+    """
+    lock_ttl = current_app.config.get('WHATSAPP_DRAIN_LOCK_TTL', 300)
+    max_batch = current_app.config.get('WHATSAPP_DRAIN_MAX_BATCH', 200)
+    started = []
+    
+    for session in WhatsAppSession.get_active_sessions():
+        # A batch never exceeds the maximum, so counting further is not needed
+        depth = MessageQueue.count_due(session.id, max_batch)
+        if not depth:
+            continue
+        
+        # Skip sessions that are still being drained
+        token = acquire_lock(_drain_lock_key(session.session_id), lock_ttl)
+        if not token:
+            continue
+        
+        batch_size = _drain_batch_size(session, depth)
+        drain_session_queue_task.delay(session.session_id, batch_size, token)
+        started.append({
+            'session_id': session.session_id,
+            'depth': depth,
+            'batch_size': batch_size
+        })
+    
+    return {'status': 'success', 'sessions': started}
+
+
+@celery.task(bind=True, base=WhatsAppTask)
+def drain_session_queue_task(self, session_id: str, batch_size: int, lock_token: str) -> Dict[str, Any]:
+    """Send a batch of due messages for one session and continue while more are due.
+    
+    The next batch is scheduled so that the session keeps to its send rate.
+    The drain stops and releases the session lock when the queue is empty,
+    nothing could be sent, or the session's circuit is open.
+    
+    Args:
+        session_id: The WhatsApp session ID
+        batch_size: Maximum number of messages to send in this batch
+        lock_token: Token of the session's drain lock
+        
+    Returns:
+        Dictionary with processing results
+    """
+    lock_key = _drain_lock_key(session_id)
+    started = time.monotonic()
+    
+    try:
+        result = self.get_whatsapp_service(session_id).process_queue(limit=batch_size)
+    except Exception as e:
+        logger.error(f"Error draining queue for session {session_id}: {str(e)}")
+        release_lock(lock_key, lock_token)
+        return {'status': 'failed', 'error': str(e)}
+    
+    processed = result.get('processed_count', 0)
+    session = WhatsAppSession.get_session_by_id(session_id)
+    
+    if result.get('status') != 'success' or result.get('circuit_open') or not processed or not session:
+        release_lock(lock_key, lock_token)
+        return result
+    
+    depth = MessageQueue.count_due(session.id, current_app.config.get('WHATSAPP_DRAIN_MAX_BATCH', 200))
+    if not depth:
+        release_lock(lock_key, lock_token)
+        return result
+    
+    # Keep the lock for the next batch; stop if it expired and was taken over
+    if not refresh_lock(lock_key, lock_token, current_app.config.get('WHATSAPP_DRAIN_LOCK_TTL', 300)):
+        return result
+    
+    rate = session.rate_per_minute or current_app.config.get('WHATSAPP_SESSION_RATE_PER_MINUTE', 20)
+    countdown = max(processed * 60 / rate - (time.monotonic() - started), 0)
+    
+    drain_session_queue_task.apply_async(
+        args=(session_id, _drain_batch_size(session, depth), lock_token),
+        countdown=countdown
+    )
+    result['continued'] = True
+    return result
+
+
+@celery.task(bind=True, base=WhatsAppTask)
+def release_stale_claims_task(self) -> Dict[str, Any]:
+    """Return queued messages stuck in processing to the queue.
+    
+    Run periodically by Celery beat. A worker that dies between claiming a
+    message and recording the result leaves it in processing, where no
+    drain or scheduler would pick it up again.
+    
+    Returns:
+        Dictionary with the number of messages released and failed
+    """
+    timeout = current_app.config.get('QUEUE_CLAIM_TIMEOUT', 600)
+    older_than = datetime.utcnow() - timedelta(seconds=timeout)
+    
+    try:
+        counts = MessageQueue.release_stale_claims(older_than)
+    except Exception as e:
+        logger.error(f"Error releasing stale queue claims: {str(e)}")
+        db.session.rollback()
+        return {'status': 'failed', 'error': str(e)}
+    
+    if counts['released'] or counts['failed']:
+        logger.warning(f"Released {counts['released']} stale queue claims, "
+                       f"{counts['failed']} out of retries")
+    return dict(counts, status='success')
+
+
+@celery.task(bind=True, base=WhatsAppTask)
+def purge_idempotency_keys_task(self) -> Dict[str, Any]:
+    """Delete expired idempotency keys.
+    
+    Run periodically by Celery beat. Expired keys are otherwise only removed
+    when a client reuses the same key.
+    
+    Returns:
+        Dictionary with the number of keys deleted
+    """
+    try:
+        deleted = IdempotencyKey.delete_expired()
+    except Exception as e:
+        logger.error(f"Error purging expired idempotency keys: {str(e)}")
+        db.session.rollback()
+        return {'status': 'failed', 'error': str(e)}
+    
+    if deleted:
+        logger.info(f"Purged {deleted} expired idempotency keys")
+    return {'status': 'success', 'deleted': deleted}
+
+
+@celery.task(bind=True, base=WhatsAppTask)
+def apply_receipts_task(self, max_seconds: float = None) -> Dict[str, Any]:
+    """Apply delivery and read receipts queued by the webhook endpoint.
+    
+    Run periodically by Celery beat. Receipts are read from the stream in
+    batches of ``RECEIPT_BATCH_SIZE`` and each batch is reconciled with a few
+    bulk queries, until the stream is empty or the time budget is used.
+    Entries are acknowledged only after their batch is committed, so a
+    failed batch is picked up again by a later run. Receipts that arrived
+    before their message was stored are retried once per run.
+    
+    Args:
+        max_seconds: Time budget of one run (defaults to the beat interval)
+        
+    Returns:
+        Dictionary with the number of receipts and rows updated
+    """
+    config = current_app.config
+    batch_size = config.get('RECEIPT_BATCH_SIZE', 500)
+    deadline = time.monotonic() + (max_seconds or config.get('RECEIPT_CONSUME_INTERVAL', 5))
+    consumer = f"{socket.gethostname()}:{os.getpid()}"
+    
+    stream = ReceiptStream()
+    reconciler = ReceiptReconciler()
+    totals = {}
+    
+    try:
+        totals['buffered_retry'] = reconciler.retry_buffered()
+        
+        while time.monotonic() < deadline:
+            entries = stream.read(consumer, batch_size)
+            if not entries:
+                break
+            
+            counts = reconciler.reconcile([receipt for _, receipt in entries])
+            stream.ack([entry_id for entry_id, _ in entries])
+            for key, count in counts.items():
+                totals[key] = totals.get(key, 0) + count
+    except Exception as e:
+        logger.error(f"Error applying receipts: {str(e)}")
+        db.session.rollback()
+        return dict(totals, status='failed', error=str(e))
+    
+    if totals.get('receipts'):
+        publish_event(DELIVERIES_CHANNEL, 'receipts', totals)
+    
+    return dict(totals, status='success')
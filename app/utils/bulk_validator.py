@@ -0,0 +1,151 @@
+"""Validation of bulk message requests."""
+
+import os
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple
+
+from .settings import get_setting
+from .validators import validate_phone_number
+
+logger = logging.getLogger(__name__)
+
+MAX_MESSAGE_LENGTH = 4096
+DEFAULT_PARALLEL_THRESHOLD = 20000
+# Numbers handed to a worker process at a time
+WORKER_BATCH_SIZE = 2000
+
+
+def _validate_numbers(numbers: List[str]) -> List[Tuple[Optional[str], Optional[str]]]:
+    """Validate a batch of phone numbers.
+
+    Runs in worker processes for large lists, so it only uses its arguments.
+
+    Args:
+        numbers: Phone numbers as given by the client
+
+    Returns:
+        List of (formatted number, error) pairs in the same order
+    """
+    results = []
+    for number in numbers:
+        result = validate_phone_number(number)
+        if result['status'] == 'success':
+            results.append((result['phone'], None))
+        else:
+            results.append((None, result['error']))
+    return results
+
+
+def validate_numbers(numbers: List[str], parallel_threshold: int = None,
+                     max_workers: int = None) -> Dict[str, Tuple[Optional[str], Optional[str]]]:
+    """Validate distinct phone numbers, in worker processes for large lists.
+
+    Args:
+        numbers: Distinct phone numbers
+        parallel_threshold: Number of numbers from which worker processes are used
+        max_workers: Maximum number of worker processes (defaults to the CPU count)
+
+    Returns:
+        Dictionary mapping each number to its (formatted number, error) pair
+    """
+    parallel_threshold = parallel_threshold or get_setting('BULK_VALIDATION_PARALLEL_THRESHOLD',
+                                                       DEFAULT_PARALLEL_THRESHOLD)
+
+    max_workers = max_workers or get_setting('BULK_VALIDATION_WORKERS', None) or os.cpu_count() or 1
+
+    if len(numbers) < parallel_threshold or max_workers == 1:
+        return dict(zip(numbers, _validate_numbers(numbers)))
+
+    batches = [numbers[start:start + WORKER_BATCH_SIZE] for start in range(0, len(numbers), WORKER_BATCH_SIZE)]
+
+    results = {}
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        for batch, batch_results in zip(batches, executor.map(_validate_numbers, batches)):
+            results.update(zip(batch, batch_results))
+    return results
+
+
+def _row_error(index: int, row: Any, field: str, error: str) -> Dict[str, Any]:
+    return {
+        'index': index,
+        'message': row,
+        'field': field,
+        'error': error
+    }
+
+
+def validate_bulk_messages(messages: List[Any], parallel_threshold: int = None,
+                           max_workers: int = None) -> Dict[str, Any]:
+    """Validate the rows of a bulk send request.
+
+    Content checks are made per row. Each distinct recipient is validated
+    and formatted once, however often it appears. Rows with the same
+    recipient and content as an earlier row are dropped as duplicates.
+    Valid rows are returned with the formatted recipient and ``validated``
+    set, so senders do not validate them again. A ``validated`` flag sent
+    by the client is never trusted.
+
+    Args:
+        messages: Rows with recipient, message (or template_id with optional
+            contact_id and variables) and optional media_url
+        parallel_threshold: Number of distinct recipients from which worker
+            processes are used
+        max_workers: Maximum number of worker processes
+
+    Returns:
+        Dictionary with the valid rows, the invalid rows (index, message,
+        field and error) and the duplicate rows (index and duplicate_of)
+    """
+    invalid = []
+    candidates = []
+
+    for index, row in enumerate(messages):
+        if not isinstance(row, dict):
+            invalid.append(_row_error(index, row, None, 'Message must be an object'))
+            continue
+
+        recipient = row.get('recipient')
+        message = row.get('message')
+        media_url = row.get('media_url')
+
+        if not recipient or not isinstance(recipient, str):
+            invalid.append(_row_error(index, row, 'recipient', 'Recipient is required'))
+        elif not message and not media_url and not row.get('template_id'):
+            invalid.append(_row_error(index, row, 'message', 'Message, template or media URL is required'))
+        elif message and len(message) > MAX_MESSAGE_LENGTH:
+            invalid.append(_row_error(index, row, 'message',
+                                      f"Message too long (max {MAX_MESSAGE_LENGTH} characters)"))
+        elif media_url and not media_url.startswith(('http://', 'https://')):
+            invalid.append(_row_error(index, row, 'media_url', 'Invalid media URL'))
+        else:
+            candidates.append((index, row))
+
+    numbers = validate_numbers(list({row['recipient'] for _, row in candidates}),
+                               parallel_threshold, max_workers)
+
+    valid = []
+    duplicates = []
+    seen = {}
+
+    for index, row in candidates:
+        phone, error = numbers[row['recipient']]
+        if error:
+            invalid.append(_row_error(index, row, 'recipient', error))
+            continue
+
+        identity = (phone, row.get('message'), row.get('media_url'),
+                    row.get('template_id'), row.get('contact_id'))
+        if identity in seen:
+            duplicates.append({'index': index, 'duplicate_of': seen[identity]})
+            continue
+        seen[identity] = index
+
+        valid.append(dict(row, recipient=phone, validated=True))
+
+    invalid.sort(key=lambda error: error['index'])
+    return {
+        'valid': valid,
+        'invalid': invalid,
+        'duplicates': duplicates
+    }
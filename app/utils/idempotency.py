@@ -0,0 +1,136 @@
+"""Idempotency-Key support for API routes."""
+
+import hashlib
+import logging
+from functools import wraps
+from datetime import datetime, timedelta
+
+from flask import request, jsonify, current_app, make_response
+from flask_login import current_user
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models.idempotency_key import IdempotencyKey
+
+logger = logging.getLogger(__name__)
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 128
+
+
+def _scope():
+    """Scope keys to the endpoint and the user making the request."""
+    user_id = current_user.id if current_user and current_user.is_authenticated else 'anonymous'
+    return f"{request.endpoint}:{user_id}"
+
+
+def _claim(scope, key, request_hash):
+    """Store a new key, or return the existing one if the key was used before.
+
+    A key left in processing past its lease, by a worker that died mid-request,
+    is taken over by a repeat of the same request.
+
+    Returns:
+        Tuple of (IdempotencyKey, created)
+    """
+    now = datetime.utcnow()
+    lock_seconds = current_app.config.get('IDEMPOTENCY_LOCK_SECONDS', 120)
+    existing = IdempotencyKey.query.filter_by(scope=scope, key=key).first()
+    if existing and existing.expires_at <= now:
+        db.session.delete(existing)
+        db.session.commit()
+        existing = None
+    if existing:
+        if (existing.status == 'processing' and existing.request_hash == request_hash
+                and (existing.locked_until is None or existing.locked_until <= now)):
+            # Only one of several concurrent repeats wins the takeover
+            taken = IdempotencyKey.query.filter(
+                IdempotencyKey.id == existing.id,
+                IdempotencyKey.status == 'processing',
+                db.or_(IdempotencyKey.locked_until.is_(None), IdempotencyKey.locked_until <= now)
+            ).update({'locked_until': now + timedelta(seconds=lock_seconds)}, synchronize_session=False)
+            db.session.commit()
+            if taken:
+                logger.warning(f"Taking over idempotency key {scope}:{key} after its lease expired")
+                db.session.refresh(existing)
+                return existing, True
+        return existing, False
+
+    ttl = current_app.config.get('IDEMPOTENCY_KEY_TTL', 24 * 60 * 60)
+    record = IdempotencyKey(scope=scope, key=key, request_hash=request_hash,
+                            expires_at=now + timedelta(seconds=ttl),
+                            locked_until=now + timedelta(seconds=lock_seconds))
+    db.session.add(record)
+    try:
+        db.session.commit()
+        return record, True
+    except IntegrityError:
+        # Another request with the same key got there first
+        db.session.rollback()
+        return IdempotencyKey.query.filter_by(scope=scope, key=key).first(), False
+
+
+def idempotent(view):
+    """Make a JSON route safe to retry with an ``Idempotency-Key`` header.
+
+    The first request with a key runs normally and its response is stored.
+    Repeating the request with the same key returns the stored response
+    without running the route again. Reusing a key for a different request
+    body is rejected, as is a repeat that arrives while the first request
+    is still running, unless the first request has held the key for longer
+    than ``IDEMPOTENCY_LOCK_SECONDS``. Server errors are not stored, so they
+    can be retried.
+    Requests without the header are not affected.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return view(*args, **kwargs)
+
+        if len(key) > MAX_KEY_LENGTH:
+            return jsonify({
+                'status': 'failed',
+                'error': f"{HEADER} must be at most {MAX_KEY_LENGTH} characters"
+            }), 400
+
+        scope = _scope()
+        request_hash = hashlib.sha256(request.get_data()).hexdigest()
+        record, created = _claim(scope, key, request_hash)
+
+        if not created:
+            if record.request_hash != request_hash:
+                return jsonify({
+                    'status': 'failed',
+                    'error': f"{HEADER} was already used for a different request"
+                }), 422
+            if record.status != 'completed':
+                return jsonify({
+                    'status': 'failed',
+                    'error': 'A request with this idempotency key is still being processed'
+                }), 409
+
+            response = make_response(record.response_body, record.response_code)
+            response.mimetype = 'application/json'
+            response.headers['Idempotent-Replayed'] = 'true'
+            return response
+
+        try:
+            response = make_response(view(*args, **kwargs))
+        except Exception:
+            db.session.rollback()
+            db.session.delete(record)
+            db.session.commit()
+            raise
+
+        if response.status_code >= 500:
+            db.session.delete(record)
+        else:
+            record.status = 'completed'
+            record.response_code = response.status_code
+            record.response_body = response.get_data(as_text=True)
+            record.locked_until = None
+        db.session.commit()
+        return response
+
+    return wrapper
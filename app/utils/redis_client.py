@@ -0,0 +1,91 @@
+"""Redis connection utilities."""
+
+import os
+import uuid
+import threading
+
+import redis
+from flask import current_app, has_app_context
+
+DEFAULT_REDIS_URL = 'redis://localhost:6379/0'
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_redis():
+    """Get a shared Redis client for the configured REDIS_URL.
+    
+    Clients are cached per URL so every caller in the process shares one
+    connection pool.
+    
+    Returns:
+        redis.Redis instance returning decoded strings
+    """
+    if has_app_context():
+        url = current_app.config.get('REDIS_URL') or DEFAULT_REDIS_URL
+    else:
+        url = os.environ.get('REDIS_URL') or DEFAULT_REDIS_URL
+    
+    with _clients_lock:
+        client = _clients.get(url)
+        if client is None:
+            client = redis.Redis.from_url(url, decode_responses=True)
+            _clients[url] = client
+    
+    return client
+
+
+def acquire_lock(name, ttl):
+    """Take a lock held in Redis if nobody else holds it.
+    
+    Args:
+        name: Lock key
+        ttl: Seconds after which the lock expires if it is not released
+        
+    Returns:
+        Token identifying the holder, or None if the lock is taken
+    """
+    token = uuid.uuid4().hex
+    if get_redis().set(name, token, nx=True, ex=int(ttl)):
+        return token
+    return None
+
+
+def _if_holder(name, token, action):
+    """Apply an action to a lock in a transaction if the token still holds it."""
+    def apply(pipe):
+        if pipe.get(name) != token:
+            return False
+        pipe.multi()
+        action(pipe)
+        return True
+    
+    return get_redis().transaction(apply, name, value_from_callable=True)
+
+
+def refresh_lock(name, token, ttl):
+    """Extend a lock held by the given token.
+    
+    Args:
+        name: Lock key
+        token: Token returned by acquire_lock
+        ttl: New time to live in seconds
+        
+    Returns:
+        True if the lock is still held and was extended
+    """
+    return _if_holder(name, token, lambda pipe: pipe.expire(name, int(ttl)))
+
+
+def release_lock(name, token):
+    """Release a lock held by the given token.
+    
+    Args:
+        name: Lock key
+        token: Token returned by acquire_lock
+        
+    Returns:
+        True if the lock was held and released
+    """
+    return _if_holder(name, token, lambda pipe: pipe.delete(name))
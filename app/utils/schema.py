@@ -0,0 +1,80 @@
+"""Schema upgrades for databases created before the current models."""
+
+from typing import List
+
+from sqlalchemy import inspect, text
+
+from app import db
+
+
+def _column_sql(column, dialect):
+    """Build the column definition used by ALTER TABLE ... ADD COLUMN."""
+    quote = dialect.identifier_preparer.quote
+    sql = f"{quote(column.name)} {column.type.compile(dialect=dialect)}"
+    
+    if column.server_default is not None:
+        sql += f" DEFAULT {column.server_default.arg}"
+    
+    for foreign_key in column.foreign_keys:
+        sql += f" REFERENCES {quote(foreign_key.column.table.name)} ({quote(foreign_key.column.name)})"
+    
+    return sql
+
+
+def upgrade_schema() -> List[str]:
+    """Bring the database schema up to date with the models without losing data.
+    
+    ``db.create_all`` only creates missing tables; it does not touch tables
+    that already exist. This creates the missing tables, then adds the
+    columns and indexes that were added to the models of existing tables.
+    Nothing is removed or changed. Columns that are required and have no
+    server default cannot be added to a table that may hold rows, and are
+    reported instead.
+    
+    Returns:
+        List of descriptions of the changes made or skipped
+    """
+    engine = db.engine
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    
+    db.create_all()
+    
+    changes = [f"Created table {table.name}" for table in db.metadata.sorted_tables
+               if table.name not in existing_tables]
+    
+    missing = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        columns = {column['name'] for column in inspector.get_columns(table.name)}
+        indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+        missing.append((
+            table,
+            [column for column in table.columns if column.name not in columns],
+            [index for index in table.indexes if index.name not in indexes]
+        ))
+    
+    quote = engine.dialect.identifier_preparer.quote
+    with engine.begin() as connection:
+        for table, columns, indexes in missing:
+            added = set()
+            for column in columns:
+                if not column.nullable and column.server_default is None:
+                    changes.append(f"Skipped column {table.name}.{column.name}: "
+                                   f"required without a server default, add it manually")
+                    continue
+                connection.execute(text(
+                    f"ALTER TABLE {quote(table.name)} ADD COLUMN {_column_sql(column, engine.dialect)}"
+                ))
+                added.add(column.name)
+                changes.append(f"Added column {table.name}.{column.name}")
+            
+            skipped = {column.name for column in columns} - added
+            for index in indexes:
+                if any(column.name in skipped for column in index.columns):
+                    continue
+                index.create(connection)
+                changes.append(f"Created index {index.name}")
+    
+    return changes
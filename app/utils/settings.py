@@ -0,0 +1,21 @@
+"""Access to application settings outside of request handling."""
+
+from typing import Any
+
+from flask import current_app, has_app_context
+
+
+def get_setting(key: str, default: Any = None) -> Any:
+    """Read a setting from the Flask config when an app context is available.
+
+    Services are also used from Celery workers and scripts that may run
+    without an app context; they get the default there.
+
+    Args:
+        key: Name of the config setting
+        default: Value used when the setting or the app context is missing
+
+    Returns:
+        The configured value or the default
+    """
+    return current_app.config.get(key, default) if has_app_context() else default
@@ -22,6 +22,9 @@ class Config:
     CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL') or 'redis://localhost:6379/0'
     CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND') or 'redis://localhost:6379/0'
     
+    # Redis used for job progress and other shared worker state
+    REDIS_URL = os.environ.get('REDIS_URL') or 'redis://localhost:6379/0'
+    
     # Logging configuration
     LOG_TO_STDOUT = os.environ.get('LOG_TO_STDOUT')
     
@@ -29,6 +32,135 @@ class Config:
     RATELIMIT_DEFAULT = '100/hour'
     RATELIMIT_STORAGE_URL = os.environ.get('REDIS_URL') or 'memory://'
 
+    # Media download limits
+    MEDIA_MAX_BYTES = int(os.environ.get('MEDIA_MAX_BYTES') or 16 * 1024 * 1024)
+    MEDIA_CONNECT_TIMEOUT = float(os.environ.get('MEDIA_CONNECT_TIMEOUT') or 5)
+    MEDIA_READ_TIMEOUT = float(os.environ.get('MEDIA_READ_TIMEOUT') or 30)
+    # Seconds a whole media download may take, however steadily the server sends
+    MEDIA_TOTAL_TIMEOUT = float(os.environ.get('MEDIA_TOTAL_TIMEOUT') or 120)
+    MEDIA_POOL_SIZE = int(os.environ.get('MEDIA_POOL_SIZE') or 10)
+    # How long a media file uploaded to Green API is reused for bulk sends (seconds)
+    MEDIA_HANDLE_TTL = int(os.environ.get('MEDIA_HANDLE_TTL') or 24 * 60 * 60)
+
+    # Number of messages per chunk task when a bulk job is fanned out
+    BULK_CHUNK_SIZE = int(os.environ.get('BULK_CHUNK_SIZE') or 100)
+    # Save a resume point of a bulk chunk after this many sends
+    BULK_CHECKPOINT_EVERY = int(os.environ.get('BULK_CHECKPOINT_EVERY') or 25)
+    # Bulk requests with at least this many distinct numbers are validated in
+    # worker processes (workers default to the CPU count)
+    BULK_VALIDATION_PARALLEL_THRESHOLD = int(os.environ.get('BULK_VALIDATION_PARALLEL_THRESHOLD') or 20000)
+    BULK_VALIDATION_WORKERS = int(os.environ.get('BULK_VALIDATION_WORKERS') or 0) or None
+    # Seconds workers keep their in-memory copy of the suppression list
+    SUPPRESSION_SNAPSHOT_TTL = int(os.environ.get('SUPPRESSION_SNAPSHOT_TTL') or 60)
+    # Compiled message templates kept per process, and the most contacts a
+    # batch template preview renders
+    TEMPLATE_CACHE_SIZE = int(os.environ.get('TEMPLATE_CACHE_SIZE') or 256)
+    TEMPLATE_PREVIEW_MAX = int(os.environ.get('TEMPLATE_PREVIEW_MAX') or 50)
+
+    # Bulk job progress reporting (flush after this many sends or seconds)
+    PROGRESS_FLUSH_EVERY = int(os.environ.get('PROGRESS_FLUSH_EVERY') or 25)
+    PROGRESS_FLUSH_INTERVAL = float(os.environ.get('PROGRESS_FLUSH_INTERVAL') or 2)
+
+    # Asynchronous Green API sending backend
+    GREEN_API_ASYNC = os.environ.get('GREEN_API_ASYNC', 'false').lower() in ('true', '1', 'yes')
+    GREEN_API_URL = os.environ.get('GREEN_API_URL') or 'https://api.green-api.com'
+    GREEN_API_MEDIA_URL = os.environ.get('GREEN_API_MEDIA_URL') or 'https://media.green-api.com'
+    GREEN_API_MAX_IN_FLIGHT = int(os.environ.get('GREEN_API_MAX_IN_FLIGHT') or 1000)
+    GREEN_API_POOL_SIZE = int(os.environ.get('GREEN_API_POOL_SIZE') or 200)
+    GREEN_API_TIMEOUT = float(os.environ.get('GREEN_API_TIMEOUT') or 30)
+    # Spread WhatsApp bulk sends across all credential sets and connected sessions
+    WHATSAPP_SENDER_POOL = os.environ.get('WHATSAPP_SENDER_POOL', 'false').lower() in ('true', '1', 'yes')
+    # Messages per minute each Green API instance sends, shared by all workers
+    GREEN_API_RATE_PER_MINUTE = int(os.environ.get('GREEN_API_RATE_PER_MINUTE') or 60)
+    # How long a recipient stays with the account that first messaged it (seconds)
+    SENDER_PIN_TTL = int(os.environ.get('SENDER_PIN_TTL') or 30 * 24 * 60 * 60)
+
+    # Telegram broadcast limits (messages per second)
+    TELEGRAM_GLOBAL_RATE = float(os.environ.get('TELEGRAM_GLOBAL_RATE') or 30)
+    TELEGRAM_CHAT_RATE = float(os.environ.get('TELEGRAM_CHAT_RATE') or 1)
+    TELEGRAM_MAX_IN_FLIGHT = int(os.environ.get('TELEGRAM_MAX_IN_FLIGHT') or 100)
+    TELEGRAM_MAX_RETRIES = int(os.environ.get('TELEGRAM_MAX_RETRIES') or 5)
+
+    # Circuit breaker per provider account
+    CIRCUIT_WINDOW_SECONDS = float(os.environ.get('CIRCUIT_WINDOW_SECONDS') or 60)
+    CIRCUIT_MIN_CALLS = int(os.environ.get('CIRCUIT_MIN_CALLS') or 10)
+    CIRCUIT_ERROR_RATE = float(os.environ.get('CIRCUIT_ERROR_RATE') or 0.5)
+    CIRCUIT_SLOW_CALL_SECONDS = float(os.environ.get('CIRCUIT_SLOW_CALL_SECONDS') or 10)
+    CIRCUIT_SLOW_CALL_RATE = float(os.environ.get('CIRCUIT_SLOW_CALL_RATE') or 0.8)
+    CIRCUIT_OPEN_SECONDS = float(os.environ.get('CIRCUIT_OPEN_SECONDS') or 30)
+    CIRCUIT_MAX_OPEN_SECONDS = float(os.environ.get('CIRCUIT_MAX_OPEN_SECONDS') or 600)
+    # Seconds after which a half-open probe that never reported is given up
+    CIRCUIT_PROBE_TIMEOUT = float(os.environ.get('CIRCUIT_PROBE_TIMEOUT') or 60)
+    # How many times a bulk chunk may be deferred while a circuit is open
+    CIRCUIT_MAX_DEFERRALS = int(os.environ.get('CIRCUIT_MAX_DEFERRALS') or 20)
+
+    # Scheduled message dispatcher
+    SCHEDULER_WINDOW_SECONDS = float(os.environ.get('SCHEDULER_WINDOW_SECONDS') or 300)
+    SCHEDULER_REFILL_INTERVAL = float(os.environ.get('SCHEDULER_REFILL_INTERVAL') or 1)
+    SCHEDULER_BATCH_SIZE = int(os.environ.get('SCHEDULER_BATCH_SIZE') or 1000)
+    SCHEDULER_TICK_SECONDS = float(os.environ.get('SCHEDULER_TICK_SECONDS') or 0.5)
+
+    # Periodic queue draining per WhatsApp session
+    WHATSAPP_DRAIN_INTERVAL = float(os.environ.get('WHATSAPP_DRAIN_INTERVAL') or 10)
+    WHATSAPP_SESSION_RATE_PER_MINUTE = int(os.environ.get('WHATSAPP_SESSION_RATE_PER_MINUTE') or 20)
+    WHATSAPP_DRAIN_MAX_BATCH = int(os.environ.get('WHATSAPP_DRAIN_MAX_BATCH') or 200)
+    WHATSAPP_DRAIN_LOCK_TTL = int(os.environ.get('WHATSAPP_DRAIN_LOCK_TTL') or 300)
+    # Seconds a message may stay in processing before the sweep returns it to
+    # the queue; must exceed the longest send, including media downloads
+    QUEUE_CLAIM_TIMEOUT = int(os.environ.get('QUEUE_CLAIM_TIMEOUT') or 600)
+    QUEUE_CLAIM_SWEEP_INTERVAL = float(os.environ.get('QUEUE_CLAIM_SWEEP_INTERVAL') or 60)
+
+    # Delivery receipts from provider webhooks, applied in batches from a Redis stream
+    GREEN_API_WEBHOOK_TOKEN = os.environ.get('GREEN_API_WEBHOOK_TOKEN')
+    RECEIPT_CONSUME_INTERVAL = float(os.environ.get('RECEIPT_CONSUME_INTERVAL') or 5)
+    RECEIPT_BATCH_SIZE = int(os.environ.get('RECEIPT_BATCH_SIZE') or 500)
+    RECEIPT_STREAM_MAXLEN = int(os.environ.get('RECEIPT_STREAM_MAXLEN') or 1000000)
+    # Seconds before receipts read by a consumer that died are taken over
+    RECEIPT_CLAIM_IDLE = int(os.environ.get('RECEIPT_CLAIM_IDLE') or 60)
+    # Seconds receipts that match no stored message are kept and retried
+    RECEIPT_BUFFER_TTL = int(os.environ.get('RECEIPT_BUFFER_TTL') or 60 * 60)
+
+    # Fair sharing of each session's queue between users and campaigns
+    FAIR_QUEUE_QUANTUM = float(os.environ.get('FAIR_QUEUE_QUANTUM') or 1)
+    # Optional weight per user ID, e.g. {1: 2} gives user 1 twice the share
+    FAIR_QUEUE_OWNER_WEIGHTS = {}
+    # Seconds before the list of flows with waiting messages is rebuilt from the queue
+    FAIR_QUEUE_FLOW_TTL = int(os.environ.get('FAIR_QUEUE_FLOW_TTL') or 60)
+
+    # Message history retention: older rows are moved to compressed archive
+    # files by `utility.py db_utils archive`
+    MESSAGE_RETENTION_DAYS = int(os.environ.get('MESSAGE_RETENTION_DAYS') or 90)
+    QUEUE_RETENTION_DAYS = int(os.environ.get('QUEUE_RETENTION_DAYS') or 30)
+    ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR') or os.path.join(os.getcwd(), 'app_data', 'archive')
+    ARCHIVE_FORMAT = os.environ.get('ARCHIVE_FORMAT') or 'jsonl'  # jsonl or parquet (requires pyarrow)
+    ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE') or 1000)
+    
+    # How long idempotency keys and per-job send records are kept (seconds)
+    IDEMPOTENCY_KEY_TTL = int(os.environ.get('IDEMPOTENCY_KEY_TTL') or 24 * 60 * 60)
+    # Seconds a request holds its idempotency key while running; a repeat after
+    # this takes the key over, so a worker that died does not block retries
+    IDEMPOTENCY_LOCK_SECONDS = int(os.environ.get('IDEMPOTENCY_LOCK_SECONDS') or 120)
+
+    # Queue retry backoff per error class (delays in seconds; max_retries None
+    # uses the message's own limit)
+    RETRY_POLICIES = {
+        'transient': {
+            'base_delay': float(os.environ.get('RETRY_BASE_DELAY') or 30),
+            'max_delay': float(os.environ.get('RETRY_MAX_DELAY') or 3600),
+            'max_retries': None
+        },
+        'rate_limit': {
+            'base_delay': float(os.environ.get('RETRY_RATE_LIMIT_BASE_DELAY') or 60),
+            'max_delay': float(os.environ.get('RETRY_RATE_LIMIT_MAX_DELAY') or 1800),
+            'max_retries': int(os.environ.get('RETRY_RATE_LIMIT_MAX_RETRIES') or 10)
+        },
+        'permanent': {
+            'base_delay': 0,
+            'max_delay': 0,
+            'max_retries': 0
+        }
+    }
+
 class DevelopmentConfig(Config):
     """Development configuration."""
     
@@ -0,0 +1,95 @@
+"""Shared fixtures for the test suite."""
+
+import time
+import asyncio
+import threading
+
+import pytest
+
+from app import create_app, db
+from app.utils import redis_client
+from config import TestingConfig
+
+
+@pytest.fixture
+def app():
+    """Application with an empty in-memory database."""
+    app = create_app(TestingConfig)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def redis(app, monkeypatch):
+    """In-memory Redis used by every get_redis() call."""
+    fakeredis = pytest.importorskip('fakeredis')
+    client = fakeredis.FakeRedis(decode_responses=True)
+    url = app.config.get('REDIS_URL') or redis_client.DEFAULT_REDIS_URL
+    monkeypatch.setitem(redis_client._clients, url, client)
+    return client
+
+
+class FakeHTTPServer:
+    """HTTP server on a background thread that answers with a test's handler.
+
+    ``handler`` is called with the request path and decoded JSON body and
+    returns (status, JSON body, headers). Requests are kept in ``requests``
+    as (time, path, body) tuples.
+    """
+
+    def __init__(self, web):
+        self.web = web
+        self.requests = []
+        self.handler = lambda path, body: (200, {}, {})
+        self.url = None
+        self.loop = None
+        self.runner = None
+
+    async def _handle(self, request):
+        try:
+            body = await request.json()
+        except ValueError:
+            body = None
+        self.requests.append((time.monotonic(), request.path, body))
+        status, data, headers = self.handler(request.path, body)
+        return self.web.json_response(data, status=status, headers=headers)
+
+    def start(self):
+        started = threading.Event()
+
+        def serve():
+            self.loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self.loop)
+            app = self.web.Application()
+            app.router.add_route('*', '/{tail:.*}', self._handle)
+            self.runner = self.web.AppRunner(app)
+            self.loop.run_until_complete(self.runner.setup())
+            site = self.web.TCPSite(self.runner, '127.0.0.1', 0)
+            self.loop.run_until_complete(site.start())
+            port = site._server.sockets[0].getsockname()[1]
+            self.url = f"http://127.0.0.1:{port}"
+            started.set()
+            self.loop.run_forever()
+            self.loop.run_until_complete(self.runner.cleanup())
+            self.loop.close()
+
+        self.thread = threading.Thread(target=serve, daemon=True)
+        self.thread.start()
+        started.wait(5)
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(5)
+
+
+@pytest.fixture
+def http_server():
+    """Local HTTP server standing in for a provider API."""
+    web = pytest.importorskip('aiohttp.web')
+    server = FakeHTTPServer(web)
+    server.start()
+    yield server
+    server.stop()
@@ -0,0 +1,186 @@
+"""Tests for the provider circuit breaker."""
+
+import pytest
+
+from app.services import circuit_breaker
+from app.services.circuit_breaker import CircuitBreaker, CLOSED, OPEN, HALF_OPEN
+
+
+class FakeClock:
+    """Monotonic clock that only moves when told to."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(circuit_breaker.time, 'monotonic', fake)
+    return fake
+
+
+def make_breaker(**kwargs):
+    options = dict(window_seconds=60, min_calls=4, error_rate=0.5, slow_call_seconds=10,
+                   slow_call_rate=0.8, open_seconds=30, max_open_seconds=100, half_open_calls=1)
+    options.update(kwargs)
+    return CircuitBreaker('test', **options)
+
+
+def trip(breaker):
+    for _ in range(breaker.min_calls):
+        assert breaker.allow_request()
+        breaker.record(False)
+
+
+def test_stays_closed_below_min_calls(clock):
+    breaker = make_breaker()
+    for _ in range(3):
+        breaker.record(False)
+    assert breaker.state == CLOSED
+    assert breaker.allow_request()
+
+
+def test_opens_at_error_rate(clock):
+    breaker = make_breaker()
+    breaker.record(True)
+    breaker.record(True)
+    breaker.record(False)
+    assert breaker.state == CLOSED
+    breaker.record(False)
+    assert breaker.state == OPEN
+    assert not breaker.allow_request()
+
+
+def test_opens_on_slow_calls(clock):
+    breaker = make_breaker()
+    for _ in range(4):
+        breaker.record(True, latency=12)
+    assert breaker.state == OPEN
+
+
+def test_old_outcomes_leave_window(clock):
+    breaker = make_breaker()
+    for _ in range(3):
+        breaker.record(False)
+    clock.advance(61)
+    breaker.record(False)
+    assert breaker.state == CLOSED
+
+
+def test_retry_after_counts_down(clock):
+    breaker = make_breaker()
+    assert breaker.retry_after() == 0
+    trip(breaker)
+    assert breaker.retry_after() == 30
+    clock.advance(20)
+    assert breaker.retry_after() == 10
+    clock.advance(15)
+    assert breaker.retry_after() == 0
+
+
+def test_half_open_after_open_period(clock):
+    breaker = make_breaker()
+    trip(breaker)
+    clock.advance(29)
+    assert not breaker.allow_request()
+    clock.advance(1)
+    assert breaker.allow_request()
+    assert breaker.state == HALF_OPEN
+    # Only half_open_calls probes are let through
+    assert not breaker.allow_request()
+
+
+def test_successful_probe_closes(clock):
+    breaker = make_breaker()
+    trip(breaker)
+    clock.advance(30)
+    assert breaker.allow_request()
+    breaker.record(True, latency=1)
+    assert breaker.state == CLOSED
+    assert breaker.current_open_seconds == 30
+    assert breaker.allow_request()
+
+
+def test_slow_probe_reopens(clock):
+    breaker = make_breaker()
+    trip(breaker)
+    clock.advance(30)
+    assert breaker.allow_request()
+    breaker.record(True, latency=11)
+    assert breaker.state == OPEN
+
+
+def test_failed_probe_doubles_open_period_up_to_max(clock):
+    breaker = make_breaker()
+    trip(breaker)
+    for expected in (60, 100, 100):
+        clock.advance(breaker.current_open_seconds)
+        assert breaker.allow_request()
+        breaker.record(False)
+        assert breaker.state == OPEN
+        assert breaker.retry_after() == expected
+
+
+def test_deferred_result(clock):
+    breaker = make_breaker()
+    trip(breaker)
+    clock.advance(5)
+    result = breaker.deferred_result()
+    assert result['status'] == 'deferred'
+    assert result['retry_after'] == 25
+    assert 'test' in result['error']
+
+
+def test_released_probe_can_be_taken_again(clock):
+    breaker = make_breaker()
+    trip(breaker)
+    clock.advance(30)
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+
+    breaker.release()
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow_request()
+    breaker.record(True)
+    assert breaker.state == CLOSED
+
+
+def test_release_outside_half_open_does_nothing(clock):
+    breaker = make_breaker()
+    assert breaker.allow_request()
+    breaker.release()
+    assert breaker.state == CLOSED
+    assert breaker.probes == 0
+
+
+def test_unreported_probe_expires(clock):
+    breaker = make_breaker(probe_timeout=60)
+    trip(breaker)
+    clock.advance(30)
+    assert breaker.allow_request()
+
+    # The probe's caller never reports; other calls wait for it to expire
+    clock.advance(10)
+    assert not breaker.allow_request()
+    assert breaker.retry_after() == 50
+    assert breaker.deferred_result()['retry_after'] == 50
+
+    clock.advance(50)
+    assert breaker.retry_after() == 0
+    assert breaker.allow_request()
+    breaker.record(True)
+    assert breaker.state == CLOSED
+
+
+def test_get_breaker_is_shared_per_name():
+    assert circuit_breaker.get_breaker(None) is None
+    breaker = circuit_breaker.get_breaker('test:shared')
+    assert circuit_breaker.get_breaker('test:shared') is breaker
+    assert circuit_breaker.get_breaker('test:other') is not breaker
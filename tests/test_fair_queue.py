@@ -0,0 +1,145 @@
+"""Tests for fair scheduling of the message queue."""
+
+from collections import Counter
+
+import pytest
+
+from app import db
+from app.models.message_queue import MessageQueue
+from app.models.whatsapp_session import WhatsAppSession
+from app.services.fair_queue import FairQueue, drr_allocate
+
+
+def test_drr_shares_evenly():
+    allocated, carried, last = drr_allocate({'a': 10, 'b': 10, 'c': 10}, 9, {})
+    assert allocated == {'a': 3, 'b': 3, 'c': 3}
+    assert carried == {}
+    assert last == 'c'
+
+
+def test_drr_gives_unused_share_to_others():
+    allocated, _, _ = drr_allocate({'a': 1, 'b': 20}, 10, {})
+    assert allocated == {'a': 1, 'b': 9}
+
+
+def test_drr_weights_are_proportional():
+    allocated, _, _ = drr_allocate({'a': 100, 'b': 100}, 30, {}, weights={'a': 2})
+    assert allocated == {'a': 20, 'b': 10}
+
+
+def test_drr_carries_deficit_between_batches():
+    deficits, last = {}, None
+    totals = Counter()
+    for _ in range(4):
+        allocated, deficits, last = drr_allocate({'a': 100, 'b': 100}, 1, deficits,
+                                                 quantum=0.5, start_after=last)
+        totals.update(allocated)
+    # Half a message of credit per round adds up to one message every other round
+    assert totals == {'a': 2, 'b': 2}
+
+
+def test_drr_drops_credit_of_drained_queue():
+    allocated, carried, _ = drr_allocate({'a': 1, 'b': 10}, 5, {'a': 3.0, 'b': 0.5}, quantum=1.5)
+    assert allocated['a'] == 1
+    assert 'a' not in carried
+
+
+def test_drr_limit_below_active_queues_rotates():
+    available = {key: 5 for key in 'abcde'}
+    deficits, last = {}, None
+    served = []
+    for _ in range(5):
+        allocated, deficits, last = drr_allocate(available, 2, deficits, start_after=last)
+        assert sum(allocated.values()) == 2
+        served.extend(key for key, count in allocated.items() if count)
+    # Every queue gets served twice over five batches of two
+    assert Counter(served) == {key: 2 for key in 'abcde'}
+
+
+@pytest.fixture
+def session(app, redis):
+    session = WhatsAppSession(session_id='fair', name='Fair queue')
+    db.session.add(session)
+    db.session.commit()
+    return session
+
+
+def queue(session, count, owner_id=None, campaign_id=None, priority=0):
+    for index in range(count):
+        db.session.add(MessageQueue(session_id=session.id, owner_id=owner_id, campaign_id=campaign_id,
+                                    recipient=f"+1555{owner_id or 0}{campaign_id or 0}{index:04d}",
+                                    message='hi', priority=priority, status='pending'))
+    db.session.commit()
+
+
+def flows(batch):
+    return [(item.owner_id, item.campaign_id) for item in batch]
+
+
+def test_select_serves_single_sends_before_campaigns(session):
+    queue(session, 50, owner_id=1, campaign_id=10)
+    queue(session, 3, owner_id=2)
+
+    batch = FairQueue(session.id).select(6)
+    assert flows(batch)[:3] == [(2, None)] * 3
+    assert flows(batch)[3:] == [(1, 10)] * 3
+
+
+def test_select_serves_higher_priority_first(session):
+    queue(session, 5, owner_id=1, campaign_id=10, priority=5)
+    queue(session, 5, owner_id=2)
+
+    batch = FairQueue(session.id).select(6)
+    assert flows(batch) == [(1, 10)] * 5 + [(2, None)]
+
+
+def test_select_shares_between_owners_then_campaigns(session):
+    queue(session, 100, owner_id=1, campaign_id=10)
+    queue(session, 100, owner_id=1, campaign_id=11)
+    queue(session, 100, owner_id=2, campaign_id=20)
+
+    counts = Counter(flows(FairQueue(session.id).select(8)))
+    assert counts[(2, 20)] == 4
+    assert counts[(1, 10)] == 2
+    assert counts[(1, 11)] == 2
+
+
+def test_select_applies_owner_weights(session):
+    queue(session, 100, owner_id=1, campaign_id=10)
+    queue(session, 100, owner_id=2, campaign_id=20)
+
+    counts = Counter(flows(FairQueue(session.id, owner_weights={1: 3}).select(8)))
+    assert counts == {(1, 10): 6, (2, 20): 2}
+
+
+def test_select_carries_credit_across_batches(session):
+    queue(session, 100, owner_id=1, campaign_id=10)
+    queue(session, 100, owner_id=2, campaign_id=20)
+    queue(session, 100, owner_id=3, campaign_id=30)
+
+    fair_queue = FairQueue(session.id)
+    counts = Counter()
+    for _ in range(3):
+        batch = fair_queue.select(2)
+        for item in batch:
+            item.status = 'sent'
+        db.session.commit()
+        counts.update(flows(batch))
+    assert counts == {(1, 10): 2, (2, 20): 2, (3, 30): 2}
+
+
+def test_select_forgets_finished_flows(session, redis):
+    queue(session, 2, owner_id=1)
+    queue(session, 5, owner_id=2, campaign_id=20)
+
+    fair_queue = FairQueue(session.id)
+    for item in fair_queue.select(10):
+        item.status = 'sent'
+    db.session.commit()
+    assert fair_queue.select(10) == []
+    assert not redis.exists(fair_queue.flows_key)
+
+    FairQueue.register_flow(session.id, 0, 3, None)
+    assert not redis.exists(fair_queue.flows_key)
+    queue(session, 1, owner_id=3)
+    assert flows(fair_queue.select(10)) == [(3, None)]
@@ -0,0 +1,130 @@
+"""Tests for the asynchronous Green API sender."""
+
+import time
+
+import pytest
+
+from app.services.circuit_breaker import CircuitBreaker, CLOSED, HALF_OPEN
+from app.services.green_api_async import AsyncGreenAPIService
+
+
+@pytest.fixture
+def service(app, redis, http_server):
+    pytest.importorskip('aiohttp')
+    return AsyncGreenAPIService('1101', 'secret', api_url=http_server.url,
+                                rate_per_minute=6000, timeout=5)
+
+
+@pytest.fixture
+def breaker(service, monkeypatch):
+    breaker = CircuitBreaker(service.breaker_key, min_calls=1, open_seconds=0.01)
+    monkeypatch.setattr(service, 'circuit_breaker', lambda: breaker)
+    return breaker
+
+
+def half_open(breaker):
+    breaker.record(False)
+    time.sleep(0.02)
+
+
+def sent(path, body):
+    return 200, {'idMessage': f"id-{body['chatId']}"}, {}
+
+
+def test_send_many_sends_text_and_media(service, http_server):
+    http_server.handler = sent
+    reported = []
+
+    results = service.send_many([
+        {'recipient': '+1 555 000 0001', 'message': 'hi'},
+        {'recipient': '15550000002', 'message': 'look', 'media_url': 'http://example.com/a.PNG'},
+    ], on_result=lambda index, result: reported.append(index))
+
+    assert results == [
+        {'status': 'sent', 'message_id': 'id-15550000001@c.us'},
+        {'status': 'sent', 'message_id': 'id-15550000002@c.us'},
+    ]
+    assert sorted(reported) == [0, 1]
+
+    requests = {path.split('/')[2]: body for _, path, body in http_server.requests}
+    assert requests['sendMessage'] == {'chatId': '15550000001@c.us', 'message': 'hi'}
+    assert requests['sendFileByUrl']['fileName'] == 'image.png'
+    assert requests['sendFileByUrl']['caption'] == 'look'
+
+
+def test_send_many_paces_to_the_rate(service, http_server):
+    http_server.handler = sent
+    service.rate_per_minute = 600
+
+    results = service.send_many([{'recipient': f"1555000{i:04d}", 'message': 'hi'} for i in range(5)])
+    assert all(result['status'] == 'sent' for result in results)
+
+    times = sorted(at for at, _, _ in http_server.requests)
+    # Ten per second, so five sends span at least four intervals
+    assert times[-1] - times[0] >= 0.35
+
+
+def test_rate_budget_is_shared_between_services(service, http_server):
+    http_server.handler = sent
+    service.rate_per_minute = 600
+    other = AsyncGreenAPIService('1101', 'secret', api_url=http_server.url, rate_per_minute=600)
+
+    service.send_many([{'recipient': '15550000001', 'message': 'hi'}])
+    started = time.monotonic()
+    other.send_many([{'recipient': '15550000002', 'message': 'hi'}])
+    assert time.monotonic() - started >= 0.05
+
+
+def test_failure_is_recorded_on_breaker(service, http_server, breaker):
+    http_server.handler = lambda path, body: (500, {'error': 'boom'}, {})
+
+    result = service.send_many([{'recipient': '15550000001', 'message': 'hi'}])[0]
+    assert result['status'] == 'failed'
+    assert result['http_status'] == 500
+    assert breaker.to_dict()['state'] == 'open'
+
+    # Messages are deferred without a request while the circuit is open
+    breaker.open_seconds = breaker.current_open_seconds = 60
+    breaker.opened_at = time.monotonic()
+    count = len(http_server.requests)
+    assert service.send_many([{'recipient': '15550000001', 'message': 'hi'}])[0]['status'] == 'deferred'
+    assert len(http_server.requests) == count
+
+
+def test_429_is_deferred_with_retry_after(service, http_server):
+    http_server.handler = lambda path, body: (429, {}, {'Retry-After': '7'})
+
+    result = service.send_many([{'recipient': '15550000001', 'message': 'hi'}])[0]
+    assert result['status'] == 'deferred'
+    assert result['retry_after'] == 7
+    # The shared budget is blocked for every worker
+    assert service.rate_limiter().try_acquire() > 6
+
+
+def test_429_on_probe_does_not_stick_breaker(service, http_server, breaker):
+    responses = [(429, {}, {'Retry-After': '1'})]
+    http_server.handler = lambda path, body: responses.pop(0) if responses else sent(path, body)
+    half_open(breaker)
+
+    result = service.send_many([{'recipient': '15550000001', 'message': 'hi'}])[0]
+    assert result['status'] == 'deferred'
+    assert breaker.state == HALF_OPEN
+    assert breaker.probes == 0
+
+    # The next send probes again and closes the circuit
+    result = service.send_many([{'recipient': '15550000001', 'message': 'hi'}])[0]
+    assert result['status'] == 'sent'
+    assert breaker.state == CLOSED
+
+
+def test_rate_wait_on_probe_does_not_stick_breaker(service, http_server, breaker):
+    http_server.handler = sent
+    half_open(breaker)
+    service.rate_limiter().block(120)
+
+    result = service.send_many([{'recipient': '15550000001', 'message': 'hi'}])[0]
+    assert result['status'] == 'deferred'
+    assert result['error'] == 'Rate limited'
+    assert http_server.requests == []
+    assert breaker.probes == 0
+    assert breaker.allow_request()
@@ -0,0 +1,148 @@
+"""Tests for Idempotency-Key handling on API routes."""
+
+import hashlib
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from flask import jsonify, request
+
+from app import db
+from app.models.idempotency_key import IdempotencyKey
+from app.tasks.whatsapp_tasks import purge_idempotency_keys_task
+from app.utils.idempotency import idempotent
+
+BODY = {'recipient': '15551234567', 'message': 'hi'}
+
+
+@pytest.fixture
+def calls(app):
+    """Record the requests that reached a test route behind ``idempotent``."""
+    calls = []
+
+    @idempotent
+    def send():
+        calls.append(request.get_json())
+        status = request.args.get('status', 200, type=int)
+        return jsonify({'status': 'success', 'call': len(calls)}), status
+
+    app.add_url_rule('/idempotent-send', 'idempotent_send', send, methods=['POST'])
+    return calls
+
+
+def post(client, key, body=BODY, status=200):
+    headers = {'Idempotency-Key': key} if key else {}
+    return client.post(f'/idempotent-send?status={status}', data=json.dumps(body),
+                       content_type='application/json', headers=headers)
+
+
+def stored_key(key, **fields):
+    """Add a key row as a request that has not finished would leave it."""
+    now = datetime.utcnow()
+    record = IdempotencyKey(scope='idempotent_send:anonymous', key=key,
+                            request_hash=hashlib.sha256(json.dumps(BODY).encode()).hexdigest(),
+                            expires_at=now + timedelta(hours=1), **fields)
+    db.session.add(record)
+    db.session.commit()
+    return record
+
+
+def test_repeat_returns_stored_response(app, calls):
+    client = app.test_client()
+
+    first = post(client, 'k1')
+    second = post(client, 'k1')
+
+    assert len(calls) == 1
+    assert second.status_code == first.status_code == 200
+    assert second.get_json() == first.get_json() == {'status': 'success', 'call': 1}
+    assert second.headers['Idempotent-Replayed'] == 'true'
+    assert 'Idempotent-Replayed' not in first.headers
+
+
+def test_requests_without_key_always_run(app, calls):
+    client = app.test_client()
+
+    post(client, None)
+    post(client, None)
+
+    assert len(calls) == 2
+    assert IdempotencyKey.query.count() == 0
+
+
+def test_key_reused_for_different_body_is_rejected(app, calls):
+    client = app.test_client()
+    post(client, 'k1')
+
+    response = post(client, 'k1', body={'recipient': '15550000000', 'message': 'hi'})
+
+    assert response.status_code == 422
+    assert len(calls) == 1
+
+
+def test_repeat_while_first_request_runs_gets_conflict(app, calls):
+    stored_key('k1', locked_until=datetime.utcnow() + timedelta(minutes=1))
+
+    response = post(app.test_client(), 'k1')
+
+    assert response.status_code == 409
+    assert calls == []
+
+
+def test_repeat_takes_over_key_after_lease_expires(app, calls):
+    stored_key('k1', locked_until=datetime.utcnow() - timedelta(seconds=1))
+    client = app.test_client()
+
+    response = post(client, 'k1')
+    replay = post(client, 'k1')
+
+    assert response.status_code == 200
+    assert 'Idempotent-Replayed' not in response.headers
+    assert replay.headers['Idempotent-Replayed'] == 'true'
+    assert len(calls) == 1
+    record = IdempotencyKey.query.one()
+    assert record.status == 'completed'
+    assert record.locked_until is None
+
+
+def test_expired_lease_is_not_taken_over_for_different_body(app, calls):
+    stored_key('k1', locked_until=datetime.utcnow() - timedelta(seconds=1))
+
+    response = post(app.test_client(), 'k1', body={'recipient': '15550000000', 'message': 'hi'})
+
+    assert response.status_code == 422
+    assert calls == []
+
+
+def test_server_errors_are_not_stored(app, calls):
+    client = app.test_client()
+
+    failed = post(client, 'k1', status=503)
+    retried = post(client, 'k1', status=503)
+
+    assert failed.status_code == retried.status_code == 503
+    assert len(calls) == 2
+    assert IdempotencyKey.query.count() == 0
+
+
+def test_client_errors_are_stored(app, calls):
+    client = app.test_client()
+
+    post(client, 'k1', status=400)
+    replay = post(client, 'k1', status=400)
+
+    assert replay.status_code == 400
+    assert replay.headers['Idempotent-Replayed'] == 'true'
+    assert len(calls) == 1
+
+
+def test_purge_deletes_only_expired_keys(app):
+    expired = stored_key('old', status='completed')
+    expired.expires_at = datetime.utcnow() - timedelta(seconds=1)
+    stored_key('new', status='completed')
+    db.session.commit()
+
+    result = purge_idempotency_keys_task.apply().get()
+
+    assert result == {'status': 'success', 'deleted': 1}
+    assert [record.key for record in IdempotencyKey.query.all()] == ['new']
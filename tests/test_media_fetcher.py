@@ -0,0 +1,120 @@
+"""Tests for the media downloader's size cap and download deadline."""
+
+import os
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.services.media_fetcher import MediaFetcher
+
+MAX_BYTES = 1000
+
+
+class MediaHandler(BaseHTTPRequestHandler):
+    """Serves bodies of different sizes and speeds by path."""
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        try:
+            if self.path == '/small':
+                self._headers(200, length=100)
+                self.wfile.write(b'x' * 100)
+            elif self.path == '/announced-too-large':
+                self._headers(200, length=MAX_BYTES + 1)
+                self.wfile.write(b'x' * (MAX_BYTES + 1))
+            elif self.path == '/unannounced-too-large':
+                # No Content-Length; only counting the body catches it
+                self._headers(200)
+                for _ in range(10):
+                    self.wfile.write(b'x' * MAX_BYTES)
+            elif self.path == '/trickle':
+                # Never idle long enough for the read timeout to fire
+                self._headers(200)
+                for _ in range(100):
+                    self.wfile.write(b'x')
+                    self.wfile.flush()
+                    time.sleep(0.05)
+            elif self.path == '/stall':
+                self._headers(200)
+                time.sleep(5)
+            else:
+                self._headers(404, length=0)
+        except OSError:
+            # The client cut the download off
+            pass
+
+    def _headers(self, status, length=None):
+        self.send_response(status)
+        self.send_header('Content-Type', 'image/png')
+        if length is not None:
+            self.send_header('Content-Length', str(length))
+        self.end_headers()
+
+
+@pytest.fixture
+def media_url():
+    """Base URL of a local server serving test media."""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), MediaHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def fetcher(tmp_path):
+    fetcher = MediaFetcher(max_bytes=MAX_BYTES, read_timeout=5, total_timeout=0.5,
+                           download_dir=str(tmp_path))
+    yield fetcher
+    fetcher.close()
+
+
+def test_downloads_file_within_limits(fetcher, media_url):
+    result = fetcher.fetch(f"{media_url}/small")
+
+    assert result['status'] == 'success'
+    assert result['size'] == 100
+    assert result['content_type'] == 'image/png'
+    with open(result['path'], 'rb') as f:
+        assert f.read() == b'x' * 100
+
+
+def test_rejects_announced_oversized_body(fetcher, media_url, tmp_path):
+    result = fetcher.fetch(f"{media_url}/announced-too-large")
+
+    assert result['status'] == 'failed'
+    assert 'exceeds limit' in result['error']
+    assert os.listdir(tmp_path) == []
+
+
+def test_stops_reading_oversized_body_without_content_length(fetcher, media_url, tmp_path):
+    result = fetcher.fetch(f"{media_url}/unannounced-too-large")
+
+    assert result['status'] == 'failed'
+    assert 'exceeds limit' in result['error']
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.parametrize('path', ['/trickle', '/stall'])
+def test_slow_download_is_cut_off_at_deadline(fetcher, media_url, tmp_path, path):
+    started = time.monotonic()
+    result = fetcher.fetch(f"{media_url}{path}")
+    elapsed = time.monotonic() - started
+
+    assert result['status'] == 'failed'
+    assert 'exceeded 0.5 seconds' in result['error']
+    # Well before the 5 second read timeout or the end of the body
+    assert elapsed < 2
+    assert os.listdir(tmp_path) == []
+
+
+def test_error_status_fails_without_file(fetcher, media_url, tmp_path):
+    result = fetcher.fetch(f"{media_url}/missing")
+
+    assert result == {'status': 'failed', 'error': 'Failed to download media: 404'}
+    assert os.listdir(tmp_path) == []
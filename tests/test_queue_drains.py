@@ -0,0 +1,165 @@
+"""Tests for the per-session queue drain tasks."""
+
+import pytest
+
+from app import db
+from app.models.message_queue import MessageQueue
+from app.models.whatsapp_session import WhatsAppSession
+from app.tasks import whatsapp_tasks
+from app.tasks.whatsapp_tasks import dispatch_queue_drains_task, drain_session_queue_task
+from app.utils.redis_client import acquire_lock
+
+
+class FakeQueueService:
+    """Sends due queue items by marking them sent."""
+
+    def __init__(self, session, result=None, error=None):
+        self.session = session
+        self.result = result
+        self.error = error
+        self.limits = []
+
+    def process_queue(self, limit):
+        self.limits.append(limit)
+        if self.error:
+            raise self.error
+        if self.result:
+            return self.result
+        items = MessageQueue.query.filter_by(session_id=self.session.id, status='pending').limit(limit).all()
+        for item in items:
+            item.status = 'sent'
+        db.session.commit()
+        return {'status': 'success', 'processed_count': len(items)}
+
+
+def add_session(session_id, rate_per_minute=60, is_active=True):
+    session = WhatsAppSession(session_id=session_id, name=session_id, rate_per_minute=rate_per_minute,
+                              is_active=is_active)
+    db.session.add(session)
+    db.session.commit()
+    return session
+
+
+def queue(session, count):
+    for index in range(count):
+        db.session.add(MessageQueue(session_id=session.id, recipient=f"+1555000{index:04d}",
+                                    message='hi', status='pending'))
+    db.session.commit()
+
+
+@pytest.fixture
+def started(app, redis, monkeypatch):
+    """Capture drain tasks instead of sending them to a broker."""
+    started = []
+    monkeypatch.setattr(drain_session_queue_task, 'delay', lambda *args: started.append((args, 0)))
+    monkeypatch.setattr(drain_session_queue_task, 'apply_async',
+                        lambda args, countdown: started.append((args, countdown)))
+    return started
+
+
+def use_service(monkeypatch, service):
+    monkeypatch.setattr(whatsapp_tasks.WhatsAppTask, 'get_whatsapp_service', lambda self, session_id: service)
+
+
+def test_dispatch_starts_one_drain_per_session_with_due_messages(started, redis):
+    busy = add_session('busy')
+    queue(busy, 3)
+    add_session('idle')
+    queue(add_session('inactive', is_active=False), 3)
+
+    result = dispatch_queue_drains_task.apply().get()
+
+    assert result['sessions'] == [{'session_id': 'busy', 'depth': 3, 'batch_size': 3}]
+    assert [args[:2] for args, _ in started] == [('busy', 3)]
+    assert redis.get('blastify:drain:busy') == started[0][0][2]
+
+
+def test_dispatch_skips_session_already_being_drained(started):
+    queue(add_session('busy'), 3)
+    acquire_lock('blastify:drain:busy', 60)
+
+    result = dispatch_queue_drains_task.apply().get()
+
+    assert result['sessions'] == []
+    assert started == []
+
+
+def test_dispatch_sizes_batch_by_session_rate(started):
+    # 60 messages a minute over a 10 second drain interval
+    queue(add_session('busy', rate_per_minute=60), 50)
+
+    dispatch_queue_drains_task.apply()
+
+    assert started[0][0][1] == 10
+
+
+def test_drain_continues_while_messages_are_due(started, redis, monkeypatch):
+    session = add_session('busy', rate_per_minute=60)
+    queue(session, 15)
+    use_service(monkeypatch, FakeQueueService(session))
+    token = acquire_lock('blastify:drain:busy', 60)
+
+    result = drain_session_queue_task.apply(args=('busy', 10, token)).get()
+
+    assert result['processed_count'] == 10
+    assert result['continued'] is True
+    (args, countdown), = started
+    assert args == ('busy', 5, token)
+    # Ten messages at one a second, less the time the batch took
+    assert 9 < countdown <= 10
+    assert redis.get('blastify:drain:busy') == token
+    assert redis.ttl('blastify:drain:busy') == 300
+
+
+def test_drain_releases_lock_when_queue_is_empty(started, redis, monkeypatch):
+    session = add_session('busy')
+    queue(session, 5)
+    use_service(monkeypatch, FakeQueueService(session))
+    token = acquire_lock('blastify:drain:busy', 60)
+
+    result = drain_session_queue_task.apply(args=('busy', 10, token)).get()
+
+    assert 'continued' not in result
+    assert started == []
+    assert redis.get('blastify:drain:busy') is None
+
+
+@pytest.mark.parametrize('service_result', [
+    {'status': 'success', 'processed_count': 0},
+    {'status': 'success', 'processed_count': 3, 'circuit_open': True},
+    {'status': 'failed', 'error': 'session disconnected'},
+])
+def test_drain_stops_when_nothing_can_be_sent(started, redis, monkeypatch, service_result):
+    session = add_session('busy')
+    queue(session, 5)
+    use_service(monkeypatch, FakeQueueService(session, result=service_result))
+    token = acquire_lock('blastify:drain:busy', 60)
+
+    drain_session_queue_task.apply(args=('busy', 10, token))
+
+    assert started == []
+    assert redis.get('blastify:drain:busy') is None
+
+
+def test_drain_releases_lock_on_error(started, redis, monkeypatch):
+    session = add_session('busy')
+    use_service(monkeypatch, FakeQueueService(session, error=RuntimeError('boom')))
+    token = acquire_lock('blastify:drain:busy', 60)
+
+    result = drain_session_queue_task.apply(args=('busy', 10, token)).get()
+
+    assert result == {'status': 'failed', 'error': 'boom'}
+    assert redis.get('blastify:drain:busy') is None
+
+
+def test_drain_stops_when_lock_was_taken_over(started, redis, monkeypatch):
+    session = add_session('busy')
+    queue(session, 15)
+    use_service(monkeypatch, FakeQueueService(session))
+    redis.set('blastify:drain:busy', 'other-drain')
+
+    result = drain_session_queue_task.apply(args=('busy', 10, 'expired-token')).get()
+
+    assert 'continued' not in result
+    assert started == []
+    assert redis.get('blastify:drain:busy') == 'other-drain'
@@ -0,0 +1,145 @@
+"""Tests for delivery receipt parsing and reconciliation."""
+
+import pytest
+
+from app import db
+from app.models.campaign import Campaign, CampaignRecipient
+from app.models.message import Message, MessageEvent
+from app.models.message_queue import MessageQueue
+from app.models.whatsapp_session import WhatsAppSession
+from app.services import reconciliation
+from app.services.receipts import collapse_receipts, parse_green_api_notification
+from app.services.reconciliation import ReceiptReconciler, BUFFER_KEY, BUFFER_SEEN_KEY
+
+
+def receipt(external_id, status, error=None):
+    return {'provider': 'green_api', 'external_id': external_id, 'status': status,
+            'timestamp': 1700000000, 'error': error}
+
+
+def test_parse_green_api_status():
+    parsed = parse_green_api_notification({
+        'typeWebhook': 'outgoingMessageStatus', 'idMessage': 'ABC', 'status': 'noAccount',
+        'timestamp': 1700000000, 'description': 'No WhatsApp account'
+    })
+    assert parsed['status'] == 'failed'
+    assert parsed['error'] == 'No WhatsApp account'
+    assert parse_green_api_notification({'typeWebhook': 'incomingMessageReceived'}) is None
+
+
+@pytest.mark.parametrize('payload', [
+    {'typeWebhook': 'outgoingMessageStatus', 'status': 'read'},
+    {'typeWebhook': 'outgoingMessageStatus', 'idMessage': 'ABC', 'status': 'bogus'},
+])
+def test_parse_green_api_rejects_bad_status(payload):
+    with pytest.raises(ValueError):
+        parse_green_api_notification(payload)
+
+
+def test_collapse_keeps_furthest_status():
+    latest = collapse_receipts([
+        receipt('a', 'read'), receipt('a', 'delivered'), receipt('a', 'sent'),
+        receipt('b', 'sent'), receipt('b', 'failed'),
+        receipt('c', 'delivered'), receipt('c', 'failed'),
+        receipt(None, 'read'), receipt('d', 'unknown'),
+    ])
+    assert {external_id: r['status'] for external_id, r in latest.items()} == {
+        'a': 'read', 'b': 'failed', 'c': 'delivered'
+    }
+
+
+@pytest.fixture
+def stored(app, redis):
+    session = WhatsAppSession(session_id='receipts', name='Receipts')
+    campaign = Campaign(name='Launch', message='hi')
+    db.session.add_all([session, campaign])
+    db.session.commit()
+
+    queued = MessageQueue(session_id=session.id, recipient='+15550000001', message='hi', status='sent')
+    db.session.add(queued)
+    db.session.commit()
+
+    message = Message(platform='whatsapp', recipient='+15550000001', message_text='hi',
+                      status='sent', external_id='m1', queue_id=queued.id)
+    recipient = CampaignRecipient(campaign_id=campaign.id, recipient='+15550000002',
+                                  status='sent', external_id='r1')
+    db.session.add_all([message, recipient])
+    db.session.commit()
+    return {'message': message.id, 'queued': queued.id, 'recipient': recipient.id}
+
+
+def statuses(stored):
+    return (Message.query.get(stored['message']).status,
+            MessageQueue.query.get(stored['queued']).status,
+            CampaignRecipient.query.get(stored['recipient']).status)
+
+
+def test_reconcile_moves_status_forward_only(stored):
+    reconciler = ReceiptReconciler()
+    counts = reconciler.reconcile([receipt('m1', 'read'), receipt('r1', 'delivered'), receipt('m1', 'delivered')])
+    assert counts['messages'] == 1
+    assert counts['message_queue'] == 1
+    assert counts['campaign_recipients'] == 1
+    assert statuses(stored) == ('read', 'read', 'delivered')
+
+    # Late receipts for earlier statuses are ignored
+    counts = reconciler.reconcile([receipt('m1', 'delivered'), receipt('r1', 'sent'), receipt('r1', 'failed')])
+    assert counts['messages'] == 0
+    assert counts['campaign_recipients'] == 0
+    assert statuses(stored) == ('read', 'read', 'delivered')
+
+    events = MessageEvent.query.filter_by(message_id=stored['message']).all()
+    assert [event.status for event in events] == ['read']
+
+
+def test_failure_after_sent_is_applied(stored):
+    ReceiptReconciler().reconcile([receipt('r1', 'failed', 'No WhatsApp account')])
+    assert CampaignRecipient.query.get(stored['recipient']).status == 'failed'
+
+
+def test_unmatched_receipts_are_buffered_then_matched(stored, redis):
+    reconciler = ReceiptReconciler()
+    counts = reconciler.reconcile([receipt('m2', 'delivered'), receipt('m2', 'sent')])
+    assert counts['buffered'] == 1
+    assert redis.hexists(BUFFER_KEY, 'm2')
+
+    # A later receipt for the same message is merged into the buffer
+    reconciler.reconcile([receipt('m2', 'read')])
+    assert reconciler.retry_buffered() == {'retried': 1, 'matched': 0, 'expired': 0}
+
+    db.session.add(Message(platform='whatsapp', recipient='+15550000003', message_text='hi',
+                           status='sent', external_id='m2'))
+    db.session.commit()
+
+    assert reconciler.retry_buffered() == {'retried': 1, 'matched': 1, 'expired': 0}
+    assert Message.query.filter_by(external_id='m2').one().status == 'read'
+    assert not redis.exists(BUFFER_KEY)
+    assert not redis.exists(BUFFER_SEEN_KEY)
+
+
+def test_matching_receipt_clears_buffered_one(stored, redis):
+    reconciler = ReceiptReconciler()
+    reconciler.reconcile([receipt('m2', 'delivered')])
+    db.session.add(Message(platform='whatsapp', recipient='+15550000003', message_text='hi',
+                           status='sent', external_id='m2'))
+    db.session.commit()
+
+    reconciler.reconcile([receipt('m2', 'read')])
+    assert not redis.hexists(BUFFER_KEY, 'm2')
+
+
+def test_buffered_receipts_expire(stored, redis, app, monkeypatch):
+    app.config['RECEIPT_BUFFER_TTL'] = 60
+    reconciler = ReceiptReconciler()
+
+    now = 1700000000.0
+    monkeypatch.setattr(reconciliation.time, 'time', lambda: now)
+    reconciler.reconcile([receipt('gone', 'delivered')])
+
+    now += 30
+    assert reconciler.retry_buffered()['expired'] == 0
+
+    now += 31
+    assert reconciler.retry_buffered() == {'retried': 0, 'matched': 0, 'expired': 1}
+    assert not redis.hexists(BUFFER_KEY, 'gone')
+    assert redis.zcard(BUFFER_SEEN_KEY) == 0
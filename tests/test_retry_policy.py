@@ -0,0 +1,102 @@
+"""Tests for error classification and retry scheduling."""
+
+import pytest
+
+from app.services import retry_policy
+from app.services.retry_policy import (
+    classify_error, is_provider_failure, backoff_delay, retry_delay,
+    TRANSIENT, RATE_LIMIT, PERMANENT
+)
+
+
+@pytest.mark.parametrize('result, expected', [
+    ({'error': 'Connection reset by peer'}, TRANSIENT),
+    ({'error': 'Server error', 'http_status': 500}, TRANSIENT),
+    ({'error': 'Too Many Requests: retry after 5'}, RATE_LIMIT),
+    ({'error': 'Flood control exceeded'}, RATE_LIMIT),
+    ({'error': 'Bad request', 'http_status': 429}, RATE_LIMIT),
+    ({'error': 'Unknown', 'http_status': 466}, RATE_LIMIT),
+    ({'error': 'Invalid phone number'}, PERMANENT),
+    ({'error': 'Forbidden: bot was blocked by the user'}, PERMANENT),
+    ({'error': 'Not found', 'http_status': 404}, PERMANENT),
+    ({'error': None}, TRANSIENT),
+    ('chat not found', PERMANENT),
+    ('', TRANSIENT),
+    (None, TRANSIENT),
+])
+def test_classify_error(result, expected):
+    assert classify_error(result) == expected
+
+
+def test_rate_limit_wins_over_permanent_status():
+    assert classify_error({'error': 'rate limit reached', 'http_status': 403}) == RATE_LIMIT
+
+
+@pytest.mark.parametrize('result, expected', [
+    ({'status': 'sent'}, False),
+    ({'status': 'queued'}, False),
+    ({'status': 'success'}, False),
+    ({'status': 'failed', 'error': 'Invalid phone number'}, False),
+    ({'status': 'failed', 'error': 'timeout'}, True),
+    ({'status': 'failed', 'error': 'x', 'http_status': 429}, True),
+    ({'status': 'error', 'error': 'x', 'http_status': 502}, True),
+])
+def test_is_provider_failure(result, expected):
+    assert is_provider_failure(result) is expected
+
+
+def test_backoff_delay_doubles_with_jitter(monkeypatch):
+    monkeypatch.setattr(retry_policy.random, 'uniform', lambda low, high: high)
+    assert [backoff_delay(attempt, 10, 1000) for attempt in (1, 2, 3, 4)] == [10, 20, 40, 80]
+
+    monkeypatch.setattr(retry_policy.random, 'uniform', lambda low, high: low)
+    assert backoff_delay(1, 10, 1000) == 5
+
+
+def test_backoff_delay_is_capped(monkeypatch):
+    monkeypatch.setattr(retry_policy.random, 'uniform', lambda low, high: high)
+    assert backoff_delay(20, 10, 300) == 300
+    assert backoff_delay(0, 10, 300) == 10
+
+
+def test_retry_delay_uses_message_limit_for_transient_errors():
+    result = {'error': 'timeout'}
+    assert retry_delay(result, 2, 3) is not None
+    assert retry_delay(result, 3, 3) is None
+
+
+def test_retry_delay_rate_limit_has_own_limit():
+    result = {'error': 'x', 'http_status': 429}
+    assert retry_delay(result, 9, 3) is not None
+    assert retry_delay(result, 10, 3) is None
+
+
+def test_retry_delay_never_retries_permanent_errors():
+    assert retry_delay({'error': 'Invalid phone number'}, 1, 5) is None
+
+
+def test_retry_delay_within_policy_bounds():
+    for attempt in range(1, 6):
+        delay = retry_delay({'error': 'timeout'}, attempt, 10)
+        full = min(3600, 30 * 2 ** (attempt - 1))
+        assert full / 2 <= delay <= full
+
+
+def test_retry_delay_honours_retry_after(monkeypatch):
+    monkeypatch.setattr(retry_policy.random, 'uniform', lambda low, high: low)
+    result = {'error': 'Too many requests', 'retry_after': 500}
+    assert retry_delay(result, 1, 3) == 500
+    assert retry_delay({'error': 'Too many requests', 'retry_after': 1}, 1, 3) == 30
+
+
+def test_policies_come_from_app_config():
+    from app import create_app
+    from config import TestingConfig
+
+    app = create_app(TestingConfig)
+    policies = dict(retry_policy.DEFAULT_POLICIES)
+    policies[TRANSIENT] = {'base_delay': 1, 'max_delay': 2, 'max_retries': 1}
+    app.config['RETRY_POLICIES'] = policies
+    with app.app_context():
+        assert retry_delay({'error': 'timeout'}, 1, 10) is None
+        assert 1 <= backoff_delay(5) <= 2
@@ -0,0 +1,129 @@
+"""Tests for the scheduled message dispatcher and the stale claim sweep."""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db
+from app.models.message_queue import MessageQueue
+from app.models.whatsapp_session import WhatsAppSession
+from app.services.scheduler import MessageScheduler
+from app.tasks.whatsapp_tasks import release_stale_claims_task
+
+NOW = datetime(2026, 1, 1, 12, 0, 0)
+
+
+@pytest.fixture
+def session(app):
+    session = WhatsAppSession(session_id='scheduler', name='Scheduler')
+    db.session.add(session)
+    db.session.commit()
+    return session
+
+
+def queue(session, in_seconds=None, status='pending', **fields):
+    item = MessageQueue(session_id=session.id, recipient='+15550000000', message='hi', status=status,
+                        scheduled_at=NOW + timedelta(seconds=in_seconds) if in_seconds is not None else None,
+                        **fields)
+    db.session.add(item)
+    db.session.commit()
+    return item.id
+
+
+@pytest.fixture
+def dispatched():
+    return []
+
+
+@pytest.fixture
+def scheduler(app, dispatched):
+    return MessageScheduler(dispatch=dispatched.append, window_seconds=60, batch_size=100)
+
+
+def test_dispatches_due_messages_in_scheduled_order(session, scheduler, dispatched):
+    later = queue(session, in_seconds=-5)
+    earlier = queue(session, in_seconds=-10)
+    future = queue(session, in_seconds=30)
+
+    scheduler.refill(NOW)
+
+    assert scheduler.dispatch_due(NOW) == 2
+    assert dispatched == [earlier, later]
+    assert scheduler.dispatch_due(NOW + timedelta(seconds=30)) == 1
+    assert dispatched == [earlier, later, future]
+
+
+def test_loads_only_pending_scheduled_messages_within_window(session, scheduler):
+    queue(session, in_seconds=10)
+    queue(session, in_seconds=120)
+    queue(session, in_seconds=10, status='sent')
+    queue(session)
+
+    assert scheduler.refill(NOW) == 1
+
+
+def test_refill_does_not_load_a_message_twice(session, scheduler, dispatched):
+    queue(session, in_seconds=10)
+
+    scheduler.refill(NOW)
+    scheduler.refill(NOW + timedelta(seconds=1))
+
+    assert len(scheduler.heap) == 1
+    scheduler.dispatch_due(NOW + timedelta(seconds=10))
+    assert len(dispatched) == 1
+
+
+def test_window_advances_in_batches(session, dispatched):
+    scheduler = MessageScheduler(dispatch=dispatched.append, window_seconds=60, batch_size=2)
+    ids = [queue(session, in_seconds=seconds) for seconds in (5, 1, 4, 2, 3)]
+
+    for _ in range(3):
+        scheduler.refill(NOW)
+        scheduler.dispatch_due(NOW + timedelta(seconds=10))
+
+    assert dispatched == [ids[1], ids[3], ids[4], ids[2], ids[0]]
+
+
+def test_picks_up_message_queued_inside_window_already_read(session, scheduler, dispatched):
+    scheduler.refill(NOW)
+    added = queue(session, in_seconds=10)
+
+    scheduler.refill(NOW + timedelta(seconds=1))
+    scheduler.dispatch_due(NOW + timedelta(seconds=10))
+
+    assert dispatched == [added]
+
+
+def test_dispatch_error_does_not_stop_other_messages(session, app):
+    sent = []
+
+    def dispatch(queue_id):
+        if queue_id == failing:
+            raise RuntimeError('broker down')
+        sent.append(queue_id)
+
+    failing = queue(session, in_seconds=-2)
+    other = queue(session, in_seconds=-1)
+    scheduler = MessageScheduler(dispatch=dispatch, window_seconds=60, batch_size=100)
+    scheduler.refill(NOW)
+
+    assert scheduler.dispatch_due(NOW) == 1
+    assert sent == [other]
+    assert scheduler.heap == []
+
+
+def test_stale_claims_are_released_or_failed(session):
+    stale_at = datetime.utcnow() - timedelta(hours=1)
+    stale = queue(session, status='processing', updated_at=stale_at, retry_count=0, max_retries=3)
+    exhausted = queue(session, status='processing', updated_at=stale_at, retry_count=2, max_retries=3)
+    recent = queue(session, status='processing', updated_at=datetime.utcnow(), retry_count=0)
+
+    result = release_stale_claims_task.apply().get()
+
+    assert result == {'status': 'success', 'released': 1, 'failed': 1}
+    db.session.expire_all()
+    stale, exhausted, recent = (db.session.get(MessageQueue, queue_id) for queue_id in (stale, exhausted, recent))
+    assert (stale.status, stale.retry_count) == ('pending', 1)
+    assert stale.next_attempt_at is not None
+    assert (exhausted.status, exhausted.retry_count) == ('failed', 3)
+    assert (recent.status, recent.retry_count) == ('processing', 0)
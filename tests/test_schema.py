@@ -0,0 +1,40 @@
+"""Tests for upgrading databases created before the current models."""
+
+from sqlalchemy import inspect, text
+
+from app import db
+from app.models.message import Message, MessageEvent
+from app.utils.schema import upgrade_schema
+
+
+def test_upgrade_adds_missing_tables_columns_and_indexes(app):
+    MessageEvent.__table__.drop(db.engine)
+    Message.__table__.drop(db.engine)
+    with db.engine.begin() as connection:
+        connection.execute(text(
+            "CREATE TABLE messages (id INTEGER PRIMARY KEY, platform VARCHAR(20) NOT NULL, "
+            "recipient VARCHAR(64) NOT NULL, message_text TEXT NOT NULL, media_url VARCHAR(255), "
+            "status VARCHAR(20), external_id VARCHAR(64), created_at DATETIME, sent_at DATETIME)"
+        ))
+        connection.execute(text(
+            "INSERT INTO messages (platform, recipient, message_text, status) "
+            "VALUES ('whatsapp', '+15550000001', 'hi', 'sent')"
+        ))
+
+    changes = upgrade_schema()
+    assert 'Created table message_events' in changes
+    assert 'Added column messages.queue_id' in changes
+    assert 'Created index ix_messages_status_created_at' in changes
+
+    inspector = inspect(db.engine)
+    columns = {column['name'] for column in inspector.get_columns('messages')}
+    assert {'error_message', 'session_id', 'campaign_id', 'job_id', 'queue_id', 'updated_at'} <= columns
+    indexes = {index['name'] for index in inspector.get_indexes('messages')}
+    assert {'ix_messages_external_id', 'ix_messages_queue_id', 'ix_messages_job_id',
+            'ix_messages_status_created_at'} <= indexes
+
+    message = Message.query.one()
+    assert message.status == 'sent'
+    assert message.queue_id is None
+
+    assert upgrade_schema() == []
@@ -0,0 +1,149 @@
+"""Tests for resuming bulk sends without sending a message twice."""
+
+import pytest
+
+from app.models.bulk_job import BulkJobResult
+from app.services.checkpoint import TaskCheckpoint
+from app.services.send_ledger import SendLedger, message_key
+from app.tasks import whatsapp_tasks
+from app.tasks.bulk import send_once
+from app.tasks.whatsapp_tasks import send_bulk_chunk_task
+
+MESSAGES = [{'recipient': f"+1555000000{index}", 'message': 'hi'} for index in range(6)]
+
+
+class WorkerLost(BaseException):
+    """Stands in for a worker process dying mid-task."""
+
+
+class FakeService:
+    """Sends messages with canned results, optionally dying after some sends."""
+
+    def __init__(self, fail=(), die_after=None):
+        self.sent = []
+        self.fail = set(fail)
+        self.die_after = die_after
+
+    def _result(self, recipient):
+        if recipient in self.fail:
+            return {'status': 'failed', 'error': 'invalid number'}
+        return {'status': 'success', 'message_id': f"ext-{recipient}"}
+
+    def send_message(self, recipient, message=None, media_url=None, **kwargs):
+        if self.die_after is not None and len(self.sent) == self.die_after:
+            raise WorkerLost()
+        self.sent.append(recipient)
+        return self._result(recipient)
+
+    def send_many(self, messages, on_result=None):
+        results = []
+        for index, msg in enumerate(messages):
+            self.sent.append(msg['recipient'])
+            results.append(self._result(msg['recipient']))
+            if on_result:
+                on_result(index, results[-1])
+        return results
+
+
+def test_ledger_records_only_sent_messages(redis):
+    ledger = SendLedger('job-1')
+
+    ledger.record(MESSAGES[0], {'status': 'success', 'message_id': 'ext-0'})
+    ledger.record(MESSAGES[1], {'status': 'failed', 'error': 'invalid number'})
+
+    assert ledger.lookup(MESSAGES[:3]) == [
+        {'status': 'success', 'message_id': 'ext-0', 'replayed': True}, None, None
+    ]
+    assert 0 < redis.ttl('blastify:sent:job-1') <= 24 * 60 * 60
+
+
+def test_ledger_tells_apart_messages_to_same_recipient():
+    first = {'recipient': '+15550000000', 'message': 'hi'}
+
+    assert message_key(first) == message_key(dict(first))
+    assert message_key(first) != message_key(dict(first, message='bye'))
+    assert message_key(first) != message_key(dict(first, media_url='https://example.com/a.png'))
+
+
+def test_ledgers_are_kept_per_job(redis):
+    SendLedger('job-1').record(MESSAGES[0], {'status': 'success'})
+
+    assert SendLedger('job-2').lookup(MESSAGES[:1]) == [None]
+
+
+def test_send_once_skips_messages_already_sent(redis):
+    ledger = SendLedger('job-1')
+    ledger.record(MESSAGES[1], {'status': 'success', 'message_id': 'ext-earlier'})
+    service = FakeService()
+    reported = []
+
+    results = send_once(service, MESSAGES[:3], ledger, on_result=lambda index, result: reported.append(index))
+
+    assert service.sent == [MESSAGES[0]['recipient'], MESSAGES[2]['recipient']]
+    assert [result.get('replayed', False) for result in results] == [False, True, False]
+    assert results[1]['message_id'] == 'ext-earlier'
+    assert reported == [0, 1]
+
+
+def test_send_once_sends_failed_messages_again(redis):
+    ledger = SendLedger('job-1')
+    failing = MESSAGES[1]['recipient']
+
+    send_once(FakeService(fail={failing}), MESSAGES[:3], ledger)
+    service = FakeService()
+    results = send_once(service, MESSAGES[:3], ledger)
+
+    assert service.sent == [failing]
+    assert [result['status'] for result in results] == ['success'] * 3
+
+
+def test_checkpoint_round_trip(redis):
+    checkpoint = TaskCheckpoint('task-1')
+    assert checkpoint.load() is None
+
+    checkpoint.save(4, {'successful': 3, 'failed': 1})
+    assert TaskCheckpoint('task-1').load() == {'offset': 4, 'results': {'successful': 3, 'failed': 1}}
+
+    checkpoint.clear()
+    assert checkpoint.load() is None
+
+
+@pytest.fixture
+def chunk(app, redis, monkeypatch):
+    """Run the bulk chunk task with a fake service and a fixed task ID."""
+    app.config['BULK_CHECKPOINT_EVERY'] = 2
+
+    def run(service):
+        monkeypatch.setattr(whatsapp_tasks.WhatsAppTask, 'get_whatsapp_service',
+                            lambda self, session_id=None: service)
+        return send_bulk_chunk_task.apply(args=(None, MESSAGES, 0), kwargs={'job_id': 'job-1'},
+                                          task_id='chunk-1', throw=True).get()
+    return run
+
+
+def test_chunk_resumes_from_checkpoint_after_worker_is_lost(chunk):
+    with pytest.raises(WorkerLost):
+        chunk(FakeService(die_after=4))
+
+    assert TaskCheckpoint('chunk-1').load()['offset'] == 4
+    assert BulkJobResult.query.filter_by(job_id='job-1').count() == 4
+
+    service = FakeService()
+    results = chunk(service)
+
+    assert service.sent == [MESSAGES[4]['recipient'], MESSAGES[5]['recipient']]
+    assert results == {'total': 6, 'successful': 6, 'failed': 0}
+    assert BulkJobResult.query.filter_by(job_id='job-1').count() == 6
+    assert TaskCheckpoint('chunk-1').load() is None
+
+
+def test_chunk_does_not_resend_messages_sent_after_checkpoint(chunk):
+    # Dies after sending message 4, which the checkpoint at 4 does not cover
+    with pytest.raises(WorkerLost):
+        chunk(FakeService(die_after=5))
+
+    service = FakeService()
+    results = chunk(service)
+
+    assert MESSAGES[4]['recipient'] not in service.sent
+    assert results['successful'] == 6
@@ -0,0 +1,140 @@
+"""Tests for load balancing bulk sends across WhatsApp accounts."""
+
+import threading
+from collections import Counter
+
+import pytest
+
+from app.services.circuit_breaker import CircuitBreaker
+from app.services.sender_pool import SenderPool, SenderAccount, PIN_PREFIX
+
+
+class FakeService:
+    """Account service that reports each send from its own thread."""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.sent = []
+
+    def send_many(self, messages, on_result=None):
+        results = []
+        for index, msg in enumerate(messages):
+            self.sent.append(msg['recipient'])
+            result = {'status': 'failed', 'error': 'boom'} if self.fail else {'status': 'sent'}
+            results.append(result)
+            if on_result:
+                on_result(index, result)
+        return results
+
+
+def account(key, rate=100, breaker=None, service=None):
+    return SenderAccount(key, service or FakeService(), rate, breaker)
+
+
+def recipients(count):
+    return [f"+1555{index:07d}" for index in range(count)]
+
+
+def test_assign_is_proportional_to_remaining_budget(redis):
+    pool = SenderPool([account('a', 300), account('b', 100)])
+    counts = Counter(pool.assign(recipients(4000)))
+    assert counts['a'] + counts['b'] == 4000
+    assert 0.70 < counts['a'] / 4000 < 0.80
+
+
+def test_weights_use_budget_left_and_error_rate(redis):
+    breaker = CircuitBreaker('b', min_calls=100)
+    breaker.record(True)
+    breaker.record(False)
+    pool = SenderPool([account('a', 100), account('b', 100, breaker)])
+    pool.assign(recipients(1))
+
+    weights = pool.weights()
+    assert weights['a'] + weights['b'] == pytest.approx(149.5, abs=0.5)
+    assert weights['b'] <= 50
+
+
+def test_open_account_gets_no_recipients(redis):
+    breaker = CircuitBreaker('b', min_calls=1, open_seconds=60)
+    breaker.record(False)
+    pool = SenderPool([account('a'), account('b', breaker=breaker)])
+    assert set(pool.assign(recipients(50))) == {'a'}
+
+
+def test_every_account_open_assigns_nothing(redis):
+    breaker = CircuitBreaker('a', min_calls=1, open_seconds=60)
+    breaker.record(False)
+    pool = SenderPool([account('a', breaker=breaker)])
+    assert pool.assign(recipients(3)) == [None, None, None]
+
+
+def test_spent_budgets_fall_back_to_healthy_accounts(redis):
+    pool = SenderPool([account('a', 2), account('b', 2)])
+    pool.assign(recipients(10))
+    assert pool.weights() == {'a': 0.0, 'b': 0.0}
+    assert set(pool.assign([f"+1666{index:07d}" for index in range(20)])) == {'a', 'b'}
+
+
+def test_recipient_stays_pinned(redis):
+    pool = SenderPool([account('a', 100), account('b', 100)])
+    first = pool.assign(recipients(200))
+
+    # The pinned account keeps its recipients even with its budget spent
+    pool.accounts['a'].rate_per_minute = 1
+    assert pool.assign(recipients(200)) == first
+    assert redis.get(f"{PIN_PREFIX}:{recipients(1)[0]}") == first[0]
+
+
+def test_pin_moves_when_account_opens_or_leaves(redis):
+    breaker = CircuitBreaker('a', min_calls=1, open_seconds=60)
+    pool = SenderPool([account('a', breaker=breaker), account('b')])
+    redis.set(f"{PIN_PREFIX}:+15550000001", 'a')
+    redis.set(f"{PIN_PREFIX}:+15550000002", 'gone')
+
+    assert pool.assign(['+15550000001', '+15550000002']) == ['a', 'b']
+    assert redis.get(f"{PIN_PREFIX}:+15550000002") == 'b'
+
+    breaker.record(False)
+    assert pool.assign(['+15550000001']) == ['b']
+    assert redis.get(f"{PIN_PREFIX}:+15550000001") == 'b'
+
+
+def test_new_account_only_takes_recipients(redis):
+    before = SenderPool([account('a'), account('b')]).assign(recipients(500))
+    redis.flushall()
+    after = SenderPool([account('a'), account('b'), account('c')]).assign(recipients(500))
+
+    moved = [(old, new) for old, new in zip(before, after) if old != new]
+    assert moved
+    assert all(new == 'c' for _, new in moved)
+
+
+def test_send_many_reports_on_calling_thread(redis):
+    services = {'a': FakeService(), 'b': FakeService(fail=True)}
+    pool = SenderPool([account(key, service=service) for key, service in services.items()])
+    messages = [{'recipient': recipient, 'message': 'hi'} for recipient in recipients(40)]
+
+    caller = threading.get_ident()
+    reported = []
+
+    def on_result(index, result):
+        assert threading.get_ident() == caller
+        reported.append(index)
+
+    results = pool.send_many(messages, on_result=on_result)
+
+    assert sorted(reported) == list(range(40))
+    assert {result['sender'] for result in results} == {'a', 'b'}
+    for msg, result in zip(messages, results):
+        assert msg['recipient'] in services[result['sender']].sent
+        assert result['status'] == ('sent' if result['sender'] == 'a' else 'failed')
+
+
+def test_send_many_defers_when_no_account_is_healthy(redis):
+    breaker = CircuitBreaker('a', min_calls=1, open_seconds=60)
+    breaker.record(False)
+    pool = SenderPool([account('a', breaker=breaker)])
+
+    result = pool.send_many([{'recipient': '+15550000001', 'message': 'hi'}])[0]
+    assert result['status'] == 'deferred'
+    assert 59 < result['retry_after'] <= 60
@@ -0,0 +1,115 @@
+"""Tests for the suppression list and duplicate removal."""
+
+import pytest
+
+from app import db
+from app.models.campaign import Campaign, CampaignRecipient
+from app.models.contact import Contact
+from app.models.suppression import SuppressedRecipient, suppression_key
+from app.services.suppression import SuppressionList, invalidate_suppression_snapshots
+
+
+@pytest.mark.parametrize('recipient', [
+    '+1 (555) 000-1234', '15550001234', '15550001234@c.us', '15550001234@s.whatsapp.net', ' 1555.000.1234 '
+])
+def test_suppression_key_ignores_formatting(recipient):
+    assert suppression_key(recipient) == '15550001234'
+
+
+def test_add_stores_each_recipient_once(app):
+    assert SuppressedRecipient.add(['+1 555 000 1234', '15550001234', '']) == 1
+    assert SuppressedRecipient.add(['15550001234', '15550009999'], reason='bounced') == 1
+
+    assert [row.recipient for row in SuppressedRecipient.query.order_by(SuppressedRecipient.id)] == [
+        '15550001234', '15550009999'
+    ]
+
+
+def test_remove_lifts_suppression(app):
+    SuppressedRecipient.add(['15550001234'])
+
+    assert SuppressedRecipient.remove('+1-555-000-1234') is True
+    assert SuppressedRecipient.remove('15550001234') is False
+
+
+@pytest.fixture
+def snapshot(app, redis):
+    return SuppressionList(ttl=0)
+
+
+def test_snapshot_matches_differently_formatted_recipients(snapshot):
+    SuppressedRecipient.add(['15550001234'])
+
+    assert snapshot.is_suppressed('+1 (555) 000-1234')
+    assert snapshot.is_suppressed('15550001234@c.us')
+    assert not snapshot.is_suppressed('15550009999')
+
+
+def test_snapshot_picks_up_new_suppressions(snapshot):
+    assert not snapshot.is_suppressed('15550001234')
+
+    SuppressedRecipient.add(['15550001234'])
+
+    assert snapshot.is_suppressed('15550001234')
+
+
+def test_snapshot_is_not_reread_within_ttl(app, redis):
+    snapshot = SuppressionList(ttl=60)
+    snapshot.refresh()
+
+    SuppressedRecipient.add(['15550001234'])
+
+    assert not snapshot.is_suppressed('15550001234')
+    snapshot.refresh(force=True)
+    assert snapshot.is_suppressed('15550001234')
+
+
+def test_lifted_suppression_reloads_snapshot(snapshot):
+    SuppressedRecipient.add(['15550001234', '15550009999'])
+    assert snapshot.is_suppressed('15550001234')
+
+    SuppressedRecipient.remove('15550001234')
+    invalidate_suppression_snapshots()
+
+    assert not snapshot.is_suppressed('15550001234')
+    assert snapshot.is_suppressed('15550009999')
+
+
+def test_filter_messages_drops_suppressed_and_duplicate_rows(snapshot):
+    SuppressedRecipient.add(['15550000000'])
+    messages = [
+        {'recipient': '+1 555 000 0000', 'message': 'hi'},
+        {'recipient': '15550001111', 'message': 'hi'},
+        {'recipient': '+1-555-000-1111', 'message': 'hi'},
+        {'recipient': '15550001111', 'message': 'bye'},
+        {'recipient': '15550001111', 'template_id': 1, 'variables': {'a': 1, 'b': 2}},
+        {'recipient': '15550001111', 'template_id': 1, 'variables': {'b': 2, 'a': 1}},
+        {'recipient': '15550001111', 'template_id': 1, 'variables': {'a': 2}},
+    ]
+
+    result = snapshot.filter_messages(messages)
+
+    assert result['messages'] == [messages[1], messages[3], messages[4], messages[6]]
+    assert [(row['recipient'], row['status']) for row in result['skipped']] == [
+        ('+1 555 000 0000', 'suppressed'),
+        ('+1-555-000-1111', 'duplicate'),
+        ('15550001111', 'duplicate'),
+    ]
+
+
+def test_campaign_recipients_skip_suppressed_and_repeated_numbers(app):
+    db.session.add_all([
+        Contact(name='Ann', phone='+1 555 000 0001', group='vip'),
+        Contact(name='Ann again', phone='15550000001', group='vip'),
+        Contact(name='Bob', phone='15550000002', group='vip'),
+        Contact(name='Cat', phone='15550000003', group='other'),
+    ])
+    campaign = Campaign(name='Launch', message='hi')
+    db.session.add(campaign)
+    db.session.commit()
+    SuppressedRecipient.add(['15550000002'])
+
+    assert campaign.materialize_recipients(groups=['vip']) == 1
+    assert [row.recipient for row in CampaignRecipient.query.filter_by(campaign_id=campaign.id)] == [
+        '+1 555 000 0001'
+    ]
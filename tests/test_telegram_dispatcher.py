@@ -0,0 +1,131 @@
+"""Tests for the Telegram broadcast dispatcher."""
+
+import time
+from collections import defaultdict
+
+import pytest
+
+from app.services.circuit_breaker import CircuitBreaker, CLOSED, OPEN
+from app.services.telegram_dispatcher import TelegramDispatcher
+
+TOKEN = '12345:secret'
+
+
+def ok(path, body):
+    return 200, {'ok': True, 'result': {'message_id': f"{body['chat_id']}-{time.monotonic()}"}}, {}
+
+
+def rate_limited(retry_after):
+    return 429, {'ok': False, 'error_code': 429, 'description': 'Too Many Requests',
+                 'parameters': {'retry_after': retry_after}}, {}
+
+
+@pytest.fixture
+def dispatcher(app, redis, http_server):
+    pytest.importorskip('aiohttp')
+    http_server.handler = ok
+    return TelegramDispatcher(TOKEN, api_url=http_server.url, global_rate=1000, chat_rate=1000, timeout=5)
+
+
+def requests_by_chat(http_server):
+    by_chat = defaultdict(list)
+    for at, path, body in http_server.requests:
+        by_chat[str(body['chat_id'])].append((at, path, body))
+    return by_chat
+
+
+def test_sends_text_and_media(dispatcher, http_server):
+    reported = []
+    results = dispatcher.send_many([
+        {'recipient': '1', 'message': 'hi'},
+        {'recipient': '2', 'message': 'look', 'media_url': 'http://example.com/a.jpg'},
+        {'recipient': '3', 'message': 'doc', 'media_url': 'http://example.com/a.pdf'},
+    ], on_result=lambda index, result: reported.append(index))
+
+    assert [result['status'] for result in results] == ['sent'] * 3
+    assert sorted(reported) == [0, 1, 2]
+
+    paths = {str(body['chat_id']): path for _, path, body in http_server.requests}
+    assert paths == {'1': f'/bot{TOKEN}/sendMessage', '2': f'/bot{TOKEN}/sendPhoto',
+                     '3': f'/bot{TOKEN}/sendDocument'}
+
+
+def test_chat_is_paced_and_kept_in_order(dispatcher, http_server):
+    dispatcher.chat_rate = 10
+    dispatcher.send_many([{'recipient': 'a', 'message': str(i)} for i in range(3)]
+                         + [{'recipient': 'b', 'message': 'x'}])
+
+    chat = requests_by_chat(http_server)['a']
+    assert [body['text'] for _, _, body in chat] == ['0', '1', '2']
+    assert all(later[0] - earlier[0] >= 0.09 for earlier, later in zip(chat, chat[1:]))
+    # Other chats do not wait for chat a
+    assert requests_by_chat(http_server)['b'][0][0] < chat[1][0]
+
+
+def test_global_rate_is_shared_by_dispatchers(dispatcher, http_server):
+    dispatcher.global_rate = 20
+    other = TelegramDispatcher(TOKEN, api_url=http_server.url, global_rate=20, chat_rate=1000)
+
+    started = time.monotonic()
+    dispatcher.send_many([{'recipient': str(i), 'message': 'x'} for i in range(5)])
+    other.send_many([{'recipient': str(i + 5), 'message': 'x'} for i in range(5)])
+    # Twenty per second across both dispatchers, so ten sends span nine intervals
+    assert time.monotonic() - started >= 0.4
+
+
+def test_bucket_is_keyed_by_bot_id_only(dispatcher, redis):
+    dispatcher.rate_limiter().try_acquire()
+    keys = redis.keys('*')
+    assert keys and all('secret' not in key for key in keys)
+    assert any(key.endswith('telegram:12345') for key in keys)
+
+
+def test_rate_limited_message_is_requeued(dispatcher, http_server):
+    responses = [rate_limited(0.2)]
+    http_server.handler = lambda path, body: responses.pop(0) if responses else ok(path, body)
+
+    results = dispatcher.send_many([{'recipient': 'a', 'message': '1'}, {'recipient': 'a', 'message': '2'}])
+    assert [result['status'] for result in results] == ['sent', 'sent']
+    assert 'retry_after' not in results[0]
+
+    chat = requests_by_chat(http_server)['a']
+    assert [body['text'] for _, _, body in chat] == ['1', '1', '2']
+    assert chat[1][0] - chat[0][0] >= 0.2
+
+
+def test_rate_limited_message_fails_after_max_retries(dispatcher, http_server):
+    dispatcher.max_retries = 1
+    http_server.handler = lambda path, body: rate_limited(0)
+
+    result = dispatcher.send_many([{'recipient': 'a', 'message': '1'}])[0]
+    assert result['status'] == 'failed'
+    assert 'retry_after' not in result
+    assert len(http_server.requests) == 2
+
+
+def test_429_on_probe_does_not_stick_breaker(dispatcher, http_server):
+    breaker = CircuitBreaker('telegram', min_calls=1, open_seconds=0.01)
+    dispatcher.breaker = breaker
+    breaker.record(False)
+    time.sleep(0.02)
+
+    responses = [rate_limited(0)]
+    http_server.handler = lambda path, body: responses.pop(0) if responses else ok(path, body)
+
+    results = dispatcher.send_many([{'recipient': 'a', 'message': '1'}, {'recipient': 'b', 'message': '2'}])
+    assert [result['status'] for result in results] == ['sent', 'sent']
+    assert breaker.state == CLOSED
+
+
+def test_open_breaker_defers_without_taking_budget(dispatcher, http_server):
+    dispatcher.global_rate = 1
+    breaker = CircuitBreaker('telegram', min_calls=1, open_seconds=60)
+    dispatcher.breaker = breaker
+    breaker.record(False)
+    assert breaker.state == OPEN
+
+    results = dispatcher.send_many([{'recipient': 'a', 'message': '1'}, {'recipient': 'b', 'message': '2'}])
+    assert [result['status'] for result in results] == ['deferred', 'deferred']
+    assert results[0]['retry_after'] > 0
+    assert http_server.requests == []
+    assert dispatcher.rate_limiter().try_acquire() == 0
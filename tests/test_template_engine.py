@@ -0,0 +1,131 @@
+"""Tests for template compilation and rendering."""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db
+from app.models.contact import Contact
+from app.models.message_queue import MessageTemplate
+from app.services.template_engine import CompiledTemplate, TemplateEngine
+
+
+def test_render_fills_placeholders():
+    template = CompiledTemplate('Hi {name}, your code is {code}.')
+    assert template.variables == {'name', 'code'}
+    assert template.render({'name': 'Ana', 'code': 42}) == 'Hi Ana, your code is 42.'
+
+
+def test_render_leaves_missing_variables_as_written():
+    template = CompiledTemplate('Hi {name}, see {link}')
+    variables = {'name': 'Ana', 'link': None}
+    assert template.render(variables) == 'Hi Ana, see {link}'
+    assert template.missing(variables) == ['link']
+
+
+def test_render_ignores_non_placeholder_braces():
+    template = CompiledTemplate('{name} paid {} for {a-b} {{name}}')
+    assert template.variables == {'name'}
+    assert template.render({'name': 'Ana'}) == 'Ana paid {} for {a-b} {Ana}'
+
+
+def test_render_plain_and_empty_content():
+    assert CompiledTemplate('No variables').render({}) == 'No variables'
+    assert CompiledTemplate('').render({'name': 'Ana'}) == ''
+    assert CompiledTemplate(None).render({}) == ''
+
+
+def test_compile_caches_drafts_by_content():
+    engine = TemplateEngine(max_size=2)
+    first = engine.compile('Hi {name}')
+    assert engine.compile('Hi {name}') is first
+    assert engine.compile('Hi {name}', 'http://example.com/a.png') is not first
+
+
+def test_cache_drops_least_recently_used():
+    engine = TemplateEngine(max_size=2)
+    first = engine.compile('a')
+    second = engine.compile('b')
+    assert engine.compile('a') is first
+    engine.compile('c')
+    assert engine.compile('a') is first
+    assert engine.compile('b') is not second
+
+
+@pytest.fixture
+def template(app):
+    template = MessageTemplate(name='Welcome', content='Hi {name} from {group}, {offer}',
+                               media_url='http://example.com/template.png')
+    db.session.add(template)
+    db.session.commit()
+    return template
+
+
+@pytest.fixture
+def contact(app):
+    contact = Contact(name='Ana', phone='+15550000001', group='vip')
+    db.session.add(contact)
+    db.session.commit()
+    return contact
+
+
+def test_get_recompiles_when_template_is_updated(template):
+    engine = TemplateEngine()
+    compiled = engine.get(template.id)
+    assert engine.get(template.id) is compiled
+
+    template.content = 'Bye {name}'
+    template.updated_at = datetime.utcnow() + timedelta(seconds=1)
+    db.session.commit()
+
+    updated = engine.get(template.id)
+    assert updated is not compiled
+    assert updated.render({'name': 'Ana'}) == 'Bye Ana'
+
+
+def test_get_skips_missing_and_inactive_templates(template):
+    engine = TemplateEngine()
+    assert engine.get(template.id + 1) is None
+
+    template.is_active = False
+    db.session.commit()
+    assert engine.get(template.id) is None
+
+
+def test_render_messages_uses_contact_fields_and_row_variables(template, contact):
+    rendered = TemplateEngine().render_messages([
+        {'recipient': contact.phone, 'template_id': template.id, 'contact_id': contact.id,
+         'variables': {'offer': '10% off'}},
+        {'recipient': contact.phone, 'template_id': template.id, 'contact_id': contact.id,
+         'variables': {'name': 'Dr. Ana', 'offer': 'free shipping'}},
+    ])
+    assert rendered[0]['message'] == 'Hi Ana from vip, 10% off'
+    assert rendered[1]['message'] == 'Hi Dr. Ana from vip, free shipping'
+
+
+def test_render_messages_media_url_fallback(template, contact):
+    rendered = TemplateEngine().render_messages([
+        {'recipient': contact.phone, 'template_id': template.id},
+        {'recipient': contact.phone, 'template_id': template.id, 'media_url': 'http://example.com/own.png'},
+    ])
+    assert rendered[0]['media_url'] == 'http://example.com/template.png'
+    assert rendered[1]['media_url'] == 'http://example.com/own.png'
+    assert rendered[0]['message'] == 'Hi {name} from {group}, {offer}'
+
+
+def test_render_messages_unknown_template(template):
+    rendered = TemplateEngine().render_messages([
+        {'recipient': '+15550000002', 'template_id': template.id + 100, 'message': 'fallback'},
+    ])
+    assert rendered[0]['message'] is None
+    assert rendered[0]['recipient'] == '+15550000002'
+
+
+def test_render_messages_leaves_plain_rows_unchanged(template):
+    plain = {'recipient': '+15550000003', 'message': 'Hello'}
+    messages = [plain, {'recipient': '+15550000004', 'template_id': template.id}]
+    rendered = TemplateEngine().render_messages(messages)
+    assert rendered[0] is plain
+
+    only_plain = [plain]
+    assert TemplateEngine().render_messages(only_plain) is only_plain
@@ -0,0 +1,116 @@
+"""Tests for the provider webhook endpoint."""
+
+import json
+from unittest import mock
+
+import pytest
+
+from app.routes import webhooks
+from app.services.receipts import ReceiptStream, STREAM_KEY
+
+STATUS = {'typeWebhook': 'outgoingMessageStatus', 'idMessage': 'ABC', 'status': 'delivered',
+          'timestamp': 1700000000}
+
+
+class FakeStream:
+    """Receipt stream that keeps what the endpoint appends."""
+
+    added = []
+    error = None
+
+    def add(self, receipt):
+        if self.error:
+            raise self.error
+        self.added.append(receipt)
+        return '1-0'
+
+
+@pytest.fixture
+def stream(app, monkeypatch):
+    monkeypatch.setattr(FakeStream, 'added', [])
+    monkeypatch.setattr(FakeStream, 'error', None)
+    monkeypatch.setattr(webhooks, 'ReceiptStream', FakeStream)
+    return FakeStream
+
+
+@pytest.fixture
+def client(app, stream):
+    return app.test_client()
+
+
+def test_status_notification_is_queued(client, stream):
+    response = client.post('/webhooks/green-api', json=STATUS)
+
+    assert response.status_code == 200
+    assert response.get_json() == {'success': True}
+    assert stream.added == [{'provider': 'green_api', 'external_id': 'ABC', 'status': 'delivered',
+                             'timestamp': 1700000000, 'error': None}]
+
+
+@pytest.mark.parametrize('headers, query', [
+    ({'Authorization': 'Bearer s3cret'}, ''),
+    ({}, '?token=s3cret'),
+])
+def test_valid_token_is_accepted(app, client, stream, headers, query):
+    app.config['GREEN_API_WEBHOOK_TOKEN'] = 's3cret'
+
+    response = client.post(f'/webhooks/green-api{query}', json=STATUS, headers=headers)
+
+    assert response.status_code == 200
+    assert len(stream.added) == 1
+
+
+@pytest.mark.parametrize('headers, query', [
+    ({}, ''),
+    ({'Authorization': 'Bearer wrong'}, ''),
+    ({'Authorization': 's3cret'}, ''),
+    ({}, '?token=wrong'),
+    ({'Authorization': 'Bearer wrong'}, '?token=s3cret'),
+])
+def test_missing_or_wrong_token_is_rejected(app, client, stream, headers, query):
+    app.config['GREEN_API_WEBHOOK_TOKEN'] = 's3cret'
+
+    response = client.post(f'/webhooks/green-api{query}', json=STATUS, headers=headers)
+
+    assert response.status_code == 401
+    assert stream.added == []
+
+
+@pytest.mark.parametrize('body', [
+    'not json',
+    json.dumps(['a list']),
+    json.dumps(dict(STATUS, status='bogus')),
+    json.dumps(dict(STATUS, idMessage=None)),
+])
+def test_malformed_notification_is_rejected(client, stream, body):
+    response = client.post('/webhooks/green-api', data=body, content_type='application/json')
+
+    assert response.status_code == 400
+    assert stream.added == []
+
+
+def test_other_notification_types_are_ignored(client, stream):
+    response = client.post('/webhooks/green-api', json={'typeWebhook': 'incomingMessageReceived'})
+
+    assert response.get_json() == {'success': True, 'ignored': True}
+    assert stream.added == []
+
+
+def test_unavailable_stream_asks_provider_to_redeliver(client, stream):
+    stream.error = ConnectionError('redis down')
+
+    response = client.post('/webhooks/green-api', json=STATUS)
+
+    assert response.status_code == 503
+
+
+def test_stream_add_appends_trimmed_entry(app):
+    app.config['RECEIPT_STREAM_MAXLEN'] = 500
+    redis_client = mock.Mock()
+    redis_client.xadd.return_value = '1-0'
+    receipt = {'provider': 'green_api', 'external_id': 'ABC', 'status': 'read'}
+
+    assert ReceiptStream(redis_client).add(receipt) == '1-0'
+
+    redis_client.xadd.assert_called_once_with(STREAM_KEY, {'receipt': json.dumps(receipt)},
+                                              maxlen=500, approximate=True)
@@ -250,8 +250,9 @@ def db_utils():
     
     Available commands:
       - recreate: Completely rebuild the database (WARNING: Deletes all data)
-      - update: Add new tables and columns without data loss
+      - update: Add new tables, columns and indexes without data loss
       - stats: Display database statistics for users, messages, and credentials
+      - archive: Move old message history to compressed archive files
     """
     pass
 
@@ -304,11 +305,14 @@ def update_db(backup):
             
             # Update the database schema
             click.echo("Updating database schema...")
-            # This approach uses SQLAlchemy's ability to create tables that don't exist
-            # It won't delete tables or columns, only add new ones
-            db.create_all()
-            click.echo("Database schema updated successfully.")
-            click.echo("Note: This only adds new tables and columns. It does not remove or modify existing ones.")
+            # Creates missing tables, then adds new columns and indexes to
+            # existing tables. It won't delete tables or columns, only add new ones
+            from app.utils.schema import upgrade_schema
+            changes = upgrade_schema()
+            for change in changes:
+                click.echo(f"  {change}")
+            click.echo("Database schema updated successfully." if changes else "Database schema is up to date.")
+            click.echo("Note: This only adds new tables, columns and indexes. It does not remove or modify existing ones.")
             click.echo("For more complex schema changes, use Flask-Migrate with 'flask db migrate' and 'flask db upgrade'.")
     except Exception as e:
         click.echo(f"Error updating database: {str(e)}")
@@ -337,6 +341,32 @@ def db_stats():
     except Exception as e:
         click.echo(f"Error getting database stats: {str(e)}")
 
+@db_utils.command('archive')
+@click.option('--message-days', default=None, type=int, help='Archive messages older than this many days')
+@click.option('--queue-days', default=None, type=int, help='Archive finished queue items older than this many days')
+@click.option('--format', 'file_format', default=None, type=click.Choice(['jsonl', 'parquet']),
+              help='Archive file format')
+@click.option('--dry-run', is_flag=True, help='Only count the rows that would be archived')
+@with_appcontext
+def archive_history(message_days, queue_days, file_format, dry_run):
+    """Move old message history to compressed archive files."""
+    from app.services.archive import ArchiveWriter, MessageArchiver
+    
+    try:
+        with app.app_context():
+            writer = ArchiveWriter(file_format=file_format)
+            counts = MessageArchiver(writer).run(message_days=message_days, queue_days=queue_days,
+                                                 dry_run=dry_run)
+            
+            click.echo("\nRows to archive:" if dry_run else "\nArchived rows:")
+            click.echo("-" * 40)
+            for table, count in counts.items():
+                click.echo(f"{table}: {count}")
+            if not dry_run:
+                click.echo(f"Archive directory: {writer.directory}")
+    except Exception as e:
+        click.echo(f"Error archiving message history: {str(e)}")
+
 # Message management commands
 @cli.group()
 def messages():
@@ -344,6 +374,7 @@ def messages():
     
     Available commands:
       - list: Display messages with filtering options by status and platform
+      - scheduler: Run the dispatcher for scheduled WhatsApp messages
     """
     pass
 
@@ -382,5 +413,22 @@ def list_messages(status, platform, limit):
     except Exception as e:
         click.echo(f"Error listing messages: {str(e)}")
 
+@messages.command('scheduler')
+@click.option('--window', default=None, type=float, help='Seconds ahead to load scheduled messages')
+@click.option('--refill-interval', default=None, type=float, help='Seconds between database checks')
+@with_appcontext
+def run_scheduler(window, refill_interval):
+    """Run the dispatcher for scheduled WhatsApp messages."""
+    from app.services.scheduler import MessageScheduler
+    
+    with app.app_context():
+        scheduler = MessageScheduler(window_seconds=window, refill_interval=refill_interval)
+        click.echo("Scheduler running. Press Ctrl+C to stop.")
+        try:
+            scheduler.run()
+        except KeyboardInterrupt:
+            scheduler.stop()
+            click.echo("Scheduler stopped.")
+
 if __name__ == '__main__':
     cli()
\ No newline at end of file